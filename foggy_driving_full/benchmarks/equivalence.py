@@ -0,0 +1,240 @@
+"""Numerical equivalence checks for the simulation kernels.
+
+Run from foggy_driving_full/:
+
+    python -m benchmarks.equivalence [--seeds 20] [--filter idm]
+
+Every rule has one reference, the canonical per-vehicle code in env/dynamics.py (see
+its module docstring), and every other implementation of it must reproduce that
+reference bit for bit, so a change of backend or of the small-traffic fast paths
+never changes a trajectory:
+
+- idm / mobil: the NumPy kernels (one world, and many worlds keyed by world * lanes
+  + lane as FoggyDrivingVecEnv and the baselines use them) and the numba kernels
+- trajectory: FoggyDriving forced onto its array paths, and the numba backend,
+  against the default numpy env, which takes the per-vehicle branches
+- state: a restored snapshot gives back the observation at that state
+
+Each case compares over randomized inputs with exact equality and reports the
+number of mismatches per path. Exit code 1 if any path fails.
+"""
+
+import argparse
+import sys
+from importlib.util import find_spec
+
+import numpy as np
+
+from env import numba_kernels
+from env.dynamics import idm_accel_sorted, idm_accelerations, mobil_accept, mobil_decisions
+from env.foggy_env import FoggyDriving
+
+#numba_kernels runs interpreted without numba, the label says which one was checked
+NUMBA = "numba" if numba_kernels.NUMBA_AVAILABLE else "numba kernels (interpreted)"
+
+
+def random_traffic(env, rng, n):
+    """n cars as (lane, dist, speed, desired_speed) columns: random lanes, overlapping and tied gaps."""
+    lane = rng.integers(0, env.num_lanes, size=n)
+    #a coarse grid makes equal distances (ties) and gaps below car_length common
+    dist = rng.integers(-10, 90, size=n) * 0.5
+    speed = rng.uniform(env.min_speed - 0.5, env.max_speed, size=n)
+    desired = rng.uniform(env.min_speed - 0.5, env.max_speed, size=n)
+    return lane, dist, speed, desired
+
+
+def traffic_samples(env, seed):
+    """Random traffic of several sizes, then the traffic of a running env after every step.
+
+    Random traffic covers ties and overlaps, the running env the configurations where
+    lane changes are actually accepted.
+    """
+    rng = np.random.default_rng(seed)
+    for n in (0, 1, 2, 5, 11, 40, 200):
+        yield random_traffic(env, rng, n)
+    env.reset(seed=seed)
+    for _ in range(100):
+        _, _, terminated, truncated, _ = env.step(int(rng.integers(0, 5)))
+        if terminated or truncated:
+            env.reset()
+        t = env.traffic
+        yield tuple(getattr(t, name)[:t.n].copy() for name in t.columns)
+
+
+def stacked(samples, num_lanes):
+    """Several worlds' traffic sorted by (world * num_lanes + lane, dist), like FoggyDrivingVecEnv does.
+
+    Returns the sorted (group, dist, speed, desired_speed) columns, the sort order and
+    the offset of every world in the concatenated slots.
+    """
+    offsets = np.cumsum([0] + [len(sample[0]) for sample in samples])
+    world = np.repeat(np.arange(len(samples)), np.diff(offsets))
+    lane, dist, speed, desired = (np.concatenate(column) for column in zip(*samples))
+    group = world * num_lanes + lane
+    order = np.lexsort((dist, group))
+    return (group[order], dist[order], speed[order], desired[order]), order, offsets
+
+
+def check_idm(seeds):
+    """IDM accelerations of every path against the per-vehicle branch of idm_accelerations."""
+    env = FoggyDriving()
+    model = env._driver_model()
+    params = numba_kernels.driver_params(model)
+    mismatches = {"numpy array": 0, "numpy worlds": 0, NUMBA: 0}
+    for seed in range(seeds):
+        samples = list(traffic_samples(env, seed))
+        references = []
+        for lane, dist, speed, desired in samples:
+            n = len(lane)
+            reference = np.array(idm_accelerations(model, lane, dist, speed, desired, small=n))
+            references.append(reference)
+            array = idm_accelerations(model, lane, dist, speed, desired, small=-1)
+            compiled = numba_kernels.idm_accelerations(params, lane, dist, speed, desired, n)
+            mismatches["numpy array"] += int(np.count_nonzero(array != reference))
+            mismatches[NUMBA] += int(np.count_nonzero(compiled != reference))
+
+        #all samples as the worlds of one batch
+        (group, dist, speed, desired), order, _ = stacked(samples, env.num_lanes)
+        batched = np.empty(order.size)
+        batched[order] = idm_accel_sorted(model, group, dist, speed, desired)
+        mismatches["numpy worlds"] += int(np.count_nonzero(batched != np.concatenate(references)))
+    return mismatches
+
+
+def check_mobil(seeds):
+    """MOBIL decisions of every path against the per-vehicle branch of mobil_decisions, both directions."""
+    env = FoggyDriving()
+    model = env._driver_model()
+    params = numba_kernels.driver_params(model)
+    num_lanes = env.num_lanes
+    mismatches = {"numpy array": 0, "numpy worlds": 0, NUMBA: 0}
+    for seed in range(seeds):
+        samples = list(traffic_samples(env, seed))
+        for delta in (-1, 1):
+            references = []
+            for lane, dist, speed, desired in samples:
+                n = len(lane)
+                cars = np.arange(n)
+                deltas = np.full(n, delta)
+                reference = mobil_decisions(model, lane, dist, speed, desired, cars, deltas, num_lanes, small=n)
+                references.append(reference)
+                array = mobil_decisions(model, lane, dist, speed, desired, cars, deltas, num_lanes, small=-1)
+                compiled = numba_kernels.mobil_accept(params, lane, dist, speed, desired, n, cars, deltas, num_lanes)
+                mismatches["numpy array"] += int(np.count_nonzero(array != reference))
+                mismatches[NUMBA] += int(np.count_nonzero(compiled != reference))
+
+            #every car of every world as a candidate of one batch
+            traffic, _, offsets = stacked(samples, num_lanes)
+            lane = np.concatenate([sample[0] for sample in samples])
+            world = np.repeat(np.arange(len(samples)), np.diff(offsets))
+            cand = [np.concatenate([sample[k] for sample in samples]) for k in (1, 2, 3)]
+            batched = mobil_accept(
+                model, *traffic, world * num_lanes + lane, lane, *cand, np.full(lane.size, delta), num_lanes,
+            )
+            mismatches["numpy worlds"] += int(np.count_nonzero(batched != np.concatenate(references)))
+    return mismatches
+
+
+def check_trajectories(seeds, steps=400):
+    """Full env trajectories against the default numpy env from the same seed and actions.
+
+    Compared after every step, across auto-resets, for both rng modes and both lidar
+    modes: obs, reward, terminated, truncated, ego, fog and the full traffic state.
+    The numba backend is only compared when numba is installed (FoggyDriving would
+    fall back to numpy otherwise).
+    """
+    paths = {"numpy array": {"backend": "numpy"}}
+    if find_spec("numba") is not None:
+        paths["numba"] = {"backend": "numba"}
+    mismatches = dict.fromkeys(paths, 0)
+
+    def same(a, b, result_a, result_b):
+        (obs_a, reward_a, term_a, trunc_a, _), (obs_b, reward_b, term_b, trunc_b, _) = result_a, result_b
+        ta, tb = a.traffic, b.traffic
+        return (
+            np.array_equal(obs_a, obs_b) and reward_a == reward_b and term_a == term_b and trunc_a == trunc_b
+            and a.fog == b.fog and a.ego_lane == b.ego_lane and a.ego_speed == b.ego_speed and ta.n == tb.n
+            and all(np.array_equal(getattr(ta, name)[:ta.n], getattr(tb, name)[:tb.n]) for name in ta.columns)
+        )
+
+    for kwargs in ({}, {"rng_mode": "legacy"}, {"lidar_mode": "legacy"}):
+        reference = FoggyDriving(backend="numpy", **kwargs)
+        envs = {path: FoggyDriving(**backend, **kwargs) for path, backend in paths.items()}
+        #every step of the numpy array path goes through the array kernels
+        envs["numpy array"].scalar_max_cars = -1
+        for seed in range(seeds):
+            actions = np.random.default_rng(seed).integers(0, 5, size=steps).tolist()
+            first = reference.reset(seed=seed)[0]
+            for path, env in envs.items():
+                mismatches[path] += int(not np.array_equal(env.reset(seed=seed)[0], first))
+            for action in actions:
+                expected = reference.step(action)
+                for path, env in envs.items():
+                    mismatches[path] += int(not same(reference, env, expected, env.step(action)))
+                if expected[2] or expected[3]:
+                    #same seed stream: the next episode continues from each env's own generator
+                    reference.reset()
+                    for env in envs.values():
+                        env.reset()
+    return mismatches
+
+
+def check_state_roundtrip(seeds, steps=200):
+    """set_state(get_state()) on a fresh env: returned obs equals the live one, next step matches.
+
+    Snapshots are taken every 10 steps, in lidar and grid mode (with and without a frame stack).
+    """
+    modes = {"lidar": {}, "grid": {"obs_mode": "grid"}, "grid, 4 frames": {"obs_mode": "grid", "frame_stack": 4}}
+    mismatches = dict.fromkeys(modes, 0)
+    for mode, kwargs in modes.items():
+        env, other = FoggyDriving(**kwargs), FoggyDriving(**kwargs)
+        for seed in range(seeds):
+            actions = np.random.default_rng(seed).integers(0, 5, size=steps).tolist()
+            obs, _ = env.reset(seed=seed)
+            other.reset(seed=seed + 1)
+            for k, action in enumerate(actions):
+                if k % 10 == 0:
+                    restored = other.set_state(env.get_state().tobytes())
+                    step_a, step_b = env.step(action), other.step(action)
+                    mismatches[mode] += int(not np.array_equal(restored, obs))
+                    mismatches[mode] += int(not np.array_equal(step_a[0], step_b[0]) or step_a[1:4] != step_b[1:4])
+                    obs, _, terminated, truncated, _ = step_a
+                else:
+                    obs, _, terminated, truncated, _ = env.step(action)
+                if terminated or truncated:
+                    obs, _ = env.reset()
+    return mismatches
+
+
+#(name, check): check(seeds) returns {path: number of mismatching values}
+CASES = [
+    ("idm", check_idm),
+    ("mobil", check_mobil),
+    ("trajectory", check_trajectories),
+    ("state", check_state_roundtrip),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FoggyDriving kernel equivalence checks")
+    parser.add_argument("--seeds", type=int, default=20, help="Random seeds per case (default: 20)")
+    parser.add_argument("--filter", type=str, default=None, help="Only run cases whose name contains this")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for name, check in CASES:
+        if args.filter and args.filter not in name:
+            continue
+        for path, mismatches in check(args.seeds).items():
+            failures += mismatches > 0
+            print(f"{name + ': ' + path:<48} {'OK' if mismatches == 0 else f'{mismatches} mismatches'}")
+
+    if failures:
+        print(f"\n{failures} path(s) failed")
+        return 1
+    print("\nAll kernels match.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Import-time regression check.
+
+Run from foggy_driving_full/:
+
+    python -m benchmarks.import_time [--repeats 3] [--scale 1.0]
+
+Each case runs in a fresh interpreter and is checked for two things: wall time
+against its budget (best of --repeats, budgets multiplied by --scale for slower
+machines) and that heavy modules it must not need were never imported. Exit code 1
+if any case fails.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+#modules the light entry points must not pull in
+HEAVY = ("matplotlib", "imageio", "torch", "stable_baselines3", "numba")
+
+#(name, code, budget in seconds, modules that must stay unloaded)
+CASES = [
+    ("baseline: python + numpy", "import numpy", 0.5, HEAVY),
+    ("import env.foggy_env", "import env.foggy_env", 1.0, HEAVY),
+    ("FoggyDriving() + reset + step", (
+        "from env.foggy_env import FoggyDriving\n"
+        "env = FoggyDriving()\n"
+        "env.reset(seed=0)\n"
+        "env.step(0)"
+    ), 1.2, HEAVY),
+    ("rgb_array_fast render", (
+        "from env.foggy_env import FoggyDriving\n"
+        "env = FoggyDriving(render_mode='rgb_array_fast')\n"
+        "env.reset(seed=0)\n"
+        "env.render()"
+    ), 1.2, HEAVY),
+    ("main.py --mode describe", (
+        "import sys\n"
+        "sys.argv = ['main.py', '--mode', 'describe']\n"
+        "from utils.cli import main\n"
+        "main()"
+    ), 0.5, HEAVY + ("gymnasium", "env.foggy_env")),
+]
+
+
+def run_case(code, forbidden):
+    """(seconds, forbidden modules that got imported) for `code` in a fresh interpreter."""
+    probe = (
+        "import sys, time\n"
+        "t0 = time.perf_counter()\n"
+        f"exec(compile({code!r}, '<case>', 'exec'))\n"
+        "elapsed = time.perf_counter() - t0\n"
+        f"loaded = [m for m in {tuple(forbidden)!r} if m in sys.modules]\n"
+        "print('@@', elapsed, ','.join(loaded), file=sys.stderr)\n"
+    )
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    line = [l for l in proc.stderr.splitlines() if l.startswith("@@")][-1].split(" ")
+    loaded = [m for m in line[2].split(",") if m] if len(line) > 2 else []
+    #interpreter start-up included, that is what a user or a worker process pays
+    return wall, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FoggyDriving import-time budgets")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case, best is kept (default: 3)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for all budgets (default: 1.0)")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    print(f"{'case':<32} {'seconds':>8} {'budget':>8}")
+    for name, code, budget, forbidden in CASES:
+        best = None
+        loaded = []
+        for _ in range(args.repeats):
+            seconds, loaded = run_case(code, forbidden)
+            best = seconds if best is None else min(best, seconds)
+        budget *= args.scale
+        problems = []
+        if best > budget:
+            problems.append("OVER BUDGET")
+        if loaded:
+            problems.append("imported " + ", ".join(loaded))
+        failures += bool(problems)
+        print(f"{name:<32} {best:>8.3f} {budget:>8.3f}  {'  '.join(problems)}")
+
+    if failures:
+        print(f"\n{failures} case(s) failed")
+        return 1
+    print("\nAll import budgets met.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
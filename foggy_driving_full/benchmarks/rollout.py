@@ -0,0 +1,285 @@
+"""Rollout throughput benchmarks.
+
+Run from foggy_driving_full/:
+
+    python -m benchmarks.rollout                      #full suite, compare with baseline.json
+    python -m benchmarks.rollout --quick --filter vec  #short run of the vec env cases
+    python -m benchmarks.rollout --save-baseline      #store the results as the new baseline
+
+Each case reports steps/sec (or resets/sec). Results are written to JSON together with
+machine info. Cases more than --threshold slower than the stored baseline are flagged
+as regressions and the exit code is 1. The baseline's "reference" entry holds numbers
+measured on an older tree with the same harness; it is kept when the baseline is
+re-saved and printed next to the comparison.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from env.foggy_env import FoggyDriving
+from env.vec_env import FoggyDrivingVecEnv
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def machine_info():
+    info = {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+    try:
+        import numba
+        info["numba"] = numba.__version__
+    except ImportError:
+        info["numba"] = None
+    return info
+
+
+def _timed(fn, duration, repeats):
+    #best of `repeats` runs of at least `duration` seconds, in calls per second
+    fn(10)
+    best = 0.0
+    for _ in range(repeats):
+        calls = 0
+        batch = 10
+        start = time.perf_counter()
+        while True:
+            fn(batch)
+            calls += batch
+            elapsed = time.perf_counter() - start
+            if elapsed >= duration:
+                break
+            batch = min(batch * 2, 10_000)
+        best = max(best, calls / elapsed)
+    return best
+
+
+def make_single_env(lidars=9, density=None, fog=None, backend="numpy", lidar_mode="exact", rng_mode="generator",
+                    obs_mode="lidar", frame_stack=1):
+    env = FoggyDriving(
+        lidars=lidars, backend=backend, lidar_mode=lidar_mode, rng_mode=rng_mode,
+        obs_mode=obs_mode, frame_stack=frame_stack,
+    )
+    if density is not None:
+        env.spawn_prob_per_lane = density
+    if fog is not None:
+        #pin the visibility of every fog level to the given level
+        env.max_range_by_fog = {level: env.max_range_by_fog[fog] for level in env.fog_levels}
+    return env
+
+
+def bench_single_step(duration, repeats, **env_kwargs):
+    env = make_single_env(**env_kwargs)
+    env.reset(seed=0)
+    actions = np.random.RandomState(0).randint(0, 5, size=4096).tolist()
+    k = [0]
+
+    def run(n):
+        for _ in range(n):
+            _, _, terminated, truncated, _ = env.step(actions[k[0] & 4095])
+            k[0] += 1
+            if terminated or truncated:
+                env.reset()
+
+    return _timed(run, duration, repeats)
+
+
+def bench_single_reset(duration, repeats, **env_kwargs):
+    env = make_single_env(**env_kwargs)
+    env.reset(seed=0)
+
+    def run(n):
+        for _ in range(n):
+            env.reset()
+
+    return _timed(run, duration, repeats)
+
+
+def bench_state_roundtrip(duration, repeats, **env_kwargs):
+    env = make_single_env(**env_kwargs)
+    env.reset(seed=0)
+    for _ in range(20):
+        env.step(0)
+    state = env.get_state()
+
+    def run(n):
+        for _ in range(n):
+            env.get_state(state)
+            env.set_state(state)
+
+    return _timed(run, duration, repeats)
+
+
+def bench_vec_step(duration, repeats, num_envs=256, **env_kwargs):
+    env = FoggyDrivingVecEnv(num_envs=num_envs, seed=0, **env_kwargs)
+    env.reset()
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, 5, size=(64, num_envs))
+    k = [0]
+
+    def run(n):
+        for _ in range(n):
+            env.step(actions[k[0] & 63])
+            k[0] += 1
+
+    #calls/sec times num_envs = env-steps/sec
+    return _timed(run, duration, repeats) * num_envs
+
+
+def bench_vec_baseline(duration, repeats, num_envs=256, baseline="mobil", observe="state"):
+    from training.baselines import baselines
+
+    env = FoggyDrivingVecEnv(num_envs=num_envs, seed=0)
+    policy = baselines[baseline](env, observe=observe)
+    obs = [env.reset()]
+
+    def run(n):
+        for _ in range(n):
+            actions, _ = policy.predict(obs[0])
+            obs[0] = env.step(actions)[0]
+
+    #policy + simulator, calls/sec times num_envs = env-steps/sec
+    return _timed(run, duration, repeats) * num_envs
+
+
+def bench_vec_render(duration, repeats, num_envs=64, **env_kwargs):
+    env = FoggyDrivingVecEnv(num_envs=num_envs, seed=0, render_mode="rgb_array_fast", **env_kwargs)
+    env.reset()
+    env.step(np.full(num_envs, 2))
+
+    def run(n):
+        for _ in range(n):
+            env.get_images()
+
+    #calls/sec times num_envs = frames/sec
+    return _timed(run, duration, repeats) * num_envs
+
+
+def cases():
+    """(name, benchmark, kwargs): one axis varied at a time around the default env."""
+    out = [
+        ("single/step/base", bench_single_step, {}),
+        ("single/reset/base", bench_single_reset, {}),
+        ("single/step/lidar_mode=legacy", bench_single_step, {"lidar_mode": "legacy"}),
+        ("single/step/rng_mode=legacy", bench_single_step, {"rng_mode": "legacy"}),
+    ]
+    try:
+        import numba  # noqa: F401
+        out.append(("single/step/backend=numba", bench_single_step, {"backend": "numba"}))
+    except ImportError:
+        pass
+    out.append(("single/step/obs_mode=grid", bench_single_step, {"obs_mode": "grid"}))
+    out.append(("single/step/obs_mode=grid,stack=4", bench_single_step, {"obs_mode": "grid", "frame_stack": 4}))
+    out.append(("single/state/get+set", bench_state_roundtrip, {}))
+    for lidars in (32, 128):
+        out.append((f"single/step/lidars={lidars}", bench_single_step, {"lidars": lidars}))
+    for density in (0.05, 0.4):
+        out.append((f"single/step/density={density}", bench_single_step, {"density": density}))
+    for fog in (0, 1, 2):
+        out.append((f"single/step/fog={fog}", bench_single_step, {"fog": fog}))
+    for num_envs in (1, 4, 16, 64, 256):
+        out.append((f"vec/step/num_envs={num_envs}", bench_vec_step, {"num_envs": num_envs}))
+    for observe in ("state", "lidar"):
+        out.append((f"vec/baseline=mobil,{observe}/num_envs=256", bench_vec_baseline, {"observe": observe}))
+    out.append(("vec/render_fast/num_envs=64", bench_vec_render, {"num_envs": 64}))
+    return out
+
+
+def compare(results, baseline, threshold):
+    """{name: (current, baseline, ratio, regressed)} for the cases present in both runs."""
+    report = {}
+    for name, value in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = value / base
+        report[name] = (value, base, ratio, ratio < 1.0 - threshold)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FoggyDriving rollout throughput benchmarks")
+    parser.add_argument("--duration", type=float, default=1.0, help="Seconds per timed run (default: 1.0)")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per case, best is kept (default: 3)")
+    parser.add_argument("--quick", action="store_true", help="Shortcut for --duration 0.2 --repeats 1")
+    parser.add_argument("--filter", type=str, default=None, help="Only run cases whose name contains this")
+    parser.add_argument("--out", type=str, default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--baseline", type=str, default=BASELINE_PATH, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown flagged as a regression (default: 0.15)")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results to --baseline")
+    args = parser.parse_args(argv)
+
+    duration, repeats = (0.2, 1) if args.quick else (args.duration, args.repeats)
+
+    results = {}
+    for name, bench, kwargs in cases():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = bench(duration, repeats, **kwargs)
+        unit = "resets/s" if "/reset/" in name else "frames/s" if "/render_fast/" in name else "steps/s"
+        print(f"{name:<36} {results[name]:>12.1f} {unit}")
+
+    payload = {
+        "machine": machine_info(),
+        "config": {"duration": duration, "repeats": repeats},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"\nResults : {args.out}")
+
+    if args.save_baseline:
+        if os.path.isfile(args.baseline):
+            with open(args.baseline) as f:
+                reference = json.load(f).get("reference")
+            if reference is not None:
+                payload["reference"] = reference
+        with open(args.baseline, "w") as f:
+            json.dump(payload, f, indent=2)
+        print(f"Baseline : {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print("No baseline found, skipping comparison.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("machine", {}).get("processor") != payload["machine"]["processor"]:
+        print("Warning: baseline was recorded on a different machine.")
+
+    report = compare(results, baseline, args.threshold)
+    regressions = [name for name, row in report.items() if row[3]]
+    print(f"\n{'case':<36} {'current':>12} {'baseline':>12} {'ratio':>7}")
+    for name, (value, base, ratio, regressed) in report.items():
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<36} {value:>12.1f} {base:>12.1f} {ratio:>7.2f}{flag}")
+
+    reference = baseline.get("reference")
+    shown = [name for name in reference.get("results", {}) if name in results] if reference else []
+    if shown:
+        print(f"\nReference: {reference.get('description', '')}")
+        for name in shown:
+            value, base = results[name], reference["results"][name]
+            print(f"{name:<36} {value:>12.1f} {base:>12.1f} {value / base:>7.2f}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
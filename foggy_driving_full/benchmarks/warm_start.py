@@ -0,0 +1,141 @@
+"""Time-to-threshold benchmark for DQN with and without a replay-buffer warm start.
+
+Run from foggy_driving_full/:
+
+    python -m benchmarks.warm_start [--threshold 200] [--max-timesteps 200000] [--seeds 0 1 2]
+
+A dataset of --dataset-steps transitions is generated once (random actions,
+--policy PATH for a saved SB3 model, or --policy idm / mobil / fog_aware for a
+rule-based driver). Then, for every seed, DQN with the trainer's default
+hyperparameters is trained cold and warm-started from the dataset.
+Every --eval-freq timesteps the policy is evaluated with evaluate_batched; a run
+stops as soon as the mean return reaches --threshold. Reported: timesteps and
+training seconds (evaluation time excluded) to the threshold.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from stable_baselines3 import DQN
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.env_util import make_vec_env
+
+from env.foggy_env import FoggyDriving
+from training.baselines import baselines
+from training.evaluation import evaluate_batched
+from training.offline_data import generate_dataset, warm_start_replay_buffer
+from training.trainer import FoggyDrivingTrainer
+
+
+class ThresholdCallback(BaseCallback):
+    """Evaluates every eval_freq timesteps, stops training once the mean return reaches threshold."""
+
+    def __init__(self, threshold, eval_freq, episodes, seed):
+        super().__init__()
+        self.threshold = threshold
+        self.eval_freq = eval_freq
+        self.episodes = episodes
+        self.seed = seed
+        self.eval_seconds = 0.0
+        self.reached = None
+        self.curve = []
+        self._next = eval_freq
+
+    def _on_step(self):
+        if self.num_timesteps < self._next:
+            return True
+        self._next += self.eval_freq
+        start = time.perf_counter()
+        result = evaluate_batched(self.model, episodes=self.episodes, n_envs=self.episodes, seed=self.seed)
+        self.eval_seconds += time.perf_counter() - start
+        mean = result["stats"]["return"]["mean"]
+        self.curve.append((self.num_timesteps, mean))
+        if mean >= self.threshold:
+            self.reached = self.num_timesteps
+            return False
+        return True
+
+
+def run(seed, args, dataset=None):
+    env = make_vec_env(FoggyDriving, n_envs=args.n_envs, seed=seed)
+    params = dict(FoggyDrivingTrainer.default_hyperparams["DQN"])
+    if dataset is not None:
+        params["learning_starts"] = 0
+    model = DQN("MlpPolicy", env, seed=seed, verbose=0, **params)
+    if dataset is not None:
+        warm_start_replay_buffer(model, dataset)
+
+    callback = ThresholdCallback(args.threshold, args.eval_freq, args.eval_episodes, seed)
+    start = time.perf_counter()
+    model.learn(total_timesteps=args.max_timesteps, callback=callback)
+    seconds = time.perf_counter() - start - callback.eval_seconds
+    env.close()
+    return {"timesteps": callback.reached, "seconds": seconds if callback.reached else None, "curve": callback.curve}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DQN time-to-threshold with / without replay warm start")
+    parser.add_argument("--threshold", type=float, default=200.0, help="Mean evaluation return to reach (default: 200)")
+    parser.add_argument("--max-timesteps", type=int, default=200_000, help="Training budget per run (default: 200000)")
+    parser.add_argument("--eval-freq", type=int, default=5_000, help="Timesteps between evaluations (default: 5000)")
+    parser.add_argument("--eval-episodes", type=int, default=32, help="Episodes per evaluation (default: 32)")
+    parser.add_argument("--n-envs", type=int, default=8, help="Training envs (default: 8)")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2], help="Training seeds (default: 0 1 2)")
+    parser.add_argument("--dataset-steps", type=int, default=100_000, help="Warm start transitions (default: 100000)")
+    parser.add_argument("--policy", type=str, default=None,
+                        help="Saved DQN / PPO / A2C model, or idm / mobil / fog_aware, generating the dataset")
+    parser.add_argument("--output", type=str, default="warm_start_results.json", help="Results JSON")
+    args = parser.parse_args(argv)
+
+    policy = None
+    if args.policy in baselines:
+        policy = baselines[args.policy](observe="state")
+    elif args.policy is not None:
+        for algorithm in FoggyDrivingTrainer.algorithms.values():
+            try:
+                policy = algorithm.load(args.policy)
+                break
+            except Exception:
+                continue
+        if policy is None:
+            parser.error(f"could not load {args.policy} as a PPO, A2C or DQN model")
+
+    with tempfile.TemporaryDirectory() as dataset:
+        meta = generate_dataset(policy, dataset, steps=args.dataset_steps, seed=12345, epsilon=0.1 if policy else 0.0)
+        print(f"Dataset : {meta['transitions']} transitions in {meta['seconds']:.1f}s "
+              f"(mean return {meta['mean_return']:.1f})\n")
+
+        results = {"config": vars(args), "dataset": meta, "runs": []}
+        print(f"{'run':<6} {'seed':>4} {'timesteps':>10} {'seconds':>8}")
+        for seed in args.seeds:
+            for label, path in (("cold", None), ("warm", dataset)):
+                result = run(seed, args, path)
+                results["runs"].append({"run": label, "seed": seed, **result})
+                steps = result["timesteps"] if result["timesteps"] is not None else "-"
+                seconds = f"{result['seconds']:.1f}" if result["seconds"] is not None else "-"
+                print(f"{label:<6} {seed:>4} {steps:>10} {seconds:>8}")
+
+    print()
+    for label in ("cold", "warm"):
+        runs = [r for r in results["runs"] if r["run"] == label]
+        reached = [r for r in runs if r["timesteps"] is not None]
+        if reached:
+            print(f"{label}: {len(reached)}/{len(runs)} reached {args.threshold:g}, "
+                  f"median {np.median([r['timesteps'] for r in reached]):.0f} timesteps / "
+                  f"{np.median([r['seconds'] for r in reached]):.1f}s")
+        else:
+            print(f"{label}: 0/{len(runs)} reached {args.threshold:g} within {args.max_timesteps} timesteps")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults : {os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
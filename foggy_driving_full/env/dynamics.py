@@ -0,0 +1,269 @@
+"""IDM car following and MOBIL lane changes for the simulator, the batched env and the baselines.
+
+The canonical statement of the rules is the per-vehicle Python code: idm_scalar and
+the small-traffic branches of idm_accelerations / mobil_decisions, which evaluate one
+vehicle at a time in Python floats exactly like the original per-car simulator. Every
+other implementation is an optimization of it and must reproduce it bit for bit:
+
+- idm_follow / idm_accel_sorted / mobil_accept: NumPy kernels over many vehicles, for
+  large traffic and for many worlds at once (group = world * num_lanes + lane)
+- env/numba_kernels.py: compiled per-vehicle loops for backend="numba"
+
+The IDM formula itself is written once, in idm_accel, for the scalar and array paths.
+benchmarks/equivalence.py checks every path against the canonical one.
+"""
+
+import math
+import operator
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple
+
+import numpy as np
+
+#traffic up to this many vehicles takes the per-vehicle branch of idm_accelerations /
+#mobil_decisions, below it the per-call overhead of the array kernels costs more than it saves
+SMALL_TRAFFIC = 16
+
+
+class DriverModel(NamedTuple):
+    #IDM / MOBIL parameters shared by all batched kernels
+    car_length: float
+    min_speed: float
+    idm_a: float
+    idm_b: float
+    idm_T: float
+    idm_s0: float
+    idm_delta: float
+    mobil_safe_brake: float
+    mobil_threshold: float
+
+
+def idm_accel(v, v0, s, dv, a, b, T, s0, delta, power=np.float_power):
+    """IDM acceleration, elementwise over arrays or for Python floats.
+
+    v / v0 are the (already clamped) current and desired speeds, s the bumper gap to
+    the leader and dv the closing speed. Arrays use np.float_power, floats pass
+    power=operator.pow; both go through libm pow, np.power's SIMD path can differ by
+    an ulp.
+    """
+    s_star = s0 + v * T + (v * dv) / (2.0 * math.sqrt(a * b))
+    return a * (1.0 - power(v / v0, delta) - power(s_star / s, 2))
+
+
+def idm_follow(model, dist, speed, desired_speed, lead_dist, lead_speed, has_lead):
+    """IDM acceleration of vehicles behind (optional) leaders, all arrays elementwise."""
+    v = np.maximum(model.min_speed, speed)
+    v0 = np.maximum(model.min_speed + 1e-3, desired_speed)
+
+    gap = np.maximum(0.1, lead_dist - dist - model.car_length)
+    s = np.where(has_lead, gap, 1e6)
+    dv = np.where(has_lead, v - lead_speed, 0.0)
+
+    return idm_accel(v, v0, s, dv, model.idm_a, model.idm_b, model.idm_T,
+                     model.idm_s0, model.idm_delta)
+
+
+def idm_scalar(model, dist, speed, desired_speed, lead_dist, lead_speed, has_lead):
+    """IDM acceleration of one vehicle in Python floats, the canonical car-following rule.
+
+    Speeds are clamped to >= min_speed, the gap to the leader's rear to >= 0.1; without
+    a leader the gap is 1e6 and there is no closing speed.
+    """
+    #one unpack instead of seven namedtuple lookups, this runs per vehicle and step
+    car_length, min_speed, a, b, T, s0, delta = model[:7]
+    v = max(min_speed, speed)
+    v0 = max(min_speed + 1e-3, desired_speed)
+    if has_lead:
+        s = max(0.1, lead_dist - dist - car_length)
+        dv = v - lead_speed
+    else:
+        s = 1e6
+        dv = 0.0
+    return idm_accel(v, v0, s, dv, a, b, T, s0, delta, operator.pow)
+
+
+def _lane_order(lane, dist):
+    #slot indices sorted by (lane, dist), stable like np.lexsort((dist, lane))
+    return sorted(range(len(lane)), key=lambda i: (lane[i], dist[i]))
+
+
+def idm_accel_sorted(model, group, dist, speed, desired_speed):
+    """IDM acceleration of every vehicle at once.
+
+    Inputs are sorted by (group, dist), where group is the lane (or env * num_lanes +
+    lane for batched worlds). Each vehicle follows the next one in its group.
+    """
+    n = group.shape[0]
+    has_lead = np.zeros(n, dtype=bool)
+    has_lead[:-1] = group[1:] == group[:-1]
+    lead = np.minimum(np.arange(1, n + 1), max(n - 1, 0))
+    return idm_follow(model, dist, speed, desired_speed, dist[lead], speed[lead], has_lead)
+
+
+def idm_accelerations(model, lane, dist, speed, desired_speed, small=SMALL_TRAFFIC):
+    """IDM acceleration per slot of one world's traffic, each car following the next car in its lane.
+
+    Columns are in slot order; so is the result. Up to `small` vehicles the canonical
+    per-vehicle rule is evaluated directly and a list is returned, above it the array
+    kernel and an array.
+    """
+    n = len(lane)
+    if n <= small:
+        lane, dist, speed, desired_speed = lane.tolist(), dist.tolist(), speed.tolist(), desired_speed.tolist()
+        order = _lane_order(lane, dist)
+        accel = [0.0] * n
+        for k, i in enumerate(order):
+            j = order[k + 1] if k + 1 < n else -1
+            if j >= 0 and lane[j] == lane[i]:
+                accel[i] = idm_scalar(model, dist[i], speed[i], desired_speed[i], dist[j], speed[j], True)
+            else:
+                accel[i] = idm_scalar(model, dist[i], speed[i], desired_speed[i], 0.0, 0.0, False)
+        return accel
+
+    order = np.lexsort((dist, lane))
+    accelerations = np.empty(n)
+    accelerations[order] = idm_accel_sorted(model, lane[order], dist[order], speed[order], desired_speed[order])
+    return accelerations
+
+
+def grouped_search(group, dist, q_group, q_dist, side):
+    """Vectorized searchsorted inside groups of arrays sorted by (group, dist).
+
+    side="right": index of the first vehicle in q_group with dist > q_dist (a leader).
+    side="left":  index of the last vehicle in q_group with dist < q_dist (a follower).
+    Returns -1 where no such vehicle exists. Exact: distances are replaced by their
+    dense rank among all elements and queries, so (group, rank) folds into one integer
+    key without any float rounding.
+    """
+    n = group.shape[0]
+    m = q_group.shape[0]
+    if n == 0 or m == 0:
+        return np.full(m, -1, dtype=np.int64)
+
+    _, rank = np.unique(np.concatenate((dist, q_dist)), return_inverse=True)
+    n_ranks = int(rank.max()) + 1
+    keys = group * n_ranks + rank[:n]
+    q_keys = q_group * n_ranks + rank[n:]
+
+    idx = np.searchsorted(keys, q_keys, side=side)
+    if side == "left":
+        idx -= 1
+    safe = np.minimum(np.maximum(idx, 0), n - 1)
+    found = (idx >= 0) & (idx < n) & (group[safe] == q_group)
+    return np.where(found, idx, -1)
+
+
+def mobil_accept(model, group, dist, speed, desired_speed,
+                 cand_group, cand_lane, cand_dist, cand_speed, cand_desired,
+                 delta_lane, num_lanes):
+    """MOBIL incentive and safety criterion for many lane-change candidates at once.
+
+    (group, dist, speed, desired_speed) is the traffic sorted by (group, dist); the
+    candidates are described by their own columns so vehicles outside the traffic
+    store (the ego car) can be evaluated too. Returns a bool per candidate, matching
+    the per-vehicle rule of mobil_decisions exactly.
+    """
+    target_lane = cand_lane + delta_lane
+    valid = (target_lane >= 0) & (target_lane < num_lanes)
+    target_group = cand_group + delta_lane
+
+    n = group.shape[0]
+    m = cand_group.shape[0]
+    leaders = grouped_search(
+        group, dist,
+        np.concatenate((cand_group, target_group)),
+        np.concatenate((cand_dist, cand_dist)) + 1e-6,
+        "right",
+    )
+    current_leader = leaders[:m]
+    target_leader = leaders[m:]
+    follower = grouped_search(group, dist, target_group, cand_dist - 1e-6, "left")
+
+    def column(col, idx):
+        if n == 0:
+            return np.zeros(idx.shape)
+        return col[np.maximum(idx, 0)]
+
+    a_current = idm_follow(model, cand_dist, cand_speed, cand_desired,
+                           column(dist, current_leader), column(speed, current_leader),
+                           current_leader >= 0)
+    a_target = idm_follow(model, cand_dist, cand_speed, cand_desired,
+                          column(dist, target_leader), column(speed, target_leader),
+                          target_leader >= 0)
+
+    #follower in the target lane: does the candidate cut in ahead of it?
+    has_follower = follower >= 0
+    f_dist = column(dist, follower)
+    old_leader = grouped_search(group, dist, target_group, f_dist + 1e-6, "right")
+    old_dist = column(dist, old_leader)
+    cut_in = (cand_dist > f_dist) & ((old_leader < 0) | (cand_dist < old_dist))
+
+    new_lead_dist = np.where(cut_in, cand_dist, old_dist)
+    new_lead_speed = np.where(cut_in, cand_speed, column(speed, old_leader))
+    a_follower_new = idm_follow(model, f_dist, column(speed, follower),
+                                column(desired_speed, follower),
+                                new_lead_dist, new_lead_speed, cut_in | (old_leader >= 0))
+    unsafe = has_follower & (a_follower_new < -model.mobil_safe_brake)
+
+    return valid & ~unsafe & ~((a_target - a_current) < model.mobil_threshold)
+
+
+def mobil_decisions(model, lane, dist, speed, desired_speed, cars, delta_lane, num_lanes, small=SMALL_TRAFFIC):
+    """MOBIL for cars (slot indices) of one world's traffic trying delta_lane (-1/+1, array or scalar).
+
+    Columns are in slot order; returns a bool array per candidate. Up to `small`
+    vehicles this is the canonical per-vehicle rule: leaders and followers are found
+    by bisecting each lane's sorted distances (ties resolve like grouped_search).
+    Above it the candidates go to mobil_accept as one batch.
+    """
+    n = len(lane)
+    if n > small:
+        order = np.lexsort((dist, lane))
+        cand_lane = lane[cars]
+        return mobil_accept(
+            model, lane[order], dist[order], speed[order], desired_speed[order],
+            cand_lane, cand_lane, dist[cars], speed[cars], desired_speed[cars], delta_lane, num_lanes,
+        )
+
+    lane, dist, speed, desired_speed = lane.tolist(), dist.tolist(), speed.tolist(), desired_speed.tolist()
+    cars = cars.tolist()
+    delta_lane = delta_lane.tolist() if np.ndim(delta_lane) else [int(delta_lane)] * len(cars)
+    slots = [[] for _ in range(num_lanes)]
+    for i in _lane_order(lane, dist):
+        slots[lane[i]].append(i)
+    dists = [[dist[i] for i in lane_slots] for lane_slots in slots]
+
+    def leader(g, q):
+        #first vehicle in lane g with dist > q, -1 if none
+        k = bisect_right(dists[g], q)
+        return slots[g][k] if k < len(slots[g]) else -1
+
+    def follow(i, lead):
+        if lead < 0:
+            return idm_scalar(model, dist[i], speed[i], desired_speed[i], 0.0, 0.0, False)
+        return idm_scalar(model, dist[i], speed[i], desired_speed[i], dist[lead], speed[lead], True)
+
+    accept = np.zeros(len(cars), dtype=bool)
+    for c, (car, delta) in enumerate(zip(cars, delta_lane)):
+        target = lane[car] + delta
+        if target < 0 or target >= num_lanes:
+            continue
+        d = dist[car]
+        a_current = follow(car, leader(lane[car], d + 1e-6))
+        a_target = follow(car, leader(target, d + 1e-6))
+
+        #follower in the target lane: does the candidate cut in ahead of it?
+        k = bisect_left(dists[target], d - 1e-6) - 1
+        if k >= 0:
+            fol = slots[target][k]
+            f_dist = dist[fol]
+            old = leader(target, f_dist + 1e-6)
+            if d > f_dist and (old < 0 or d < dist[old]):
+                a_follower_new = idm_scalar(model, f_dist, speed[fol], desired_speed[fol], d, speed[car], True)
+            else:
+                a_follower_new = follow(fol, old)
+            if a_follower_new < -model.mobil_safe_brake:
+                continue
+
+        accept[c] = not (a_target - a_current) < model.mobil_threshold
+    return accept
@@ -0,0 +1,295 @@
+"""Columnar on-disk episode logs.
+
+A log directory holds
+
+    meta.json            chunk size, column dtypes and the env kwargs needed to re-render
+    index.npy            one row per finished episode: start row, length, return, collision, seed
+    chunk_00000/*.npy    one .npy file per column, chunk_steps rows each (the last chunk may be shorter)
+
+Row t of an episode holds the observation the action was chosen from, the action,
+reward, terminated / truncated / collision flags and a compact snapshot of the env
+after the step (what a rendered frame shows). Every file is a plain .npy, so
+columns are memory-mapped on read and an episode is sliced out without loading
+the rest of the log.
+"""
+
+import json
+import os
+import queue
+import threading
+
+import gymnasium as gym
+import numpy as np
+
+from .foggy_env import FoggyDriving
+from .recording import apply_snapshot, render_kwargs
+
+INDEX_DTYPE = np.dtype([
+    ("start", np.int64), ("length", np.int64), ("return", np.float64), ("collision", bool), ("seed", np.int64),
+])
+
+
+def snapshot_dtype(capacity, lidars):
+    """Per-step env snapshot: ego state plus up to `capacity` cars, narrow dtypes."""
+    return np.dtype([
+        ("ego_lane", np.int8), ("ego_speed", np.float32), ("fog", np.int8), ("step_count", np.int32),
+        ("distance", np.float32), ("n_cars", np.int16),
+        ("lane", np.int8, (capacity,)), ("dist", np.float32, (capacity,)), ("speed", np.float32, (capacity,)),
+        ("lidar", np.float32, (lidars,)),
+    ])
+
+
+def default_reward(columns):
+    """FoggyDriving's reward recomputed from logged columns."""
+    reward = columns["snapshot"]["ego_speed"].astype(np.float64)
+    reward -= 50.0 * columns["collision"]
+    reward += 100.0 * (columns["truncated"] & ~columns["terminated"])
+    return reward
+
+
+def _chunk_dir(directory, chunk):
+    return os.path.join(directory, f"chunk_{chunk:05d}")
+
+
+def _save_atomic(path, array):
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+class EpisodeRecorder(gym.Wrapper):
+    """Wrapper that appends every step of a FoggyDriving env to an episode log in `directory`.
+
+    Steps are buffered in preallocated arrays of chunk_steps rows; a full chunk is
+    handed to a background thread that writes its columns and the updated index,
+    so step() never waits on the disk unless `max_pending` chunks are queued.
+    The last partial chunk is written by close(). Only finished episodes are indexed.
+    """
+
+    def __init__(self, env, directory, chunk_steps=4096, capacity=32, max_pending=2):
+        super().__init__(env)
+        base = env.unwrapped
+        if not isinstance(base, FoggyDriving):
+            raise TypeError("EpisodeRecorder wraps FoggyDriving envs")
+        self.directory = directory
+        self.chunk_steps = int(chunk_steps)
+        self.capacity = int(capacity)
+
+        space = env.observation_space
+        self.columns = {
+            "obs": (space.dtype, space.shape),
+            "action": (np.dtype(np.int8), ()),
+            "reward": (np.dtype(np.float32), ()),
+            "terminated": (np.dtype(bool), ()),
+            "truncated": (np.dtype(bool), ()),
+            "collision": (np.dtype(bool), ()),
+            "snapshot": (snapshot_dtype(self.capacity, base.lidars), ()),
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        meta = {
+            "chunk_steps": self.chunk_steps,
+            "capacity": self.capacity,
+            "columns": {name: [np.lib.format.dtype_to_descr(d), list(shape)] for name, (d, shape) in self.columns.items()},
+            "env_kwargs": render_kwargs(base),
+        }
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+        self._buffer = self._new_buffer()
+        self._rows = 0  #rows written to disk or handed to the writer
+        self._fill = 0  #rows in the current buffer
+        self._chunk = 0
+        self._episodes = []
+        self._episode_start = None
+        self._episode_return = 0.0
+        self._episode_seed = -1
+        self._obs = None
+
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _new_buffer(self):
+        return {name: np.zeros((self.chunk_steps,) + shape, dtype=d) for name, (d, shape) in self.columns.items()}
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        #an episode cut short by reset() keeps its rows but is not indexed
+        seed = kwargs.get("seed")
+        self._episode_start = self._rows + self._fill
+        self._episode_return = 0.0
+        self._episode_seed = -1 if seed is None else int(seed)
+        self._obs = np.array(obs, copy=True)
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        row = self._fill
+        buffer = self._buffer
+        buffer["obs"][row] = self._obs
+        buffer["action"][row] = action
+        buffer["reward"][row] = reward
+        buffer["terminated"][row] = terminated
+        buffer["truncated"][row] = truncated
+        buffer["collision"][row] = info.get("collision", False)
+        self._snapshot(buffer["snapshot"][row:row + 1])
+        self._obs[...] = obs
+        self._episode_return += reward
+        self._fill += 1
+
+        if terminated or truncated:
+            start = self._episode_start
+            self._episodes.append((start, self._rows + self._fill - start, self._episode_return,
+                                   bool(terminated), self._episode_seed))
+        if self._fill == self.chunk_steps:
+            self._flush()
+        return obs, reward, terminated, truncated, info
+
+    def _snapshot(self, out):
+        env = self.env.unwrapped
+        t = env.traffic
+        n = t.n
+        if n > self.capacity:
+            raise ValueError(f"{n} cars exceed the recorder capacity={self.capacity}")
+        out["ego_lane"] = env.ego_lane
+        out["ego_speed"] = env.ego_speed
+        out["fog"] = env.fog
+        out["step_count"] = env.step_count
+        out["distance"] = env.distance
+        out["n_cars"] = n
+        out["lane"][0, :n] = t.lane[:n]
+        out["dist"][0, :n] = t.dist[:n]
+        out["speed"][0, :n] = t.speed[:n]
+        out["lidar"] = env.last_lidar
+
+    def _flush(self):
+        if self._error is not None:
+            raise RuntimeError("Episode log writer failed") from self._error
+        if self._fill == 0:
+            return
+        end = self._rows + self._fill
+        columns = {name: column[:self._fill] for name, column in self._buffer.items()}
+        index = np.array([e for e in self._episodes if e[0] + e[1] <= end], dtype=INDEX_DTYPE)
+        #blocks only when the writer is max_pending chunks behind
+        self._queue.put((self._chunk, columns, index))
+        self._chunk += 1
+        self._rows = end
+        self._fill = 0
+        self._buffer = self._new_buffer()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            chunk, columns, index = item
+            try:
+                path = _chunk_dir(self.directory, chunk)
+                os.makedirs(path, exist_ok=True)
+                for name, column in columns.items():
+                    _save_atomic(os.path.join(path, f"{name}.npy"), column)
+                #index last, readers never see an episode whose rows are not on disk yet
+                _save_atomic(os.path.join(self.directory, "index.npy"), index)
+            except Exception as exc:
+                self._error = exc
+
+    def close(self):
+        if self._writer.is_alive():
+            self._flush()
+            self._queue.put(None)
+            self._writer.join()
+            if self._error is not None:
+                raise RuntimeError("Episode log writer failed") from self._error
+        super().close()
+
+
+class EpisodeLog:
+    """Reader for an EpisodeRecorder directory; columns are memory-mapped, chunk by chunk."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.chunk_steps = self.meta["chunk_steps"]
+        self._maps = {}
+        self._env = None
+        self.refresh()
+
+    def refresh(self):
+        """Re-reads the index, picks up episodes flushed since (the log may still be written)."""
+        path = os.path.join(self.directory, "index.npy")
+        self.index = np.load(path) if os.path.exists(path) else np.zeros(0, dtype=INDEX_DTYPE)
+        #the last chunk may have been partial before and grown into a full one since
+        self._maps.clear()
+
+    def __len__(self):
+        return len(self.index)
+
+    def _column(self, chunk, name):
+        key = (chunk, name)
+        if key not in self._maps:
+            self._maps[key] = np.load(os.path.join(_chunk_dir(self.directory, chunk), f"{name}.npy"), mmap_mode="r")
+        return self._maps[key]
+
+    def rows(self, name, start, stop):
+        """Rows [start, stop) of a column; a view of the memory map unless they span chunks."""
+        parts = []
+        while start < stop:
+            chunk, offset = divmod(start, self.chunk_steps)
+            take = min(stop - start, self.chunk_steps - offset)
+            parts.append(self._column(chunk, name)[offset:offset + take])
+            start += take
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=self._column(0, name).dtype)
+
+    def episode(self, i, columns=None):
+        """Dict of the columns (default: all) of episode i."""
+        start, length = int(self.index["start"][i]), int(self.index["length"][i])
+        return {name: self.rows(name, start, start + length) for name in (columns or self.meta["columns"])}
+
+    def rescore(self, i, reward_fn=None):
+        """Per-step rewards of episode i under reward_fn(columns) (default: the env reward)."""
+        columns = self.episode(i, ("snapshot", "collision", "terminated", "truncated", "action", "reward"))
+        return (reward_fn or default_reward)(columns)
+
+    def frames(self, i, mode="rgb_array_fast"):
+        """Yields the rendered frames of episode i, one per step."""
+        if self._env is None:
+            kwargs = dict(self.meta["env_kwargs"])
+            #JSON turned the fog levels into strings
+            kwargs["max_range_by_fog"] = {int(k): v for k, v in kwargs["max_range_by_fog"].items()}
+            kwargs["render_size"] = tuple(kwargs["render_size"])
+            self._env = FoggyDriving(**kwargs)
+        for snap in self.episode(i, ("snapshot",))["snapshot"]:
+            n = int(snap["n_cars"])
+            apply_snapshot(self._env, (
+                int(snap["ego_lane"]), float(snap["ego_speed"]), int(snap["fog"]), int(snap["step_count"]),
+                float(snap["distance"]), snap["lane"][:n].astype(np.int64), snap["dist"][:n].astype(np.float64),
+                snap["lidar"],
+            ))
+            yield self._env.renderer.render(mode)
+
+    def save(self, i, path, fps=8, mode="rgb_array"):
+        """Writes episode i to a GIF / MP4 file, returns the number of frames."""
+        from .recording import _append, open_writer
+
+        writer = open_writer(path, fps)
+        count = 0
+        try:
+            for frame in self.frames(i, mode):
+                _append(writer, frame)
+                count += 1
+        finally:
+            writer.close()
+        return count
+
+    def close(self):
+        self._maps.clear()
+        if self._env is not None:
+            self._env.close()
+            self._env = None
@@ -1,11 +1,32 @@
 
 import math
+import os
+import warnings
+from importlib.util import find_spec
 
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 from typing import Dict, List, Optional
-from .renderer import FoggyDrivingRender
+from .renderer import FoggyDrivingRender, car_alphas
+from .raster import occupancy_grid
+from .lidar import LidarCaster
+from .traffic import TrafficState
+from .dynamics import SMALL_TRAFFIC, DriverModel, idm_accelerations, idm_scalar, mobil_decisions
+from .profiling import StepProfiler, _no_lap
+
+_U64 = (1 << 64) - 1
+
+#compiled kernels, imported on first use of the numba backend since numba is slow to import
+numba_kernels = None
+
+
+def _load_numba_kernels():
+    global numba_kernels
+    if numba_kernels is None:
+        from . import numba_kernels as kernels
+        numba_kernels = kernels
+    return numba_kernels
 
 class FoggyDriving(gym.Env):
 
@@ -17,14 +38,44 @@ class FoggyDriving(gym.Env):
           self.desired_speed = float(desired_speed if desired_speed is not None else speed)
 
 
-    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 10}
+    metadata = {"render_modes": ["human", "rgb_array", "rgb_array_fast"], "render_fps": 10}
+
+    lidar_modes = ("exact", "legacy")
+
+    #"numpy" = vectorized kernels, "numba" = compiled kernels from numba_kernels
+    backends = ("numpy", "numba")
+
+    #"generator" = numpy Generator with one block of draws per step,
+    #"legacy" = RandomState with the original scalar draws, replays old seeds exactly
+    rng_modes = ("generator", "legacy")
+
+    #"lidar" = lane / speed / fog / lidar vector, "grid" = stacked uint8 occupancy grids
+    obs_modes = ("lidar", "grid")
+
+    #numpy backend: traffic up to this many cars takes the per-vehicle Python branches
+    #(IDM, MOBIL, integration, collision), larger traffic the array kernels
+    scalar_max_cars = SMALL_TRAFFIC
 
     def __init__(self,render_mode=None,min_speed=1,max_speed=5,max_fog_levels=2,max_range_by_fog=None,lidars=9,max_steps=400,
+        lidar_mode="exact", backend=None, profile=False, rng_mode="generator", render_size=(480, 240),
+        obs_mode="lidar", grid_cells=40, frame_stack=1, state_capacity=64,
     ):
         super().__init__()
 
+        #simulation backend, FOGGY_DRIVING_BACKEND picks the default
+        if backend is None:
+            backend = os.environ.get("FOGGY_DRIVING_BACKEND", "numpy")
+        if backend not in self.backends:
+            raise ValueError(f"Invalid backend '{backend}', expected one of {self.backends}")
+        if backend == "numba" and find_spec("numba") is None:
+            warnings.warn("numba is not installed, falling back to the numpy backend")
+            backend = "numpy"
+        if backend == "numba":
+            _load_numba_kernels()
+        self.backend = backend
+
         self.render_mode = render_mode
-        self.renderer = FoggyDrivingRender(self)
+        self.renderer = FoggyDrivingRender(self, fast_size=render_size)
 
         self.grid_width = 2
         self.grid_height = 40
@@ -62,21 +113,58 @@ class FoggyDriving(gym.Env):
             self.max_range_by_fog = max_range_by_fog
 
         #lidar
+        #"exact" = analytic ray/box intersection, "legacy" = old 0.5-step quantized readings
+        if lidar_mode not in self.lidar_modes:
+            raise ValueError(f"Invalid lidar_mode '{lidar_mode}', expected one of {self.lidar_modes}")
+        self.lidar_mode = lidar_mode
         self.lidars = lidars
         self.beam_angles = np.linspace(-math.pi / 4, math.pi / 4, self.lidars)
+        self.lidar_caster = LidarCaster(self.beam_angles, self.grid_width, 1.0, self.car_length)
 
         self.max_steps = max_steps
 
         #action space: 0 = maintain, 1 = accelerate, 2 = decellarate, 3 = lane left, 4 = lane right
         self.action_space = spaces.Discrete(5)
 
-        #observation: 2 lane one-hot + speed + fog + lidar readings
-        self.observation_space = spaces.Box(
-            low=0.0, high=1.0, shape=(4 + self.lidars,), dtype=np.float32
-        )
-
-
-        self.rng = np.random.RandomState()
+        if obs_mode not in self.obs_modes:
+            raise ValueError(f"Invalid obs_mode '{obs_mode}', expected one of {self.obs_modes}")
+        if obs_mode == "lidar" and frame_stack != 1:
+            raise ValueError("frame_stack is only supported with obs_mode='grid'")
+        self.obs_mode = obs_mode
+        self.frame_stack = int(frame_stack)
+
+        if obs_mode == "lidar":
+            #observation: 2 lane one-hot + speed + fog + lidar readings
+            self.observation_space = spaces.Box(
+                low=0.0, high=1.0, shape=(4 + self.lidars,), dtype=np.float32
+            )
+        else:
+            #observation: frame_stack x (traffic, ego) uint8 grids of grid_cells x lanes,
+            #oldest frame first
+            self.grid_cells = int(grid_cells)
+            self.observation_space = spaces.Box(
+                low=0, high=255, shape=(2 * self.frame_stack, self.grid_cells, self.num_lanes), dtype=np.uint8
+            )
+            #ring of 2 * frame_stack frames: each frame is written at head and head + frame_stack,
+            #so the last frame_stack frames are always one contiguous slice and nothing is shifted
+            self._frames = np.zeros((2 * self.frame_stack, 2, self.grid_cells, self.num_lanes), dtype=np.uint8)
+            self._head = 0
+
+        #observation buffer written in place by _get_obs, reset/step return a copy
+        #unless a caller-owned buffer was bound with bind_obs_buffer()
+        self._obs = np.zeros(self.observation_space.shape, dtype=self.observation_space.dtype)
+        self._copy_obs = True
+        #raw lidar reading behind the last observation, reused by the renderer
+        self.last_lidar = np.zeros(self.lidars, dtype=np.float32)
+
+        if rng_mode not in self.rng_modes:
+            raise ValueError(f"Invalid rng_mode '{rng_mode}', expected one of {self.rng_modes}")
+        self.rng_mode = rng_mode
+        self.rng = np.random.RandomState() if rng_mode == "legacy" else np.random.default_rng()
+
+        #fixed layout of the get_state() / set_state() records, traffic padded to state_capacity
+        self.state_capacity = int(state_capacity)
+        self.state_dtype = self._state_dtype()
 
         #spawn parameters
         self.spawn_prob_per_lane = 0.2
@@ -86,23 +174,73 @@ class FoggyDriving(gym.Env):
         self.distance = 0.0
         self.ego_lane = 1
         self.step_count = 0
-        self.cars: List[FoggyDriving.Car] = []
+        self.traffic = TrafficState()
+
+        #opt-in per-phase timing of step(), a no-op lap when disabled
+        self.profiler = StepProfiler() if profile else None
+        self._lap = self.profiler.lap if profile else _no_lap
 
         self.reset()
 
+    @property
+    def cars(self):
+        #read-only snapshot of the traffic store, kept for backward compatibility
+        t = self.traffic
+        n = t.n
+        return tuple(
+            self.Car(lane, dist, speed, desired)
+            for lane, dist, speed, desired in zip(
+                t.lane[:n].tolist(), t.dist[:n].tolist(),
+                t.speed[:n].tolist(), t.desired_speed[:n].tolist(),
+            )
+        )
+
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
-        if seed is not None:
-            self.rng.seed(seed)
-
         self.step_count = 0
-        self.ego_lane = int(self.rng.randint(0, self.num_lanes))
         self.ego_speed = float((self.min_speed + self.max_speed) / 2.0)
-        self.fog = int(self.rng.choice(self.fog_levels))
         self.distance = 0.0
+        self.traffic.clear()
 
-        self.cars = []
+        if self.rng_mode == "legacy":
+            if seed is not None:
+                self.rng.seed(seed)
+            self._reset_legacy()
+        else:
+            if seed is not None:
+                self.rng = self.np_random
+            self._reset_generator()
+
+        if self.obs_mode == "grid":
+            self._frames[:] = 0
+        obs = self._get_obs()
+        return (obs.copy() if self._copy_obs else obs), {}
+
+    def _reset_generator(self):
+        rng = self.rng
+        lo, hi = self.min_speed, self.max_speed
+        self.ego_lane = int(rng.integers(0, self.num_lanes))
+        self.fog = int(rng.choice(self.fog_levels))
+
+        #initial traffic
+        n_cars = int(rng.integers(5, 10))
+        speed = rng.uniform(lo, hi - 1, size=n_cars)
+        self.traffic.extend(
+            rng.integers(0, self.num_lanes, size=n_cars),
+            rng.uniform(4.0, self.grid_height, size=n_cars),
+            speed,
+            rng.uniform(np.maximum(speed, lo + 1), hi),
+        )
+
+        #slow cars just ahead of the ego car
+        self.traffic.extend(
+            np.full(3, self.ego_lane), rng.uniform(2.0, 4.0, size=3), np.full(3, lo), rng.uniform(lo + 0.5, hi - 1, size=3),
+        )
+
+    def _reset_legacy(self):
+        self.ego_lane = int(self.rng.randint(0, self.num_lanes))
+        self.fog = int(self.rng.choice(self.fog_levels))
 
         #initial traffic
         n_cars = int(self.rng.randint(5, 10))
@@ -111,20 +249,19 @@ class FoggyDriving(gym.Env):
             dist = float(self.rng.uniform(4.0, self.grid_height))
             speed = float(self.rng.uniform(self.min_speed, self.max_speed - 1))
             desired = float(self.rng.uniform(max(speed, self.min_speed + 1), self.max_speed))
-            self.cars.append(self.Car(lane, dist, speed, desired))
+            self.traffic.add(lane, dist, speed, desired)
 
 
         for _ in range(3):
             dist = float(self.rng.uniform(2.0, 4.0))
             speed = float(self.min_speed)
             desired = float(self.rng.uniform(self.min_speed + 0.5, self.max_speed - 1))
-            self.cars.append(self.Car(self.ego_lane, dist, speed, desired))
-
-        obs = self._get_obs().astype(np.float32)
-        return obs, {}
+            self.traffic.add(self.ego_lane, dist, speed, desired)
 
     def step(self, action: int):
         assert self.action_space.contains(action)
+        if self.profiler is not None:
+            self.profiler.start()
         self.step_count += 1
 
         self.distance+= self.ego_speed
@@ -140,21 +277,22 @@ class FoggyDriving(gym.Env):
             self.ego_lane = max(0, self.ego_lane - 1)
         elif action == 4: #lane right
             self.ego_lane = min(self.num_lanes - 1, self.ego_lane + 1)
+        self._lap("ego")
 
-        self._update_cars()
+        draws = self._draw_step_block() if self.rng_mode == "generator" else None
+        self._update_cars(draws)
 
         #fog level
-        if self.rng.rand() < 0.2:
-            self.fog = int(self.rng.choice(self.fog_levels))
+        if self.rng_mode == "legacy":
+            if self.rng.rand() < 0.2:
+                self.fog = int(self.rng.choice(self.fog_levels))
+        elif draws["fog"] < 0.2:
+            self.fog = self.fog_levels[int(draws["fog_level"] * len(self.fog_levels))]
+        self._lap("fog")
 
         #Collision check
-        collision = False
-        for c in self.cars:
-            if c.lane != self.ego_lane:
-                continue
-            if 0.0 < c.dist < self.car_length:
-                collision = True
-                break
+        collision = self._collision()
+        self._lap("collision")
 
         terminated = collision
         truncated = self.step_count >= self.max_steps
@@ -165,221 +303,441 @@ class FoggyDriving(gym.Env):
         if truncated and not terminated:
             reward += 100.0
 
-        obs = self._get_obs().astype(np.float32)
+        obs = self._get_obs()
+        if self._copy_obs:
+            obs = obs.copy()
         info = {"collision": collision}
+        if self.profiler is not None:
+            self.profiler.stop()
+            info["profile"] = self.profiler.last
         return obs, reward, terminated, truncated, info
 
+    def get_profile(self):
+        """Accumulated per-phase wall time (s) and calls, None unless built with profile=True."""
+        if self.profiler is None:
+            return None
+        return self.profiler.summary()
+
+    def reset_profile(self):
+        if self.profiler is not None:
+            self.profiler.clear()
+
     def render(self):
         return self.renderer.render(self.render_mode)
 
+    def close(self):
+        self.renderer.close()
+
+    def _state_dtype(self):
+        c = self.state_capacity
+        space = self.observation_space
+        fields = [
+            ("ego_lane", np.int64), ("ego_speed", np.float64), ("fog", np.int64),
+            ("step_count", np.int64), ("distance", np.float64), ("n_cars", np.int64),
+            ("lane", np.int64, (c,)), ("dist", np.float64, (c,)),
+            ("speed", np.float64, (c,)), ("desired_speed", np.float64, (c,)),
+            ("last_lidar", np.float32, (self.lidars,)),
+            ("obs", space.dtype, space.shape),
+        ]
+        if self.rng_mode == "legacy":
+            #MT19937 key and position plus the cached gaussian of RandomState
+            fields += [("mt_key", np.uint32, (624,)), ("mt_pos", np.int64), ("has_gauss", np.int64), ("gauss", np.float64)]
+        else:
+            #PCG64 128-bit state and increment as (high, low) words
+            fields += [("pcg_state", np.uint64, (2,)), ("pcg_inc", np.uint64, (2,)),
+                       ("has_uint32", np.int64), ("uinteger", np.uint32)]
+        if self.obs_mode == "grid":
+            fields += [("frames", np.uint8, self._frames.shape), ("head", np.int64)]
+        return np.dtype(fields)
+
+    def get_state(self, out=None):
+        """Full simulator state as a 0-d record of self.state_dtype (written into `out` if given).
+
+        Covers ego, traffic, fog, counters, the last observation and the RNG state, so
+        set_state() resumes bit-for-bit. record.tobytes() gives a compact blob.
+        """
+        state = np.zeros((), dtype=self.state_dtype) if out is None else out
+        t = self.traffic
+        n = t.n
+        if n > self.state_capacity:
+            raise ValueError(f"{n} cars exceed state_capacity={self.state_capacity}")
+
+        state["ego_lane"] = self.ego_lane
+        state["ego_speed"] = self.ego_speed
+        state["fog"] = self.fog
+        state["step_count"] = self.step_count
+        state["distance"] = self.distance
+        state["n_cars"] = n
+        for name in t.columns:
+            column = state[name]
+            column[:n] = getattr(t, name)[:n]
+            column[n:] = 0
+        state["last_lidar"] = self.last_lidar
+        #in grid mode without a bound buffer the observation lives only in the frame ring
+        state["obs"] = self._grid_window() if self.obs_mode == "grid" else self._obs
+
+        if self.rng_mode == "legacy":
+            _, key, pos, has_gauss, gauss = self.rng.get_state()
+            state["mt_key"] = key
+            state["mt_pos"] = pos
+            state["has_gauss"] = has_gauss
+            state["gauss"] = gauss
+        else:
+            rng_state = self._pcg64().state
+            word = rng_state["state"]
+            state["pcg_state"] = (word["state"] >> 64, word["state"] & _U64)
+            state["pcg_inc"] = (word["inc"] >> 64, word["inc"] & _U64)
+            state["has_uint32"] = rng_state["has_uint32"]
+            state["uinteger"] = rng_state["uinteger"]
+
+        if self.obs_mode == "grid":
+            state["frames"] = self._frames
+            state["head"] = self._head
+        return state
+
+    def set_state(self, state):
+        """Restores a get_state() record (or its bytes), returns the observation at that state."""
+        if isinstance(state, (bytes, bytearray, memoryview)):
+            state = np.frombuffer(state, dtype=self.state_dtype).reshape(())
+        if state.dtype != self.state_dtype:
+            raise ValueError("State record does not match this env's state_dtype")
+
+        t = self.traffic
+        n = int(state["n_cars"])
+        t.clear()
+        if n > t.capacity:
+            t._grow(n)
+        for name in t.columns:
+            getattr(t, name)[:n] = state[name][:n]
+        t.active[:n] = True
+        t.n = n
+
+        self.ego_lane = int(state["ego_lane"])
+        self.ego_speed = float(state["ego_speed"])
+        self.fog = int(state["fog"])
+        self.step_count = int(state["step_count"])
+        self.distance = float(state["distance"])
+        self.last_lidar[:] = state["last_lidar"]
+        self._obs[...] = state["obs"]
+
+        if self.rng_mode == "legacy":
+            self.rng.set_state(
+                ("MT19937", state["mt_key"], int(state["mt_pos"]), int(state["has_gauss"]), float(state["gauss"]))
+            )
+        else:
+            hi, lo = (int(v) for v in state["pcg_state"])
+            inc_hi, inc_lo = (int(v) for v in state["pcg_inc"])
+            self._pcg64().state = {
+                "bit_generator": "PCG64",
+                "state": {"state": hi << 64 | lo, "inc": inc_hi << 64 | inc_lo},
+                "has_uint32": int(state["has_uint32"]),
+                "uinteger": int(state["uinteger"]),
+            }
 
-    def _spawn_car(self, lane, dmin, dmax):
-
-        dist = float(self.rng.uniform(dmin, dmax))
-        desired_speed = float(self.rng.uniform(self.min_speed + 1, self.max_speed))
-        speed = float(np.clip(desired_speed * float(self.rng.uniform(0.6, 0.9)), self.min_speed, self.max_speed))
-        return self.Car(lane, dist, speed, desired_speed)
+        if self.obs_mode == "grid":
+            self._frames[...] = state["frames"]
+            self._head = int(state["head"])
+            self._obs[...] = self._grid_window()
+        return self._obs.copy() if self._copy_obs else self._obs
+
+    def _pcg64(self):
+        bit_generator = self.rng.bit_generator
+        if not isinstance(bit_generator, np.random.PCG64):
+            raise TypeError(f"get_state/set_state need a PCG64 generator, got {type(bit_generator).__name__}")
+        return bit_generator
+
+    def bind_obs_buffer(self, out):
+        """Write observations straight into `out` (e.g. one row of a batch array).
+
+        reset() and step() then return `out` itself instead of a copy, so the caller
+        must consume or copy it before the next call.
+        """
+        space = self.observation_space
+        if out.shape != space.shape or out.dtype != space.dtype:
+            raise ValueError(
+                f"Observation buffer must be {space.dtype} with shape {space.shape}, got {out.dtype} {out.shape}"
+            )
+        out[:] = self._obs
+        self._obs = out
+        self._copy_obs = False
+
+
+    def _draw_step_block(self):
+        """All uniforms one step consumes, drawn in a single Generator call.
+
+        Sized from the current traffic so nothing is left over between steps:
+        lane-change trial and direction per car, spawn trial and 3 spawn parameters
+        per lane, fog change and fog level.
+        """
+        n = self.traffic.n
+        k = self.num_lanes
+        u = self.rng.random(2 * n + 4 * k + 2)
+        return {
+            "lane_change": u[:n],
+            "direction": u[n:2 * n],
+            "spawn": u[2 * n:2 * n + k],
+            "spawn_params": u[2 * n + k:2 * n + 4 * k].reshape(k, 3),
+            "fog": u[-2],
+            "fog_level": u[-1],
+        }
+
+    def _spawn_car(self, lane, dmin, dmax, u=None):
+        #u = three block uniforms (dist, desired speed, speed factor), None draws them from a RandomState
+        if u is None:
+            dist = float(self.rng.uniform(dmin, dmax))
+            desired_speed = float(self.rng.uniform(self.min_speed + 1, self.max_speed))
+            factor = float(self.rng.uniform(0.6, 0.9))
+        else:
+            dist = dmin + (dmax - dmin) * float(u[0])
+            desired_speed = self.min_speed + 1 + (self.max_speed - self.min_speed - 1) * float(u[1])
+            factor = 0.6 + 0.3 * float(u[2])
+        speed = float(np.clip(desired_speed * factor, self.min_speed, self.max_speed))
+        return self.traffic.add(lane, dist, speed, desired_speed)
 
     def _idm_accel(self, car, lead):
-
-        v = max(self.min_speed, car.speed)
-        v0 = max(self.min_speed + 1e-3, car.desired_speed)
-
+        #car / lead are slot indices into self.traffic, lead=None when there is no leader
+        t = self.traffic
         if lead is None:
-            s = 1e6
-            dv = 0.0
-        else:
-            #gap = distance between rear of leader and front of this car
-            s = lead.dist - car.dist - self.car_length
-            s = max(0.1, s)
-            dv = v - lead.speed
-
-        s_star = self.idm_s0 + v * self.idm_T + (v * dv) / (2.0 * math.sqrt(self.idm_a * self.idm_b))
-        accel = self.idm_a * (1.0 - (v / v0) ** self.idm_delta - (s_star / s) ** 2)
-        return float(accel)
-
-    def _find_leader(self, car, cars_in_lane):
-
-        leader = None
-        for other in cars_in_lane:
-            if other.dist > car.dist + 1e-6:
-                leader = other
-                break
-        return leader
-
-    def _mobil_decision(self, car, delta_lane, cars_by_lane):
-
-        target_lane = car.lane + delta_lane
-        if target_lane < 0 or target_lane >= self.num_lanes:
-            return False
-
-        #current leader in own lane
-        current_leader = self._find_leader(car, cars_by_lane.get(car.lane, []))
-        a_current = self._idm_accel(car, current_leader)
-
-        #in target lane, find leader and follower
-        target_cars = cars_by_lane.get(target_lane, [])
-
-        target_leader = None
-        target_follower = None
-        for other in target_cars:
-            if other.dist > car.dist + 1e-6:
-                target_leader = other
-                break
-        for other in reversed(target_cars):
-            if other.dist < car.dist - 1e-6:
-                target_follower = other
-                break
-
-
-        if target_follower is not None:
-
-            old_leader_for_follower = self._find_leader(target_follower, target_cars)
-
-            if (car.dist > target_follower.dist and
-               (old_leader_for_follower is None or car.dist < old_leader_for_follower.dist)):
-                new_leader_for_follower = car
-            else:
-                new_leader_for_follower = old_leader_for_follower
-
-            a_follower_new = self._idm_accel(target_follower, new_leader_for_follower)
-            if a_follower_new < -self.mobil_safe_brake:
-                return False
-
-
-        a_target = self._idm_accel(car, target_leader)
-        if (a_target - a_current) < self.mobil_threshold:
-            return False
-
-        return True
-
-    def _update_cars(self):
+            return idm_scalar(self._driver_model(), float(t.dist[car]), float(t.speed[car]),
+                              float(t.desired_speed[car]), 0.0, 0.0, False)
+        return idm_scalar(self._driver_model(), float(t.dist[car]), float(t.speed[car]), float(t.desired_speed[car]),
+                          float(t.dist[lead]), float(t.speed[lead]), True)
+
+    def _driver_model(self):
+        return DriverModel(
+            self.car_length, self.min_speed,
+            self.idm_a, self.idm_b, self.idm_T, self.idm_s0, self.idm_delta,
+            self.mobil_safe_brake, self.mobil_threshold,
+        )
 
-        cars_by_lane = {lane: [] for lane in range(self.num_lanes)}
-        for c in self.cars:
-            cars_by_lane[c.lane].append(c)
-        for lane in cars_by_lane:
-            cars_by_lane[lane].sort(key=lambda c: c.dist)
+    def _idm_accelerations(self):
+        #IDM for every car following the next car in its lane, a list for small traffic
+        t = self.traffic
+        n = t.n
+        return idm_accelerations(
+            self._driver_model(), t.lane[:n], t.dist[:n], t.speed[:n], t.desired_speed[:n],
+            small=self.scalar_max_cars,
+        )
 
+    def _mobil_decision(self, cars, delta_lane):
+        #batched MOBIL: cars are slot indices, delta_lane a matching array (or scalar) of -1/+1
+        t = self.traffic
+        if self.backend == "numba":
+            return numba_kernels.mobil_accept(
+                numba_kernels.driver_params(self._driver_model()), t.lane, t.dist, t.speed, t.desired_speed, t.n,
+                cars, np.broadcast_to(delta_lane, cars.shape).astype(np.int64), self.num_lanes,
+            )
+        n = t.n
+        return mobil_decisions(
+            self._driver_model(), t.lane[:n], t.dist[:n], t.speed[:n], t.desired_speed[:n],
+            cars, delta_lane, self.num_lanes, small=self.scalar_max_cars,
+        )
 
-        #lane change
-        desired_lane= {c: c.lane for c in self.cars}
-        for car in self.cars:
-            if car.dist<3:
-              continue
+    def _draw_lane_change_trials(self, draws=None):
+        #which cars consider a lane change this step, and which direction they try first;
+        #generator mode reads them from the step block (drawn here when not given)
+        t = self.traffic
+        if self.rng_mode == "generator":
+            if draws is None:
+                draws = self._draw_step_block()
+            cars = np.flatnonzero((t.dist[:t.n] >= 3) & (draws["lane_change"] < self.lane_change_prob))
+            return cars, np.where(draws["direction"][cars] < 0.5, -1, 1)
+
+        cars = []
+        first_delta = []
+        for car in np.flatnonzero(t.dist[:t.n] >= 3).tolist():
             if self.rng.rand() < self.lane_change_prob:
                 deltas = [-1, +1]
                 self.rng.shuffle(deltas)
-                for d in deltas:
-                    if self._mobil_decision(car, d, cars_by_lane):
-                        desired_lane[car] = car.lane + d
-                        break
-
-
-        for car, ln in desired_lane.items():
-            car.lane = ln
-
-
-        cars_by_lane = {lane: [] for lane in range(self.num_lanes)}
-        for c in self.cars:
-            cars_by_lane[c.lane].append(c)
-        for lane in cars_by_lane:
-            cars_by_lane[lane].sort(key=lambda c: c.dist)
-
-        #accelerations
-        accelerations = {}
-        for lane, cars in cars_by_lane.items():
-            for idx, car in enumerate(cars):
-                lead = cars[idx + 1] if idx + 1 < len(cars) else None
-                accelerations[car] = self._idm_accel(car, lead)
-
-
+                cars.append(car)
+                first_delta.append(deltas[0])
+        return np.array(cars, dtype=np.int64), np.array(first_delta, dtype=np.int64)
+
+    def _update_cars(self, draws=None):
+        #draws: the step block of generator mode, drawn here when not given; unused in legacy mode
+        t = self.traffic
+        if self.rng_mode == "generator" and draws is None:
+            draws = self._draw_step_block()
+
+        #lane change, every candidate sees the same pre-change snapshot
+        cars, first_delta = self._draw_lane_change_trials(draws)
+        if cars.size:
+            accept = self._mobil_decision(
+                np.concatenate((cars, cars)), np.concatenate((first_delta, -first_delta))
+            )
+            accept_first, accept_second = accept[:cars.size], accept[cars.size:]
+            t.lane[cars] += np.where(accept_first, first_delta, np.where(accept_second, -first_delta, 0))
+        self._lap("lane_change")
 
         upper_limit = self.grid_height + self.despawn_margin
         lower_limit = -self.despawn_margin
 
-        new_cars = []
-        for car in self.cars:
-            a = accelerations.get(car, 0.0)
-            car.speed = float(np.clip(car.speed + a, self.min_speed, self.max_speed))
-            rel_speed = self.ego_speed - car.speed
-            car.dist -= rel_speed
+        if self.backend == "numba":
+            #accelerations, integration and despawn fused into one compiled pass
+            t.n = numba_kernels.advance(
+                numba_kernels.driver_params(self._driver_model()), t.lane, t.dist, t.speed, t.desired_speed, t.active, t.n,
+                self.ego_speed, self.max_speed, lower_limit, upper_limit,
+            )
+        else:
+            #accelerations
+            accelerations = self._idm_accelerations()
+            self._lap("idm")
 
-            if lower_limit < car.dist < upper_limit:
-                new_cars.append(car)
-        self.cars = new_cars
+            self._integrate(accelerations, lower_limit, upper_limit)
+        self._lap("integrate")
 
         #new cars
         visible_top = min(self.grid_height, self.max_range_by_fog[self.fog])
         spawn_base = visible_top
 
-        for lane in range(self.num_lanes):
-            lane_cars = [c for c in self.cars if c.lane == lane and c.dist >= 0.0]
-            furthest = max((c.dist for c in lane_cars), default=0.0)
+        furthest_by_lane = self._furthest_ahead()
+        for lane_id in range(self.num_lanes):
+            furthest = furthest_by_lane[lane_id]
             free_gap = spawn_base - furthest
 
-            if free_gap >= self.min_spawn_gap and self.rng.rand() < self.spawn_prob_per_lane:
-                dmin = spawn_base
-                dmax = spawn_base + self.min_spawn_gap
-                new_car = self._spawn_car(lane=lane, dmin=dmin, dmax=dmax)
-                self.cars.append(new_car)
-
-
-    def _lidar(self):
+            if free_gap < self.min_spawn_gap:
+                continue
+            if self.rng_mode == "legacy":
+                if self.rng.rand() < self.spawn_prob_per_lane:
+                    self._spawn_car(lane=lane_id, dmin=spawn_base, dmax=spawn_base + self.min_spawn_gap)
+            elif draws["spawn"][lane_id] < self.spawn_prob_per_lane:
+                self._spawn_car(lane=lane_id, dmin=spawn_base, dmax=spawn_base + self.min_spawn_gap,
+                                u=draws["spawn_params"][lane_id])
+        self._lap("spawn")
+
+
+    def _integrate(self, accelerations, lower, upper):
+        #new speeds and distances, then despawn outside (lower, upper); numpy backend
+        t = self.traffic
+        n = t.n
+        if n > self.scalar_max_cars:
+            speed = t.speed[:n]
+            dist = t.dist[:n]
+            np.clip(speed + accelerations, self.min_speed, self.max_speed, out=speed)
+            dist -= self.ego_speed - speed
+            t.active[:n] = (dist > lower) & (dist < upper)
+            t.compact()
+            return
+
+        #same update in one Python pass, for a few cars it beats the array temporaries
+        ego_speed, min_speed, max_speed = self.ego_speed, self.min_speed, self.max_speed
+        speeds = []
+        dists = []
+        despawned = False
+        for dist, speed, accel in zip(t.dist[:n].tolist(), t.speed[:n].tolist(), accelerations):
+            speed = min(max(speed + accel, min_speed), max_speed)
+            dist -= ego_speed - speed
+            speeds.append(speed)
+            dists.append(dist)
+            despawned |= not lower < dist < upper
+        t.speed[:n] = speeds
+        t.dist[:n] = dists
+        if despawned:
+            t.active[:n] = [lower < dist < upper for dist in dists]
+            t.compact()
+
+    def _collision(self):
+        #a car overlapping the ego car: in its lane, 0 < dist < car_length
+        t = self.traffic
+        if self.backend == "numba":
+            return bool(numba_kernels.collision(t.lane, t.dist, t.n, self.ego_lane, self.car_length))
+        if t.n > self.scalar_max_cars:
+            lane = t.lane[:t.n]
+            dist = t.dist[:t.n]
+            return bool(np.any((lane == self.ego_lane) & (dist > 0.0) & (dist < self.car_length)))
+        ego_lane, car_length = self.ego_lane, self.car_length
+        for lane, dist in zip(t.lane[:t.n].tolist(), t.dist[:t.n].tolist()):
+            if lane == ego_lane and 0.0 < dist < car_length:
+                return True
+        return False
+
+    def _furthest_ahead(self):
+        #furthest car at dist >= 0 per lane, 0.0 for an empty lane
+        t = self.traffic
+        if t.n > self.scalar_max_cars:
+            lane = t.lane[:t.n]
+            dist = t.dist[:t.n]
+            return [float(dist[lane == lane_id].max(initial=0.0)) for lane_id in range(self.num_lanes)]
+        furthest = [0.0] * self.num_lanes
+        for lane, dist in zip(t.lane[:t.n].tolist(), t.dist[:t.n].tolist()):
+            if dist > furthest[lane]:
+                furthest[lane] = dist
+        return furthest
+
+    def _lidar(self, out=None):
         max_r = self.max_range_by_fog[self.fog]
-        dists = np.ones(self.lidars, dtype=np.float32) * max_r
 
         ego_x = self.ego_lane + 0.5
-        ego_y = 0.0
-
-        car_boxes = []
-        for c in self.cars:
-            x0 = c.lane
-            car_boxes.append((x0, x0 + 1, c.dist, c.dist + self.car_length))
-
-        for i, angle in enumerate(self.beam_angles):
-            dx = math.sin(angle)
-            dy = math.cos(angle)
-            t = 0.0
-            step = 0.5
-            hit = False
-            while t < max_r and not hit:
-                t += step
-                x = ego_x + dx * t
-                y = ego_y + dy * t
-                if x < 0 or x >= self.grid_width:
-                    break
-                if y < 0:
-                    continue
-                for (xmin, xmax, ymin, ymax) in car_boxes:
-                    if xmin <= x < xmax and ymin <= y < ymax:
-                        dists[i] = t
-                        hit = True
-                        break
 
-        noise_scale = 0.02 * (1 + 0.03 * self.fog)
-        noisy = dists * (1 + self.rng.normal(0, noise_scale, size=dists.shape))
-        return np.clip(noisy, 0, max_r).astype(np.float32)
+        t = self.traffic
+        c = self.lidar_caster
 
-    def _get_obs(self):
-        lane_onehot = np.zeros(2, dtype=np.float32)
-        lane_onehot[self.ego_lane] = 1.0
+        if self.lidar_mode == "legacy":
+            dists = c.cast_legacy(ego_x, t.lane[:t.n].astype(np.float64), t.dist[:t.n], max_r)
+        elif self.backend == "numba":
+            dists = numba_kernels.lidar_cast(
+                c.dx, c._inv_dx, c._inv_dy, c.width, c.box_w, c.box_h, ego_x, t.lane, t.dist, t.n, max_r,
+            )
+        else:
+            dists = c.cast(ego_x, t.lane[:t.n].astype(np.float64), t.dist[:t.n], max_r)
 
-        speed_norm = np.float32(
-            (self.ego_speed - self.min_speed)
-            / (self.max_speed - self.min_speed + 1e-8)
+        #dists * (1 + noise) clipped to [0, max_r], in place on the noise draw
+        noise_scale = 0.02 * (1 + 0.03 * self.fog)
+        noisy = self.rng.normal(0, noise_scale, size=dists.shape)
+        noisy += 1.0
+        noisy *= dists
+        np.maximum(noisy, 0, out=noisy)
+        np.minimum(noisy, max_r, out=noisy)
+        if out is None:
+            return noisy.astype(np.float32)
+        out[:] = noisy
+        return out
+
+    def _get_obs(self, out=None):
+        #lane one-hot, speed, fog and normalized lidar written into out (default: self._obs)
+        if self.obs_mode == "grid":
+            return self._get_grid_obs(out)
+        if out is None:
+            out = self._obs
+        out[:4] = 0.0
+        out[self.ego_lane] = 1.0
+        out[2] = (self.ego_speed - self.min_speed) / (self.max_speed - self.min_speed + 1e-8)
+        out[3] = self.fog / max(self.fog_levels)
+
+        lidar = self._lidar(out=out[4:])
+        self.last_lidar[:] = lidar
+        self._lap("lidar")
+        np.divide(lidar, self.max_range_by_fog[self.fog], out=lidar)
+        self._lap("obs")
+        return out
+
+    def _grid_window(self):
+        #view of the last frame_stack frames, oldest first
+        k = self.frame_stack
+        return self._frames[self._head + 1:self._head + 1 + k].reshape(self.observation_space.shape)
+
+    def _get_grid_obs(self, out=None):
+        #the lidar is not cast in grid mode
+        k = self.frame_stack
+        self._head = (self._head + 1) % k
+        frame = self._frames[self._head:self._head + 1]
+
+        t = self.traffic
+        lane = t.lane[None, :t.n]
+        dist = t.dist[None, :t.n]
+        intensity = car_alphas(dist, self.max_range_by_fog[self.fog], self.fog, self.max_fog_levels)
+        occupancy_grid(
+            np.array([self.ego_lane]), lane, dist, np.ones(lane.shape, dtype=bool), intensity,
+            float(self.grid_height), self.car_length, out=frame,
         )
-        fog_norm = np.float32(self.fog / max(self.fog_levels))
-
-        lidar = self._lidar()
-        lidar_norm = lidar / self.max_range_by_fog[self.fog]
-
-        obs = np.concatenate(
-            [
-                lane_onehot,
-                np.array([speed_norm], dtype=np.float32),
-                np.array([fog_norm], dtype=np.float32),
-                lidar_norm,
-            ]
-        ).astype(np.float32)
-        return obs
+        self._frames[self._head + k] = frame[0]
+        self._lap("obs")
+
+        window = self._grid_window()
+        if out is None and self._copy_obs:
+            #reset() / step() copy it, the ring itself is never shifted
+            return window
+        if out is None:
+            out = self._obs
+        out[:] = window
+        return out
@@ -0,0 +1,209 @@
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  #optional dependency, FoggyDriving falls back to the NumPy kernels
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+
+def _jit(fn):
+    #cache=True stores the machine code next to this module, so new workers skip compilation
+    if numba is None:
+        return fn
+    return numba.njit(cache=True, nogil=True)(fn)
+
+
+#layout of the float64 parameter vector built by driver_params()
+CAR_LENGTH, MIN_SPEED, IDM_A, IDM_B, IDM_T, IDM_S0, IDM_DELTA, SAFE_BRAKE, THRESHOLD, GAP_EXP = range(10)
+
+
+def driver_params(model):
+    """DriverModel as a flat float64 vector for the compiled kernels.
+
+    The trailing 2.0 is the IDM gap exponent. It is passed at runtime because LLVM
+    folds a literal pow(x, 2.0) into x * x, which differs from np.float_power by an ulp.
+    """
+    return np.array(tuple(model) + (2.0,), dtype=np.float64)
+
+
+@_jit
+def lane_order(lane, dist, n):
+    #stable insertion sort by (lane, dist), same order as np.lexsort((dist, lane))
+    order = np.arange(n)
+    for i in range(1, n):
+        k = order[i]
+        j = i - 1
+        while j >= 0 and (lane[order[j]] > lane[k] or (lane[order[j]] == lane[k] and dist[order[j]] > dist[k])):
+            order[j + 1] = order[j]
+            j -= 1
+        order[j + 1] = k
+    return order
+
+
+@_jit
+def _idm(p, dist, speed, desired, lead_dist, lead_speed, has_lead):
+    v = max(p[MIN_SPEED], speed)
+    v0 = max(p[MIN_SPEED] + 1e-3, desired)
+    if has_lead:
+        s = max(0.1, lead_dist - dist - p[CAR_LENGTH])
+        dv = v - lead_speed
+    else:
+        s = 1e6
+        dv = 0.0
+    s_star = p[IDM_S0] + v * p[IDM_T] + (v * dv) / (2.0 * math.sqrt(p[IDM_A] * p[IDM_B]))
+    return p[IDM_A] * (1.0 - (v / v0) ** p[IDM_DELTA] - (s_star / s) ** p[GAP_EXP])
+
+
+@_jit
+def _leader(lane, dist, order, g, q):
+    #first sorted vehicle with (lane, dist) > (g, q), -1 if it is not in lane g
+    lo = 0
+    hi = order.shape[0]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        k = order[mid]
+        if lane[k] < g or (lane[k] == g and dist[k] <= q):
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < order.shape[0] and lane[order[lo]] == g:
+        return order[lo]
+    return -1
+
+
+@_jit
+def _follower(lane, dist, order, g, q):
+    #last sorted vehicle with (lane, dist) < (g, q), -1 if it is not in lane g
+    lo = 0
+    hi = order.shape[0]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        k = order[mid]
+        if lane[k] < g or (lane[k] == g and dist[k] < q):
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo > 0 and lane[order[lo - 1]] == g:
+        return order[lo - 1]
+    return -1
+
+
+@_jit
+def idm_accelerations(p, lane, dist, speed, desired, n):
+    """IDM acceleration per slot, each car following the next car in its lane."""
+    order = lane_order(lane, dist, n)
+    accel = np.empty(n)
+    for i in range(n):
+        k = order[i]
+        if i + 1 < n and lane[order[i + 1]] == lane[k]:
+            lead = order[i + 1]
+            accel[k] = _idm(p, dist[k], speed[k], desired[k], dist[lead], speed[lead], True)
+        else:
+            accel[k] = _idm(p, dist[k], speed[k], desired[k], 0.0, 0.0, False)
+    return accel
+
+
+@_jit
+def mobil_accept(p, lane, dist, speed, desired, n, cars, delta_lane, num_lanes):
+    """Compiled counterpart of dynamics.mobil_accept for slot-indexed candidates."""
+    order = lane_order(lane, dist, n)
+    accept = np.zeros(cars.shape[0], dtype=np.bool_)
+    for c in range(cars.shape[0]):
+        car = cars[c]
+        d = dist[car]
+        v = speed[car]
+        target = lane[car] + delta_lane[c]
+        if target < 0 or target >= num_lanes:
+            continue
+
+        cur = _leader(lane, dist, order, lane[car], d + 1e-6)
+        tgt = _leader(lane, dist, order, target, d + 1e-6)
+        a_current = _idm(p, d, v, desired[car], dist[cur], speed[cur], cur >= 0)
+        a_target = _idm(p, d, v, desired[car], dist[tgt], speed[tgt], tgt >= 0)
+
+        #follower in the target lane: does the candidate cut in ahead of it?
+        fol = _follower(lane, dist, order, target, d - 1e-6)
+        if fol >= 0:
+            f_dist = dist[fol]
+            old = _leader(lane, dist, order, target, f_dist + 1e-6)
+            cut_in = d > f_dist and (old < 0 or d < dist[old])
+            if cut_in:
+                a_follower_new = _idm(p, f_dist, speed[fol], desired[fol], d, v, True)
+            else:
+                a_follower_new = _idm(p, f_dist, speed[fol], desired[fol], dist[old], speed[old], old >= 0)
+            if a_follower_new < -p[SAFE_BRAKE]:
+                continue
+
+        accept[c] = not ((a_target - a_current) < p[THRESHOLD])
+    return accept
+
+
+@_jit
+def advance(p, lane, dist, speed, desired, active, n, ego_speed, max_speed, lower, upper):
+    """IDM, integration, despawn and order-preserving compaction in one pass; returns new n."""
+    accel = idm_accelerations(p, lane, dist, speed, desired, n)
+    k = 0
+    for i in range(n):
+        s = min(max(speed[i] + accel[i], p[MIN_SPEED]), max_speed)
+        d = dist[i] - (ego_speed - s)
+        if lower < d < upper:
+            lane[k] = lane[i]
+            dist[k] = d
+            speed[k] = s
+            desired[k] = desired[i]
+            active[k] = True
+            k += 1
+    active[k:n] = False
+    return k
+
+
+@_jit
+def collision(lane, dist, n, ego_lane, car_length):
+    for i in range(n):
+        if lane[i] == ego_lane and 0.0 < dist[i] < car_length:
+            return True
+    return False
+
+
+@_jit
+def lidar_cast(dx, inv_dx, inv_dy, width, box_w, box_h, ego_x, lane, dist, n, max_r):
+    """Compiled counterpart of LidarCaster.cast, boxes given by lane / dist columns."""
+    beams = dx.shape[0]
+    out = np.empty(beams, dtype=np.float32)
+    r = np.float64(np.float32(max_r))
+    for b in range(beams):
+        t_hit = np.inf
+        for i in range(n):
+            x0 = lane[i] - ego_x
+            y0 = dist[i]
+            if dx[b] == 0.0:
+                tx0 = -np.inf if (x0 <= 0.0 and 0.0 < x0 + box_w) else np.inf
+                tx1 = np.inf
+            else:
+                tx0 = x0 * inv_dx[b]
+                tx1 = (x0 + box_w) * inv_dx[b]
+            if inv_dy[b] == 0.0:
+                ty0 = -np.inf if (y0 <= 0.0 and 0.0 < y0 + box_h) else np.inf
+                ty1 = np.inf
+            else:
+                ty0 = y0 * inv_dy[b]
+                ty1 = (y0 + box_h) * inv_dy[b]
+            t_enter = max(max(min(tx0, tx1), min(ty0, ty1)), 0.0)
+            t_exit = min(max(tx0, tx1), max(ty0, ty1))
+            if t_enter < t_exit and t_enter < t_hit:
+                t_hit = t_enter
+
+        if dx[b] > 0:
+            t_wall = (width - ego_x) / dx[b]
+        elif dx[b] < 0:
+            t_wall = (0.0 - ego_x) / dx[b]
+        else:
+            t_wall = np.inf
+        if t_hit >= t_wall:
+            t_hit = np.inf
+        out[b] = np.float32(min(r, t_hit))
+    return out
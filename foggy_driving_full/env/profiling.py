@@ -0,0 +1,53 @@
+from time import perf_counter
+
+
+def _no_lap(phase):
+    pass
+
+
+class StepProfiler:
+    """Accumulates wall time and call counts per phase of FoggyDriving.step.
+
+    The env calls lap(phase) at the end of each phase; the time since the previous lap
+    is charged to that phase. Laps outside start()/stop() (e.g. during reset) are ignored.
+    """
+
+    phases = ("ego", "lane_change", "idm", "integrate", "spawn", "fog", "collision", "lidar", "obs")
+
+    def __init__(self):
+        self._t = None
+        self._start = None
+        self.last = {}
+        self.clear()
+
+    def clear(self):
+        self.time = dict.fromkeys(self.phases, 0.0)
+        self.calls = dict.fromkeys(self.phases, 0)
+        self.steps = 0
+        self.step_time = 0.0
+
+    def start(self):
+        self._start = self._t = perf_counter()
+        self.last = {}
+
+    def lap(self, phase):
+        if self._t is None:
+            return
+        now = perf_counter()
+        dt = now - self._t
+        self.time[phase] += dt
+        self.calls[phase] += 1
+        self.last[phase] = self.last.get(phase, 0.0) + dt
+        self._t = now
+
+    def stop(self):
+        self.step_time += perf_counter() - self._start
+        self.steps += 1
+        self._t = None
+
+    def summary(self):
+        return {
+            "steps": self.steps,
+            "step_time": self.step_time,
+            "phases": {p: {"time": self.time[p], "calls": self.calls[p]} for p in self.phases},
+        }
@@ -0,0 +1,156 @@
+import numpy as np
+
+
+class Rasterizer:
+    """Pure-NumPy top-down rasterizer of the road, for a batch of worlds at once.
+
+    Draws the same scene as the matplotlib renderer (grid, ego, traffic with
+    distance/fog alpha, lidar beams, fog overlay) without the HUD, straight into a
+    (N, height, width, 3) uint8 array. World x spans [0, width_units) lanes and y
+    spans [0, height_units); the image is scaled independently on both axes.
+    """
+
+    background = np.array([211, 211, 211], dtype=np.float32)
+    grid = np.array([255, 255, 255], dtype=np.float32)
+    ego_color = np.array([0, 0, 255], dtype=np.float32)
+    car_color = np.array([255, 0, 0], dtype=np.float32)
+    beam_color = np.array([255, 255, 0], dtype=np.float32)
+    fog_color = np.array([128, 128, 128], dtype=np.float32)
+
+    def __init__(self, width_units, height_units, num_lanes, car_length=1.0, size=(480, 240)):
+        self.width_units = float(width_units)
+        self.height_units = float(height_units)
+        self.num_lanes = int(num_lanes)
+        self.car_length = float(car_length)
+        self.height, self.width = (int(v) for v in size)
+        self.sx = self.width_units / self.width
+        self.sy = self.height_units / self.height
+
+        #world coordinates of the pixel centres, row 0 is the top of the road
+        self.x_c = (np.arange(self.width) + 0.5) * self.sx
+        self.y_c = self.height_units - (np.arange(self.height) + 0.5) * self.sy
+
+        #static road with the white grid blended in
+        bg = np.empty((self.height, self.width, 3), dtype=np.float32)
+        bg[:] = self.background
+        cols = np.clip(np.round(np.arange(int(self.width_units) + 1) / self.sx).astype(int), 0, self.width - 1)
+        rows = np.clip(
+            np.round((self.height_units - np.arange(int(self.height_units) + 1)) / self.sy).astype(int),
+            0, self.height - 1,
+        )
+        bg[:, cols] = bg[:, cols] * 0.4 + self.grid * 0.6
+        bg[rows, :] = bg[rows, :] * 0.4 + self.grid * 0.6
+        self.static = bg
+
+        #columns covered by a car in each lane: [lane + 0.05, lane + 0.95)
+        self.lane_cols = [
+            np.flatnonzero((self.x_c >= lane + 0.05) & (self.x_c < lane + car_length - 0.05))
+            for lane in range(self.num_lanes)
+        ]
+
+        self._static_cache = {}
+
+    def _fogged_static(self, alpha):
+        #background with the fog overlay applied, one cached uint8 copy per opacity
+        key = float(alpha)
+        image = self._static_cache.get(key)
+        if image is None:
+            image = np.rint(self.static * (1.0 - key) + self.fog_color * key).astype(np.uint8)
+            self._static_cache[key] = image
+        return image
+
+    def render_batch(self, ego_lane, lane, dist, active, car_alpha, fog_alpha, beam_dx, beam_dy, lidar, out=None):
+        """Rasterize N worlds.
+
+        ego_lane (N,); padded traffic lane / dist / active / car_alpha (N, C);
+        fog_alpha (N,) overlay opacity (0 = no fog); beam directions (B,) and lidar
+        readings (N, B). Writes into and returns `out` (N, height, width, 3) uint8.
+        """
+        ego_lane = np.asarray(ego_lane)
+        n = ego_lane.shape[0]
+        if out is None:
+            out = np.empty((n, self.height, self.width, 3), dtype=np.uint8)
+
+        #the fog overlay is a per-world blend, so it is folded into every colour
+        #instead of being applied as a separate pass over the image
+        fog_alpha = np.asarray(fog_alpha, dtype=np.float32)
+        levels, level_idx = np.unique(fog_alpha, return_inverse=True)
+        statics = np.stack([self._fogged_static(a) for a in levels.tolist()])
+        np.take(statics, level_idx.reshape(-1), axis=0, out=out)
+        a = fog_alpha[:, None, None]
+
+        ego_y0 = 1.0
+        y_c = self.y_c[None, None, :]
+
+        #cars: every car in a lane covers the same columns, so each lane reduces to a
+        #per-row transmittance of the red layer over the ego / background row colour
+        top = (ego_y0 + dist)[:, :, None]
+        covered = active[:, :, None] & (y_c >= top) & (y_c < top + self.car_length)
+        ego_rows = (self.y_c >= ego_y0) & (self.y_c < ego_y0 + self.car_length)
+        for lane_id, cols in enumerate(self.lane_cols):
+            if cols.size == 0:
+                continue
+            in_lane = covered & (lane == lane_id)[:, :, None]
+            transmit = np.prod(np.where(in_lane, 1.0 - car_alpha[:, :, None], 1.0), axis=1, dtype=np.float32)
+
+            color = np.repeat(self.static[None, :, cols[0]], n, axis=0)
+            color[(ego_lane == lane_id)[:, None] & ego_rows[None, :]] = self.ego_color
+            color *= transmit[:, :, None]
+            color += (1.0 - transmit)[:, :, None] * self.car_color
+            color *= 1.0 - a
+            color += a * self.fog_color
+            out[:, :, cols[0]:cols[-1] + 1] = np.rint(color).astype(np.uint8)[:, :, None, :]
+
+        #beams: sample each segment about once per pixel and blend the hits; repeated
+        #hits gather the same pre-beam pixel, so duplicates write identical values.
+        #Blending over fogged pixels with a fogged beam colour equals fog over the beam
+        ego_cx = ego_lane + 0.5
+        ego_cy = ego_y0 + self.car_length / 2.0
+        #end points are clipped to the road first, like the matplotlib renderer
+        x_end = np.clip(ego_cx[:, None] + beam_dx[None, :] * lidar, 0, self.width_units)
+        y_end = np.clip(ego_cy + beam_dy[None, :] * lidar, 0, self.height_units)
+        steps = max(self.height, self.width)
+        t = np.linspace(0.0, 1.0, steps, dtype=np.float32)
+        x = ego_cx[:, None, None] + (x_end - ego_cx[:, None])[:, :, None] * t
+        y = ego_cy + (y_end - ego_cy)[:, :, None] * t
+        col = np.minimum((x / self.sx).astype(np.int64), self.width - 1)
+        row = np.minimum(((self.height_units - y) / self.sy).astype(np.int64), self.height - 1)
+        world = np.arange(n)[:, None, None]
+        flat = ((world * self.height + row) * self.width + col).reshape(-1)
+
+        beam = self.beam_color * (1.0 - a[:, 0]) + a[:, 0] * self.fog_color
+        pixels = out.reshape(-1, 3)
+        blended = pixels[flat] * np.float32(0.1) + beam[flat // (self.height * self.width)] * np.float32(0.9)
+        pixels[flat] = np.rint(blended).astype(np.uint8)
+        return out
+
+
+def occupancy_grid(ego_lane, lane, dist, active, intensity, height_units, car_length=1.0, out=None):
+    """Compact (N, 2, cells, lanes) uint8 grid observation for N worlds.
+
+    Rows split the road [0, height_units) into equal longitudinal cells, row 0 being
+    the far end as in the rendered frame. Channel 0 holds traffic intensity (0-255,
+    the brightest car overlapping a cell), channel 1 the ego car. `intensity` (N, C)
+    is the per-car brightness in [0, 1], e.g. renderer.car_alphas, so traffic fades
+    with distance and fog. `out` decides the grid size and must be given.
+    """
+    n, _, cells, num_lanes = out.shape
+    cell = height_units / cells
+    ego_y0 = 1.0
+    out[:] = 0
+
+    #rows overlapped by each car's span [y, y + car_length), in image order
+    y = ego_y0 + dist
+    r_top = np.floor((height_units - (y + car_length)) / cell).astype(np.int64)
+    r_bot = np.ceil((height_units - y) / cell).astype(np.int64) - 1
+    row = r_top[..., None] + np.arange(int(np.ceil(car_length / cell)) + 1)
+    hit = (row <= r_bot[..., None]) & (row >= 0) & (row < cells) & active[..., None]
+    #misses add 0 to a clipped row, a no-op for maximum
+    value = np.where(hit, np.rint(np.asarray(intensity) * 255.0)[..., None], 0).astype(np.uint8)
+    world = np.arange(n).reshape((n,) + (1,) * (row.ndim - 1))
+    np.maximum.at(out[:, 0], (world, np.clip(row, 0, cells - 1), lane[..., None]), value)
+
+    e_top = max(int(np.floor((height_units - (ego_y0 + car_length)) / cell)), 0)
+    e_bot = min(int(np.ceil((height_units - ego_y0) / cell)) - 1, cells - 1)
+    out[np.arange(n), 1, e_top:e_bot + 1, np.asarray(ego_lane)] = 255
+    return out
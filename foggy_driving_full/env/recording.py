@@ -0,0 +1,214 @@
+import multiprocessing as mp
+import os
+from collections import deque
+
+import numpy as np
+
+from .foggy_env import FoggyDriving
+
+
+def open_writer(path, fps=8):
+    """Streaming imageio writer, GIF or MP4 depending on the file extension."""
+    import imageio
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".mp4", ".m4v", ".mov", ".avi", ".mkv"):
+        try:
+            import imageio_ffmpeg  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Video output needs imageio-ffmpeg: pip install imageio-ffmpeg") from None
+        return imageio.get_writer(path, fps=fps, macro_block_size=2)
+    return imageio.get_writer(path, mode="I", fps=fps)
+
+
+def _append(writer, frame):
+    #frames are opaque, and video codecs have no alpha channel
+    writer.append_data(frame[..., :3])
+
+
+def render_kwargs(env):
+    """FoggyDriving kwargs needed to rebuild an env that renders like `env`."""
+    return {
+        "min_speed": env.min_speed,
+        "max_speed": env.max_speed,
+        "max_fog_levels": env.max_fog_levels,
+        "max_range_by_fog": dict(env.max_range_by_fog),
+        "lidars": env.lidars,
+        "obs_mode": env.obs_mode,
+        "render_size": tuple(env.renderer.fast_size),
+    }
+
+
+def snapshot(env):
+    """The part of the env state a frame is drawn from, small enough to ship to a worker."""
+    t = env.traffic
+    return (
+        env.ego_lane, env.ego_speed, env.fog, env.step_count, env.distance,
+        t.lane[:t.n].copy(), t.dist[:t.n].copy(), env.last_lidar.copy(),
+    )
+
+
+def apply_snapshot(env, snap):
+    ego_lane, ego_speed, fog, step_count, distance, lane, dist, lidar = snap
+    env.ego_lane = ego_lane
+    env.ego_speed = ego_speed
+    env.fog = fog
+    env.step_count = step_count
+    env.distance = distance
+    env.traffic.clear()
+    zeros = np.zeros(len(lane))
+    env.traffic.extend(lane, dist, zeros, zeros)
+    env.last_lidar[:] = lidar
+
+
+def rollout_snapshots(env, model, max_steps=400, seed=None):
+    """Plays one deterministic episode of `model`, yielding a snapshot after every step."""
+    obs, _ = env.reset(seed=seed)
+    done = False
+    trunc = False
+    step = 0
+    while not (done or trunc) and step < max_steps:
+        action, _ = model.predict(obs, deterministic=True)
+        obs, _, done, trunc, _ = env.step(int(action))
+        yield snapshot(env)
+        step += 1
+
+
+#worker side: one env + renderer per process, built by the pool initializer
+_worker_env = None
+_worker_mode = None
+
+
+def _init_worker(env_kwargs, mode):
+    global _worker_env, _worker_mode
+    _worker_env = FoggyDriving(**env_kwargs)
+    _worker_mode = mode
+
+
+def _render_chunk(snaps):
+    frames = []
+    for snap in snaps:
+        apply_snapshot(_worker_env, snap)
+        frames.append(_worker_env.renderer.render(_worker_mode))
+    return frames
+
+
+def _write_episode(path, snaps, fps):
+    writer = open_writer(path, fps)
+    try:
+        for snap in snaps:
+            apply_snapshot(_worker_env, snap)
+            _append(writer, _worker_env.renderer.render(_worker_mode))
+    finally:
+        writer.close()
+    return path, len(snaps)
+
+
+class RenderPool:
+    """Process pool that renders frames from state snapshots.
+
+    Each worker owns a FoggyDriving built from `env_kwargs` (see render_kwargs) and
+    draws whatever snapshot it is handed, so the simulation and the policy stay in
+    the calling process and only snapshots and finished frames cross processes.
+    At most `max_pending` tasks are in flight, which bounds memory.
+    """
+
+    def __init__(self, env_kwargs, workers=None, mode="rgb_array", chunk_size=16, max_pending=None,
+                 start_method=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 2 * self.workers
+
+        #forkserver keeps workers from inheriting the parent's matplotlib / torch state
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+        self._pool = ctx.Pool(self.workers, initializer=_init_worker, initargs=(env_kwargs, mode))
+
+    def frames(self, snapshots):
+        """Yields rendered frames in order for an iterable of snapshots."""
+        pending = deque()
+        chunk = []
+        for snap in snapshots:
+            chunk.append(snap)
+            if len(chunk) < self.chunk_size:
+                continue
+            pending.append(self._pool.apply_async(_render_chunk, (chunk,)))
+            chunk = []
+            while len(pending) >= self.max_pending:
+                yield from pending.popleft().get()
+        if chunk:
+            pending.append(self._pool.apply_async(_render_chunk, (chunk,)))
+        while pending:
+            yield from pending.popleft().get()
+
+    def write_episodes(self, episodes, fps=8):
+        """Renders (path, snapshots) pairs, each episode in one worker straight to its file.
+
+        Yields (path, frame count) as episodes finish, in submission order.
+        """
+        pending = deque()
+        for path, snaps in episodes:
+            pending.append(self._pool.apply_async(_write_episode, (path, snaps, fps)))
+            while len(pending) >= self.max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record_episode(env, model, path, fps=8, max_steps=400, workers=0, mode="rgb_array", seed=None):
+    """Streams one episode of `model` to a GIF / MP4 file, returns the number of frames.
+
+    workers=0 renders in this process with env.renderer; otherwise frames are drawn
+    by a RenderPool while the episode is being played.
+    """
+    writer = open_writer(path, fps)
+    count = 0
+    try:
+        snapshots = rollout_snapshots(env, model, max_steps, seed)
+        if workers:
+            with RenderPool(render_kwargs(env), workers, mode) as pool:
+                for frame in pool.frames(snapshots):
+                    _append(writer, frame)
+                    count += 1
+        else:
+            for _ in snapshots:
+                _append(writer, env.renderer.render(mode))
+                count += 1
+    finally:
+        writer.close()
+    return count
+
+
+def record_episodes(env, model, out_dir, episodes=10, fps=8, max_steps=400, workers=None, mode="rgb_array",
+                    fmt="gif", seed=None):
+    """Records `episodes` evaluation episodes of `model` into out_dir/episode_XXX.<fmt>.
+
+    Episodes are played in this process and rendered and encoded in parallel by a
+    RenderPool; only the snapshots of in-flight episodes are held in memory.
+    Returns the written paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    def played():
+        for i in range(episodes):
+            episode_seed = None if seed is None else seed + i
+            path = os.path.join(out_dir, f"episode_{i:03d}.{fmt}")
+            yield path, list(rollout_snapshots(env, model, max_steps, episode_seed))
+
+    paths = []
+    with RenderPool(render_kwargs(env), workers, mode) as pool:
+        for path, count in pool.write_episodes(played(), fps):
+            print(f"Saved {path} ({count} frames)")
+            paths.append(path)
+    return paths
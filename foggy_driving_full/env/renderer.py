@@ -1,22 +1,67 @@
 
-import math
-
-import matplotlib.pyplot as plt
 import numpy as np
-import imageio
 
-class FoggyDrivingRender:
+from .raster import Rasterizer
+
+
+def car_alphas(dist, max_r, fog, max_fog):
+    #traffic fades with distance and fog, never fully invisible
+    if max_fog > 0:
+        alpha_fog = 1.0 - (np.asarray(fog) / max_fog) ** 1.2
+    else:
+        alpha_fog = 1.0
+    alpha_dist = 1.0 - np.minimum(dist / max_r, 1.0)
+    return np.clip(alpha_dist * alpha_fog, 0.1, 1.0)
 
-    def __init__(self, env):
+
+def fog_overlay_alpha(fog):
+    #gray veil over the road, 0 without fog
+    base_alpha = 0.15
+    alpha_step = 0.15
+    fog = np.asarray(fog)
+    return np.where(fog > 0, np.minimum(base_alpha + fog * alpha_step, 0.3), 0.0)
+
+
+class FoggyDrivingRender:
+    """Renders FoggyDriving in "human", "rgb_array" or "rgb_array_fast" mode.
+
+    "human" / "rgb_array" use a persistent matplotlib figure: the road, grid and axes
+    are drawn once and cached as a background; each frame restores it and redraws
+    only the moving artists (ego, traffic, beams, fog, text), i.e. blitting.
+    "rgb_array_fast" skips matplotlib and rasterizes the road (no HUD) with NumPy
+    at `fast_size` = (height, width) pixels. Lidar beams come from env.last_lidar,
+    the reading computed during the last step, so rendering never touches the RNG.
+    With obs_mode="grid" no lidar is cast and frames are drawn without beams.
+    matplotlib is only imported by the figure-based modes.
+    """
+
+    #rendered text snapshots kept per text artist, keyed by string
+    text_cache_size = 512
+
+    def __init__(self, env, fast_size=(480, 240)):
         self.env = env
+        self.fast_size = fast_size
+        self._fig = None
+        self._mode = None
+        self._rasterizer = None
 
-    def _draw_figure(self):
+    def _build(self, mode):
         env = self.env
-        max_r = env.max_range_by_fog[env.fog]
         H = env.grid_height
         W = env.grid_width
 
-        fig = plt.figure(figsize=(5, 6))
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Rectangle
+
+        #human mode needs a pyplot window, rgb_array draws off-screen
+        if mode == "human":
+            import matplotlib.pyplot as plt
+            fig = plt.figure(figsize=(5, 6))
+        else:
+            fig = Figure(figsize=(5, 6))
+            FigureCanvasAgg(fig)
         gs = fig.add_gridspec(1, 2, width_ratios=[3, 1])
         ax = fig.add_subplot(gs[0, 0])
         info_ax = fig.add_subplot(gs[0, 1])
@@ -31,129 +76,227 @@ class FoggyDrivingRender:
         for y in range(H + 1):
             ax.axhline(y, color="white", linewidth=0.5, alpha=0.6)
 
+        ax.set_xticks([])
+        ax.set_yticks([])
+
+        #moving artists, drawn by hand on top of the cached background
         car_w = env.car_length
         car_l = env.car_length
+        self._ego = ax.add_patch(Rectangle((0.05, 1.0), car_w - 0.1, car_l, color="blue", animated=True))
+        self._cars = []
+        self._beams = ax.add_collection(
+            LineCollection([], colors="yellow", linewidths=1.0, alpha=0.9, animated=True)
+        )
+        self._fog = ax.add_patch(Rectangle((0, 0), W, H, color="gray", alpha=0.0, animated=True))
+
+        #hud
+        info_ax.axis("off")
+        info_ax.set_title("Ego State", loc="left")
+        self._hud = []
+        y = 0.95
+        for size, gap in ((9, 0.08), (8, 0.08), (9, 0.08), (9, 0.08), (9, 0.08), (9, 0.12)):
+            self._hud.append(info_ax.text(0.05, y, "", fontsize=size, animated=True))
+            y -= gap
+
+        #lay out with representative text, then cache everything static
+        ax.set_title("Fog=0, Step=0")
+        self._hud[-1].set_text("Distance Travelled: 1000.0")
+        fig.tight_layout()
+        ax.title.set_animated(True)
+        ax.title.set_text("")
+        self._hud[-1].set_text("")
+        fig.canvas.draw()
+        self._background = fig.canvas.copy_from_bbox(fig.bbox)
+        self._texts = [ax.title] + self._hud
+        self._text_cache = [{} for _ in self._texts]
+
+        self._fig = fig
+        self._ax = ax
+        self._mode = mode
+
+        if mode == "human":
+            plt.show(block=False)
+
+    def _car_patch(self, i):
+        from matplotlib.patches import Rectangle
+
+        #grow the pool of traffic rectangles on demand
+        while len(self._cars) <= i:
+            car_w = self.env.car_length
+            self._cars.append(
+                self._ax.add_patch(Rectangle((0, 0), car_w - 0.1, car_w, color="red", animated=True))
+            )
+        return self._cars[i]
+
+    def _update(self):
+        env = self.env
+        ax = self._ax
+        max_r = env.max_range_by_fog[env.fog]
+        H = env.grid_height
+
         ego_y0 = 1.0
         ego_lane = env.ego_lane
         ego_cx = ego_lane + 0.5
-        ego_cy = ego_y0 + car_l/2.0
-
-        #ego
-        ax.add_patch(
-            plt.Rectangle(
-                (ego_lane + 0.05, ego_y0),
-                car_w - 0.1,
-                car_l,
-                color="blue",
-            )
-        )
+        ego_cy = ego_y0 + env.car_length / 2.0
+        self._ego.set_x(ego_lane + 0.05)
 
         #other cars
-        for c in env.cars:
-            x0 = c.lane
-            y0 = ego_y0 + c.dist
-            max_r = env.max_range_by_fog[env.fog]
-            fog_level = env.fog
-            max_fog = env.max_fog_levels
-
-            alpha_dist = 1.0 - min(c.dist / max_r, 1.0)
-            if max_fog > 0:
-                alpha_fog = 1.0 - (fog_level / max_fog) ** 1.2
-            else:
-                alpha_fog = 1.0
-
-            alpha = alpha_dist * alpha_fog
-            alpha = float(np.clip(alpha, 0.1, 1.0))
-
-            if -2 <= y0 <= H + 2:
-                ax.add_patch(
-                    plt.Rectangle(
-                        (x0 + 0.05, y0),
-                        car_w - 0.1,
-                        car_l,
-                        color=(1, 0, 0, alpha),
-                    )
-                )
-        lidar = env._lidar()
-
-        for d, ang in zip(lidar, env.beam_angles):
-            dx = math.sin(ang)
-            dy = math.cos(ang)
-
-            x_end = ego_cx + dx * d
-            y_end = ego_cy + dy * d
-
-            x_end = float(np.clip(x_end, 0, W))
-            y_end = float(np.clip(y_end, 0, H))
-
-            ax.plot([ego_cx, x_end], [ego_cy, y_end], color="yellow", linewidth=1.0, alpha=0.9)
-
+        traffic = env.traffic
+        lanes = traffic.lane[:traffic.n]
+        dists = traffic.dist[:traffic.n]
+
+        alphas = car_alphas(dists, max_r, env.fog, env.max_fog_levels)
+        ys = ego_y0 + dists
+        shown = (ys >= -2) & (ys <= H + 2)
+
+        k = 0
+        for x0, y0, alpha in zip(lanes[shown].tolist(), ys[shown].tolist(), alphas[shown].tolist()):
+            patch = self._car_patch(k)
+            patch.set_xy((x0 + 0.05, y0))
+            patch.set_facecolor((1, 0, 0, alpha))
+            patch.set_edgecolor((1, 0, 0, alpha))
+            patch.set_visible(True)
+            k += 1
+        for patch in self._cars[k:]:
+            patch.set_visible(False)
+
+        #beams, none in grid mode where last_lidar is never cast
+        if env.obs_mode == "grid":
+            self._beams.set_segments([])
+        else:
+            self._beams.set_segments(self._beam_segments(ego_cx, ego_cy))
 
         if env.fog > 0:
+            self._fog.set_alpha(float(fog_overlay_alpha(env.fog)))
+            self._fog.set_visible(True)
+        else:
+            self._fog.set_visible(False)
 
-            base_alpha = 0.15
-            alpha_step = 0.15
-            fog_alpha = min(base_alpha + env.fog * alpha_step, 0.3)
-            ax.add_patch(
-                plt.Rectangle(
-                    (0, 0),
-                    W,
-                    H,
-                    color="gray",
-                    alpha=fog_alpha,
-                )
-            )
-
-        ax.set_xticks([])
-        ax.set_yticks([])
-        ax.set_title(f"Fog={env.fog}, Step={env.step_count}")
+        ax.title.set_text(f"Fog={env.fog}, Step={env.step_count}")
 
         #hud
-        info_ax.axis("off")
-        info_ax.set_title("Ego State", loc="left")
-
         ego_speed = env.ego_speed
         speed_norm = (ego_speed - env.min_speed) / (env.max_speed - env.min_speed + 1e-8)
+        texts = (
+            f"Speed: {ego_speed:.1f}",
+            f"Speed norm: {speed_norm:.2f}",
+            f"Lane: {env.ego_lane}",
+            f"Fog level: {env.fog}",
+            f"Step: {env.step_count}",
+            f"Distance Travelled: {env.distance}",
+        )
+        for artist, text in zip(self._hud, texts):
+            artist.set_text(text)
 
-        y = 0.95
-        info_ax.text(0.05, y, f"Speed: {ego_speed:.1f}", fontsize=9); y -= 0.08
-        info_ax.text(0.05, y, f"Speed norm: {speed_norm:.2f}", fontsize=8); y -= 0.08
-        info_ax.text(0.05, y, f"Lane: {env.ego_lane}", fontsize=9); y -= 0.08
-        info_ax.text(0.05, y, f"Fog level: {env.fog}", fontsize=9); y -= 0.08
-        info_ax.text(0.05, y, f"Step: {env.step_count}", fontsize=9); y -= 0.08
-        info_ax.text(0.05, y, f"Distance Travelled: {env.distance}",fontsize=9); y -= 0.12
+    def _beam_segments(self, ego_cx, ego_cy):
+        env = self.env
+        H = env.grid_height
+        W = env.grid_width
+        lidar = env.last_lidar
+        dx = env.lidar_caster.dx
+        dy = env.lidar_caster.dy
+        x_end = np.clip(ego_cx + dx * lidar, 0, W)
+        y_end = np.clip(ego_cy + dy * lidar, 0, H)
+        segments = np.empty((lidar.shape[0], 2, 2))
+        segments[:, 0, 0] = ego_cx
+        segments[:, 0, 1] = ego_cy
+        segments[:, 1, 0] = x_end
+        segments[:, 1, 1] = y_end
+        return segments
+
+    def _blit(self):
+        fig = self._fig
+        canvas = fig.canvas
+        canvas.restore_region(self._background)
+        for artist in [self._ego] + self._cars + [self._beams, self._fog]:
+            if artist.get_visible():
+                artist.axes.draw_artist(artist)
+
+        #text sits on static background only, so a snapshot of its pixels can be
+        #pasted back instead of re-running font layout and glyph rendering
+        for artist, cache in zip(self._texts, self._text_cache):
+            text = artist.get_text()
+            region = cache.get(text)
+            if region is not None:
+                canvas.restore_region(region)
+                continue
+            artist.axes.draw_artist(artist)
+            if len(cache) >= self.text_cache_size:
+                cache.clear()
+            bbox = artist.get_window_extent(canvas.get_renderer()).padded(2)
+            cache[text] = canvas.copy_from_bbox(bbox)
+        canvas.blit(fig.bbox)
+
+    def rasterizer(self):
+        size = tuple(self.fast_size)
+        if self._rasterizer is None or (self._rasterizer.height, self._rasterizer.width) != size:
+            env = self.env
+            self._rasterizer = Rasterizer(env.grid_width, env.grid_height, env.num_lanes, env.car_length, size)
+        return self._rasterizer
+
+    def render_batch(self, ego_lane, fog, lane, dist, active, lidar, out=None):
+        """rgb_array_fast frames (N, height, width, 3) for N worlds given as arrays.
+
+        ego_lane / fog (N,), padded traffic lane / dist / active (N, C) and raw lidar
+        readings (N, beams), e.g. straight from FoggyDrivingVecEnv; lidar=None draws
+        no beams.
+        """
+        env = self.env
+        fog = np.asarray(fog)
+        max_r = np.array([env.max_range_by_fog[f] for f in fog.tolist()])
+        alphas = car_alphas(dist, max_r[:, None], fog[:, None], env.max_fog_levels)
+        dx, dy = env.lidar_caster.dx, env.lidar_caster.dy
+        if lidar is None:
+            dx = dy = np.zeros(0)
+            lidar = np.zeros((fog.shape[0], 0))
+        return self.rasterizer().render_batch(
+            ego_lane, lane, dist, active, alphas, fog_overlay_alpha(fog), dx, dy, lidar, out=out,
+        )
 
-        fig.tight_layout()
-        return fig
+    def render_fast(self):
+        env = self.env
+        t = env.traffic
+        n = t.n
+        frame = self.render_batch(
+            np.array([env.ego_lane]), np.array([env.fog]),
+            t.lane[None, :n], t.dist[None, :n], np.ones((1, n), dtype=bool),
+            None if env.obs_mode == "grid" else env.last_lidar[None, :],
+        )
+        return frame[0]
 
     def render(self, mode="rgb_array"):
-        fig = self._draw_figure()
+        if mode == "rgb_array_fast":
+            return self.render_fast()
+
+        if self._fig is None or self._mode != mode:
+            self.close()
+            self._build(mode)
+        self._update()
+        self._blit()
 
         if mode == "human":
-            plt.show()
+            self._fig.canvas.flush_events()
             return None
 
-        fig.canvas.draw()
-        w, h = fig.canvas.get_width_height()
-        rgba = np.frombuffer(fig.canvas.buffer_rgba(), dtype=np.uint8).reshape(h, w, 4)
-        plt.close(fig)
-        return rgba
+        return np.asarray(self._fig.canvas.buffer_rgba()).copy()
+
+    def close(self):
+        if self._fig is not None and self._mode == "human":
+            import matplotlib.pyplot as plt
+            plt.close(self._fig)
+        self._fig = None
+        self._mode = None
 
     def frame(self):
         return self.render(mode="rgb_array")
 
-    def record_gif(self, model, gif_path="FoggyDriving.gif", max_steps=400):
-        frames = []
-        obs, _ = self.env.reset()
-        done = False
-        trunc = False
-        step = 0
-
-        while not (done or trunc) and step < max_steps:
-            action, _ = model.predict(obs, deterministic=True)
-            obs, _, done, trunc, _ = self.env.step(int(action))
-            frames.append(self.frame())
-            step += 1
-
-        imageio.mimsave(gif_path, frames, fps=8)
-        print(f"GIF saved: {gif_path}")
+    def record_gif(self, model, gif_path="FoggyDriving.gif", max_steps=400, fps=8, workers=0):
+        """Streams one episode of `model` to gif_path (.gif, or .mp4 with imageio-ffmpeg).
+
+        Frames are written as they are rendered instead of being collected first;
+        workers > 0 renders them in a process pool from state snapshots.
+        """
+        from .recording import record_episode
+
+        record_episode(self.env, model, gif_path, fps=fps, max_steps=max_steps, workers=workers)
+        print(f"GIF saved: {gif_path}" if gif_path.lower().endswith(".gif") else f"Video saved: {gif_path}")
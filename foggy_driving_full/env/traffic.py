@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class TrafficState:
+    """Columnar (struct-of-arrays) store for the non-ego vehicles.
+
+    Columns are preallocated to `capacity` and doubled when full. Slots [0, n) hold
+    vehicles in insertion order; despawned vehicles are cleared from `active` and
+    squeezed out by `compact()`, which keeps the remaining order intact.
+    """
+
+    columns = ("lane", "dist", "speed", "desired_speed")
+
+    def __init__(self, capacity=32):
+        self.capacity = int(capacity)
+        self.n = 0
+        self.lane = np.zeros(self.capacity, dtype=np.int64)
+        self.dist = np.zeros(self.capacity, dtype=np.float64)
+        self.speed = np.zeros(self.capacity, dtype=np.float64)
+        self.desired_speed = np.zeros(self.capacity, dtype=np.float64)
+        self.active = np.zeros(self.capacity, dtype=bool)
+
+    def __len__(self):
+        return self.n
+
+    def clear(self):
+        self.active[: self.n] = False
+        self.n = 0
+
+    def _grow(self, min_capacity):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        for name in self.columns + ("active",):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: self.n] = old[: self.n]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def add(self, lane, dist, speed, desired_speed=None):
+        if self.n >= self.capacity:
+            self._grow(self.n + 1)
+        i = self.n
+        self.lane[i] = int(lane)
+        self.dist[i] = float(dist)
+        self.speed[i] = float(speed)
+        self.desired_speed[i] = float(desired_speed if desired_speed is not None else speed)
+        self.active[i] = True
+        self.n += 1
+        return i
+
+    def extend(self, lane, dist, speed, desired_speed):
+        #bulk add of equally long columns, returns the first new slot
+        k = len(lane)
+        if self.n + k > self.capacity:
+            self._grow(self.n + k)
+        i = self.n
+        self.lane[i:i + k] = lane
+        self.dist[i:i + k] = dist
+        self.speed[i:i + k] = speed
+        self.desired_speed[i:i + k] = desired_speed
+        self.active[i:i + k] = True
+        self.n += k
+        return i
+
+    def compact(self):
+        n = self.n
+        keep = self.active[:n]
+        k = int(np.count_nonzero(keep))
+        if k == n:
+            return
+        for name in self.columns:
+            col = getattr(self, name)
+            col[:k] = col[:n][keep]
+        self.active[:k] = True
+        self.active[k:n] = False
+        self.n = k
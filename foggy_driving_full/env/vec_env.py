@@ -0,0 +1,428 @@
+import time
+
+import numpy as np
+from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from .foggy_env import FoggyDriving
+from .dynamics import idm_accel_sorted, mobil_accept
+
+
+class FoggyDrivingVecEnv(VecEnv):
+    """N FoggyDriving worlds stepped as one array program.
+
+    Ego state is stored as (N,) arrays and traffic as padded (N, capacity) columns
+    with an active mask. Ego dynamics, MOBIL, IDM, spawning, fog, collision, lidar and
+    auto-reset run for all worlds at once. Follows the SB3 VecEnv contract
+    (terminal_observation / TimeLimit.truncated in infos) and reports Monitor-style
+    {"r", "l", "t"} episode stats under info["episode"], plus the distance travelled
+    under info["distance"] when an episode ends.
+
+    All worlds share one numpy Generator, so trajectories are not seed-for-seed
+    identical to a single FoggyDriving, only identically distributed.
+
+    With copy_obs=False, reset/step return the internal (N, obs_dim) buffer itself
+    (zero-copy); it is overwritten by the next step.
+
+    With render_mode="rgb_array_fast", get_images rasterizes all worlds in one batched
+    NumPy call (render_size = (height, width) pixels).
+    """
+
+    def __init__(self, num_envs=256, render_mode=None, min_speed=1, max_speed=5, max_fog_levels=2,
+                 max_range_by_fog=None, lidars=9, max_steps=400, lidar_mode="exact", capacity=16, seed=None,
+                 copy_obs=True, render_size=(480, 240)):
+
+        #single env holding the parameters, also used to render / inspect one world
+        self.template = FoggyDriving(
+            render_mode=render_mode, min_speed=min_speed, max_speed=max_speed,
+            max_fog_levels=max_fog_levels, max_range_by_fog=max_range_by_fog,
+            lidars=lidars, max_steps=max_steps, lidar_mode=lidar_mode, render_size=render_size,
+        )
+        env = self.template
+        self.render_mode = render_mode
+
+        super().__init__(num_envs, env.observation_space, env.action_space)
+
+        n = num_envs
+        self.rng = np.random.default_rng(seed)
+        self.driver_model = env._driver_model()
+        self.max_range = np.array([env.max_range_by_fog[f] for f in env.fog_levels], dtype=np.float64)
+        self.max_fog = max(env.fog_levels)
+
+        #ego
+        self.ego_lane = np.zeros(n, dtype=np.int64)
+        self.ego_speed = np.zeros(n, dtype=np.float64)
+        self.fog = np.zeros(n, dtype=np.int64)
+        self.distance = np.zeros(n, dtype=np.float64)
+        self.step_count = np.zeros(n, dtype=np.int64)
+
+        #traffic, padded per world
+        self.capacity = max(int(capacity), 12)
+        self.lane = np.zeros((n, self.capacity), dtype=np.int64)
+        self.dist = np.zeros((n, self.capacity), dtype=np.float64)
+        self.speed = np.zeros((n, self.capacity), dtype=np.float64)
+        self.desired_speed = np.zeros((n, self.capacity), dtype=np.float64)
+        self.active = np.zeros((n, self.capacity), dtype=bool)
+
+        #episode stats
+        self.t_start = time.time()
+        self.episode_returns = np.zeros(n, dtype=np.float64)
+        self.episode_lengths = np.zeros(n, dtype=np.int64)
+
+        self.actions = np.zeros(n, dtype=np.int64)
+        #batch observation buffer, step/reset hand out copies unless copy_obs=False
+        self.copy_obs = copy_obs
+        self.obs = np.zeros((n,) + env.observation_space.shape, dtype=np.float32)
+        self._noise = np.zeros((n, env.lidars), dtype=np.float64)
+        self.last_lidar = np.zeros((n, env.lidars), dtype=np.float32)
+
+    #VecEnv API
+
+    def reset(self):
+        seed = self._seeds[0]
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self._reset_seeds()
+        self._reset_options()
+
+        self._reset_worlds(np.arange(self.num_envs))
+        self.episode_returns[:] = 0.0
+        self.episode_lengths[:] = 0
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        obs = self._get_obs()
+        return obs.copy() if self.copy_obs else obs
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+
+    def step_wait(self):
+        env = self.template
+        actions = self.actions
+
+        self.step_count += 1
+        self.distance += self.ego_speed
+
+        #ego
+        self.ego_speed = np.where(actions == 1, np.minimum(env.max_speed, self.ego_speed + 1.0), self.ego_speed)
+        self.ego_speed = np.where(actions == 2, np.maximum(env.min_speed, self.ego_speed - 1.0), self.ego_speed)
+        self.ego_lane = np.where(actions == 3, np.maximum(0, self.ego_lane - 1), self.ego_lane)
+        self.ego_lane = np.where(actions == 4, np.minimum(env.num_lanes - 1, self.ego_lane + 1), self.ego_lane)
+
+        self._update_cars()
+
+        #fog level
+        change = self.rng.random(self.num_envs) < 0.2
+        new_fog = self.rng.integers(0, self.max_fog + 1, size=self.num_envs)
+        self.fog = np.where(change, new_fog, self.fog)
+
+        #collision
+        collision = (
+            self.active
+            & (self.lane == self.ego_lane[:, None])
+            & (self.dist > 0.0) & (self.dist < env.car_length)
+        ).any(axis=1)
+
+        terminated = collision
+        truncated = self.step_count >= env.max_steps
+
+        rewards = self.ego_speed.copy()
+        rewards[collision] -= 50.0
+        rewards[truncated & ~terminated] += 100.0
+
+        self.episode_returns += rewards
+        self.episode_lengths += 1
+
+        obs = self._get_obs()
+        dones = terminated | truncated
+        infos = [{"collision": c} for c in collision.tolist()]
+
+        done_idx = np.flatnonzero(dones)
+        if done_idx.size:
+            t = round(time.time() - self.t_start, 6)
+            for i in done_idx.tolist():
+                info = infos[i]
+                info["terminal_observation"] = obs[i].copy()
+                info["TimeLimit.truncated"] = bool(truncated[i] and not terminated[i])
+                info["distance"] = float(self.distance[i])
+                info["episode"] = {
+                    "r": round(float(self.episode_returns[i]), 6),
+                    "l": int(self.episode_lengths[i]),
+                    "t": t,
+                }
+            self.episode_returns[done_idx] = 0.0
+            self.episode_lengths[done_idx] = 0
+            self._reset_worlds(done_idx)
+            obs = self._get_obs(done_idx)
+
+        return (obs.copy() if self.copy_obs else obs), rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        self.template.close()
+
+    def get_attr(self, attr_name, indices=None):
+        indices = self._get_indices(indices)
+        value = getattr(self, attr_name) if attr_name in self._world_attrs else getattr(self.template, attr_name)
+        if attr_name in self._world_attrs:
+            return [value[i] for i in indices]
+        return [value for _ in indices]
+
+    def set_attr(self, attr_name, value, indices=None):
+        indices = list(self._get_indices(indices))
+        if attr_name in self._world_attrs:
+            getattr(self, attr_name)[indices] = value
+            return
+        if len(indices) != self.num_envs:
+            raise ValueError(f"'{attr_name}' is shared by all worlds and can only be set on every env at once")
+        setattr(self.template, attr_name, value)
+        self.driver_model = self.template._driver_model()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        #runs the method on the template after loading world i into it; whatever the method
+        #changed (ego, traffic, fog, counters, observation) is written back into world i.
+        #The worlds share self.rng, so a method's use or restore of the template RNG is not kept
+        results = []
+        for i in self._get_indices(indices):
+            self._load_world(i)
+            results.append(getattr(self.template, method_name)(*method_args, **method_kwargs))
+            self._store_world(i)
+        return results
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        #episode stats are reported Monitor-style, so evaluate_policy can rely on them
+        wrapped = issubclass(Monitor, wrapper_class)
+        return [wrapped for _ in self._get_indices(indices)]
+
+    def get_images(self):
+        if self.render_mode == "rgb_array_fast":
+            #every world rasterized in one batched call
+            frames = self.template.renderer.render_batch(
+                self.ego_lane, self.fog, self.lane, self.dist, self.active, self.last_lidar,
+            )
+            return list(frames)
+        images = []
+        for i in range(self.num_envs):
+            self._load_world(i)
+            images.append(self.template.renderer.render("rgb_array"))
+        return images
+
+    _world_attrs = ("ego_lane", "ego_speed", "fog", "distance", "step_count")
+
+    #simulation
+
+    def _load_world(self, i):
+        env = self.template
+        env.ego_lane = int(self.ego_lane[i])
+        env.ego_speed = float(self.ego_speed[i])
+        env.fog = int(self.fog[i])
+        env.distance = float(self.distance[i])
+        env.step_count = int(self.step_count[i])
+        env.last_lidar[:] = self.last_lidar[i]
+        env._obs[:] = self.obs[i]
+        env.traffic.clear()
+        for slot in np.flatnonzero(self.active[i]).tolist():
+            env.traffic.add(self.lane[i, slot], self.dist[i, slot], self.speed[i, slot], self.desired_speed[i, slot])
+
+    def _store_world(self, i):
+        #inverse of _load_world: the template's state becomes world i. Traffic goes back into the
+        #same slots when the car count is unchanged (slots index the per-slot random draws),
+        #otherwise it is compacted into slots 0..n-1
+        env = self.template
+        self.ego_lane[i] = env.ego_lane
+        self.ego_speed[i] = env.ego_speed
+        self.fog[i] = env.fog
+        self.distance[i] = env.distance
+        self.step_count[i] = env.step_count
+        self.last_lidar[i] = env.last_lidar
+        self.obs[i] = env._obs
+        t = env.traffic
+        n = t.n
+        slots = np.flatnonzero(self.active[i])
+        if slots.size != n:
+            if n > self.capacity:
+                self._grow(n)
+            self.active[i] = False
+            slots = slice(0, n)
+        self.lane[i, slots] = t.lane[:n]
+        self.dist[i, slots] = t.dist[:n]
+        self.speed[i, slots] = t.speed[:n]
+        self.desired_speed[i, slots] = t.desired_speed[:n]
+        self.active[i, slots] = True
+
+    def _grow(self, min_capacity):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        for name in ("lane", "dist", "speed", "desired_speed", "active"):
+            old = getattr(self, name)
+            new = np.zeros((self.num_envs, capacity), dtype=old.dtype)
+            new[:, : self.capacity] = old
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def _reset_worlds(self, idx):
+        env = self.template
+        rng = self.rng
+        k = idx.size
+        lo, hi = env.min_speed, env.max_speed
+
+        self.step_count[idx] = 0
+        self.ego_lane[idx] = rng.integers(0, env.num_lanes, size=k)
+        self.ego_speed[idx] = (lo + hi) / 2.0
+        self.fog[idx] = rng.integers(0, self.max_fog + 1, size=k)
+        self.distance[idx] = 0.0
+
+        #initial traffic: 5-9 random cars in slots 0..8, 3 slow cars in the ego lane in slots 9..11
+        n_cars = rng.integers(5, 10, size=k)
+        lane = rng.integers(0, env.num_lanes, size=(k, 9))
+        dist = rng.uniform(4.0, env.grid_height, size=(k, 9))
+        speed = rng.uniform(lo, hi - 1, size=(k, 9))
+        desired = rng.uniform(np.maximum(speed, lo + 1), hi)
+
+        slow_dist = rng.uniform(2.0, 4.0, size=(k, 3))
+        slow_desired = rng.uniform(lo + 0.5, hi - 1, size=(k, 3))
+
+        self.active[idx] = False
+        self.lane[idx, :9] = lane
+        self.dist[idx, :9] = dist
+        self.speed[idx, :9] = speed
+        self.desired_speed[idx, :9] = desired
+        self.active[idx, :9] = np.arange(9) < n_cars[:, None]
+
+        self.lane[idx, 9:12] = self.ego_lane[idx, None]
+        self.dist[idx, 9:12] = slow_dist
+        self.speed[idx, 9:12] = lo
+        self.desired_speed[idx, 9:12] = slow_desired
+        self.active[idx, 9:12] = True
+
+    def _sorted_traffic(self):
+        #flat active slots plus their order by (world, lane, dist)
+        env = self.template
+        flat = np.flatnonzero(self.active)
+        world = flat // self.capacity
+        lane = self.lane.reshape(-1)[flat]
+        group = world * env.num_lanes + lane
+        dist = self.dist.reshape(-1)[flat]
+        order = np.lexsort((dist, group))
+        return flat, world, group, order
+
+    def _update_cars(self):
+        env = self.template
+        rng = self.rng
+        model = self.driver_model
+        n, cap = self.num_envs, self.capacity
+
+        lane_f = self.lane.reshape(-1)
+        dist_f = self.dist.reshape(-1)
+        speed_f = self.speed.reshape(-1)
+        desired_f = self.desired_speed.reshape(-1)
+
+        #lane change, all candidates decided on the same snapshot
+        trial = self.active & (self.dist >= 3) & (rng.random((n, cap)) < env.lane_change_prob)
+        cand = np.flatnonzero(trial)
+        first = np.where(rng.random(cand.size) < 0.5, -1, 1)
+        if cand.size:
+            flat, world, group, order = self._sorted_traffic()
+            cand_group = (cand // cap) * env.num_lanes + lane_f[cand]
+
+            both = np.concatenate((cand, cand))
+            accept = mobil_accept(
+                model,
+                group[order], dist_f[flat][order], speed_f[flat][order], desired_f[flat][order],
+                np.concatenate((cand_group, cand_group)), lane_f[both],
+                dist_f[both], speed_f[both], desired_f[both],
+                np.concatenate((first, -first)), env.num_lanes,
+            )
+            accept_first, accept_second = accept[:cand.size], accept[cand.size:]
+            lane_f[cand] += np.where(accept_first, first, np.where(accept_second, -first, 0))
+
+        #accelerations and integration
+        flat, world, group, order = self._sorted_traffic()
+        sorted_flat = flat[order]
+        accel = idm_accel_sorted(
+            model, group[order], dist_f[sorted_flat], speed_f[sorted_flat], desired_f[sorted_flat],
+        )
+        new_speed = np.minimum(np.maximum(speed_f[sorted_flat] + accel, env.min_speed), env.max_speed)
+        speed_f[sorted_flat] = new_speed
+        dist_f[sorted_flat] -= self.ego_speed[world[order]] - new_speed
+
+        #despawn
+        self.active &= (self.dist > -env.despawn_margin) & (self.dist < env.grid_height + env.despawn_margin)
+
+        #spawn: one candidate per (world, lane) when the lane has room at the visible top
+        spawn_base = np.minimum(env.grid_height, self.max_range[self.fog])
+        ahead = np.where(self.active & (self.dist >= 0.0), self.dist, 0.0)
+        furthest = np.stack(
+            [np.where(self.lane == lane_id, ahead, 0.0).max(axis=1) for lane_id in range(env.num_lanes)], axis=1,
+        )
+        free_gap = spawn_base[:, None] - furthest
+        spawn = (free_gap >= env.min_spawn_gap) & (rng.random((n, env.num_lanes)) < env.spawn_prob_per_lane)
+
+        new_dist = rng.uniform(spawn_base[:, None], spawn_base[:, None] + env.min_spawn_gap, size=(n, env.num_lanes))
+        new_desired = rng.uniform(env.min_speed + 1, env.max_speed, size=(n, env.num_lanes))
+        new_speed = np.clip(new_desired * rng.uniform(0.6, 0.9, size=(n, env.num_lanes)),
+                            env.min_speed, env.max_speed)
+
+        if spawn.any():
+            needed = self.active.sum(axis=1) + spawn.sum(axis=1)
+            if needed.max() > self.capacity:
+                self._grow(int(needed.max()))
+            for lane_id in range(env.num_lanes):
+                worlds = np.flatnonzero(spawn[:, lane_id])
+                if worlds.size == 0:
+                    continue
+                slots = np.argmin(self.active[worlds], axis=1)
+                self.lane[worlds, slots] = lane_id
+                self.dist[worlds, slots] = new_dist[worlds, lane_id]
+                self.speed[worlds, slots] = new_speed[worlds, lane_id]
+                self.desired_speed[worlds, slots] = new_desired[worlds, lane_id]
+                self.active[worlds, slots] = True
+
+    def _get_obs(self, idx=None):
+        #observations for all worlds, or only the worlds in idx (after an auto-reset)
+        env = self.template
+        if idx is None:
+            idx = slice(None)
+        ego_lane = self.ego_lane[idx]
+        fog = self.fog[idx]
+        lane = self.lane[idx]
+        dist = self.dist[idx]
+        active = self.active[idx]
+        n = ego_lane.shape[0]
+
+        max_r = self.max_range[fog]
+        if isinstance(idx, slice):
+            #all worlds: write straight into the batch buffer and the noise scratch
+            obs = self.obs
+            noisy = self._noise
+            self.rng.standard_normal(out=noisy)
+        else:
+            obs = np.empty((n,) + self.observation_space.shape, dtype=np.float32)
+            noisy = self.rng.standard_normal(size=(n, self.template.lidars))
+
+        if env.lidar_mode == "legacy":
+            lidar = np.stack([
+                env.lidar_caster.cast_legacy(
+                    ego_lane[i] + 0.5, lane[i][active[i]].astype(np.float64), dist[i][active[i]], max_r[i],
+                )
+                for i in range(n)
+            ])
+        else:
+            lidar = env.lidar_caster.cast_batch(ego_lane + 0.5, lane.astype(np.float64), dist, active, max_r)
+        #lidar * (1 + noise * scale), clipped to [0, max_r] and normalized, all in place
+        noise_scale = 0.02 * (1 + 0.03 * fog)
+        noisy *= noise_scale[:, None]
+        noisy += 1.0
+        noisy *= lidar
+        np.maximum(noisy, 0.0, out=noisy)
+        np.minimum(noisy, max_r[:, None], out=noisy)
+        self.last_lidar[idx] = noisy
+        np.divide(noisy, max_r[:, None], out=noisy)
+
+        obs[:, :2] = 0.0
+        obs[np.arange(n), ego_lane] = 1.0
+        obs[:, 2] = (self.ego_speed[idx] - env.min_speed) / (env.max_speed - env.min_speed + 1e-8)
+        obs[:, 3] = fog / self.max_fog
+        obs[:, 4:] = noisy
+        if obs is not self.obs:
+            self.obs[idx] = obs
+        return self.obs
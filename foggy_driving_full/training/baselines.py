@@ -0,0 +1,212 @@
+"""Rule-based driver policies built on the simulator's batched IDM / MOBIL kernels.
+
+The ego car is treated as one more vehicle: its acceleration comes from the same
+idm_follow the traffic uses (FoggyDriving._idm_accel / _idm_accelerations) and its
+lane changes from the same mobil_accept (FoggyDriving._mobil_decision). The
+continuous IDM acceleration is mapped to the discrete actions with two thresholds.
+
+observe="state" reads the true traffic of the bound env (FoggyDriving or
+FoggyDrivingVecEnv); observe="lidar" rebuilds the nearest car ahead per lane from
+the observation alone, with its speed estimated from the previous step. The lidar
+only looks ahead, so in that mode MOBIL's safety check cannot see cars beside or
+behind the ego car.
+
+Every policy has an SB3-style predict(obs, deterministic) over a batch of
+observations (or a single one), so it can be passed wherever a trained model is:
+evaluate_batched, generate_dataset, record_episode.
+"""
+
+import numpy as np
+
+from env.dynamics import grouped_search, idm_follow, mobil_accept
+from env.foggy_env import FoggyDriving
+
+#observation layout: 2-lane one-hot, speed, fog, then the normalized lidar
+EGO_FEATURES = 4
+LANE_MARGIN = 0.1
+
+
+class RuleBasedPolicy:
+    """IDM speed control plus optional MOBIL lane changes for the ego car of every world."""
+
+    observe_modes = ("state", "lidar")
+    lane_changes = True
+
+    def __init__(self, env=None, observe="state", accel_threshold=0.3, brake_threshold=0.3):
+        if observe not in self.observe_modes:
+            raise ValueError(f"Invalid observe '{observe}', expected one of {self.observe_modes}")
+        self.observe = observe
+        self.accel_threshold = accel_threshold
+        self.brake_threshold = brake_threshold
+        self.env = None
+        self._prev_seen = None
+        if env is not None:
+            self.bind_env(env)
+        else:
+            #parameters only, a state-observing policy still needs bind_env() before predict()
+            self._configure(FoggyDriving())
+
+    def bind_env(self, env):
+        """Uses `env` (FoggyDriving or FoggyDrivingVecEnv, possibly wrapped) for parameters and true state."""
+        base = env.unwrapped
+        self.env = base
+        self._configure(getattr(base, "template", base))
+
+    def _configure(self, template):
+        self.model = template._driver_model()
+        self.num_lanes = template.num_lanes
+        self.min_speed = float(template.min_speed)
+        self.max_speed = float(template.max_speed)
+        self.max_range = np.array([template.max_range_by_fog[f] for f in template.fog_levels], dtype=np.float64)
+        self.max_fog = max(template.fog_levels)
+        self.beam_dx = template.lidar_caster.dx
+        self.beam_dy = template.lidar_caster.dy
+        self._prev_seen = None
+
+    def predict(self, obs, state=None, episode_start=None, deterministic=True):
+        obs = np.asarray(obs)
+        single = obs.ndim == 1
+        batch = obs.reshape(1, -1) if single else obs
+        view = self._state_view(len(batch)) if self.observe == "state" else self._lidar_view(batch)
+        actions = self._act(*view)
+        return (actions[0] if single else actions), None
+
+    def _state_view(self, n):
+        #ego arrays (n,) and all traffic sorted by (world * num_lanes + lane, dist)
+        env = self.env
+        if env is None:
+            raise RuntimeError("observe='state' needs the env: pass it to the policy or call bind_env()")
+        if hasattr(env, "active"):
+            world, slot = np.nonzero(env.active)
+            lane, dist = env.lane[world, slot], env.dist[world, slot]
+            speed, desired = env.speed[world, slot], env.desired_speed[world, slot]
+            ego_lane, ego_speed, fog = env.ego_lane, env.ego_speed, env.fog
+        else:
+            t = env.traffic
+            world = np.zeros(t.n, dtype=np.int64)
+            lane, dist, speed, desired = t.lane[:t.n], t.dist[:t.n], t.speed[:t.n], t.desired_speed[:t.n]
+            ego_lane, ego_speed, fog = np.array([env.ego_lane]), np.array([env.ego_speed]), np.array([env.fog])
+        if len(ego_lane) != n:
+            raise ValueError(f"policy is bound to an env with {len(ego_lane)} worlds, got {n} observations")
+
+        group = world * self.num_lanes + lane
+        order = np.lexsort((dist, group))
+        traffic = (group[order], lane[order], dist[order], speed[order], desired[order])
+        return np.asarray(ego_lane), np.asarray(ego_speed, dtype=np.float64), np.asarray(fog), traffic
+
+    def _lidar_view(self, obs):
+        #nearest car ahead per lane from the beams that hit something
+        n = len(obs)
+        ego_lane = np.argmax(obs[:, :2], axis=1)
+        ego_speed = self.min_speed + obs[:, 2].astype(np.float64) * (self.max_speed - self.min_speed)
+        fog = np.rint(obs[:, 3] * self.max_fog).astype(np.int64)
+
+        readings = obs[:, EGO_FEATURES:].astype(np.float64)
+        ranges = readings * self.max_range[fog][:, None]
+        #misses read max range times the noise, hits are well below
+        hit = readings < 0.9
+        #side faces of cars in the next lane are hit right on the lane boundary: a hit within
+        #LANE_MARGIN of it (lidar noise moves it ~0.01) belongs to the lane the beam is heading into
+        x = ego_lane[:, None] + 0.5 + ranges * self.beam_dx + LANE_MARGIN * np.sign(self.beam_dx)
+        lane_hit = np.clip(np.floor(x).astype(np.int64), 0, self.num_lanes - 1)
+        seen = np.full((n, self.num_lanes), np.inf)
+        rows = np.broadcast_to(np.arange(n)[:, None], hit.shape)
+        np.minimum.at(seen, (rows[hit], lane_hit[hit]), (ranges * self.beam_dy)[hit])
+
+        #speed from the change of the gap since the last call: d_new = d_old - (ego_speed - speed)
+        speed = np.full(seen.shape, self.min_speed)
+        prev = self._prev_seen
+        if prev is not None and prev.shape == seen.shape:
+            with np.errstate(invalid="ignore"):
+                delta = seen - prev
+            tracked = np.isfinite(delta) & (np.abs(delta) <= self.max_speed)
+            speed = np.where(tracked, np.clip(ego_speed[:, None] + delta, self.min_speed, self.max_speed), speed)
+        self._prev_seen = seen
+
+        world, lane = np.nonzero(np.isfinite(seen))
+        speed = speed[world, lane]
+        #row-major nonzero is already sorted by (world, lane), one car per group
+        traffic = (world * self.num_lanes + lane, lane, seen[world, lane], speed, speed.copy())
+        return ego_lane, ego_speed, fog, traffic
+
+    def _desired_speed(self, fog):
+        return np.full(fog.shape, self.max_speed)
+
+    def _ego_model(self, fog):
+        return self.model
+
+    def _may_change_lane(self, fog):
+        return np.full(fog.shape, self.lane_changes)
+
+    def _act(self, ego_lane, ego_speed, fog, traffic):
+        group, lane, dist, speed, desired = traffic
+        n = len(ego_lane)
+        ego_group = np.arange(n) * self.num_lanes + ego_lane
+        ego_dist = np.zeros(n)
+        v0 = self._desired_speed(fog)
+
+        #IDM behind the first car ahead in the ego lane
+        lead = grouped_search(group, dist, ego_group, ego_dist + 1e-6, "right")
+        has_lead = lead >= 0
+        safe = np.maximum(lead, 0)
+        lead_dist = dist[safe] if dist.size else np.zeros(n)
+        lead_speed = speed[safe] if dist.size else np.zeros(n)
+        accel = idm_follow(self._ego_model(fog), ego_dist, ego_speed, v0, lead_dist, lead_speed, has_lead)
+
+        actions = np.zeros(n, dtype=np.int64)
+        actions[(accel > self.accel_threshold) & (ego_speed < self.max_speed)] = 1
+        actions[(accel < -self.brake_threshold) & (ego_speed > self.min_speed)] = 2
+
+        allowed = self._may_change_lane(fog)
+        if allowed.any():
+            #left is tried first, as one batch with the right change of every world
+            accept = mobil_accept(
+                self.model, group, dist, speed, desired,
+                np.concatenate((ego_group, ego_group)), np.concatenate((ego_lane, ego_lane)),
+                np.concatenate((ego_dist, ego_dist)), np.concatenate((ego_speed, ego_speed)),
+                np.concatenate((v0, v0)), np.repeat([-1, 1], n), self.num_lanes,
+            )
+            left = accept[:n] & allowed
+            right = accept[n:] & allowed & ~left
+            actions[left] = 3
+            actions[right] = 4
+        return actions
+
+
+class IDMFollowPolicy(RuleBasedPolicy):
+    """Stays in its lane and follows the car ahead with IDM."""
+
+    lane_changes = False
+
+
+class MOBILOvertakePolicy(RuleBasedPolicy):
+    """IDM following plus MOBIL lane changes whenever the other lane is better enough and safe."""
+
+    lane_changes = True
+
+
+class FogAwarePolicy(RuleBasedPolicy):
+    """Conservative variant: desired speed scales with the fog's visibility, the time headway
+    grows by `fog_headway` per fog level and lanes are only changed below `max_change_fog`."""
+
+    lane_changes = True
+
+    def __init__(self, env=None, observe="state", accel_threshold=0.3, brake_threshold=0.1, fog_headway=0.5,
+                 max_change_fog=1):
+        self.fog_headway = fog_headway
+        self.max_change_fog = max_change_fog
+        super().__init__(env, observe, accel_threshold, brake_threshold)
+
+    def _desired_speed(self, fog):
+        visibility = self.max_range[fog] / self.max_range[0]
+        return self.min_speed + (self.max_speed - self.min_speed) * visibility
+
+    def _ego_model(self, fog):
+        #only the ego's own IDM is made cautious, MOBIL keeps judging the traffic as it drives
+        return self.model._replace(idm_T=self.model.idm_T * (1.0 + self.fog_headway * fog))
+
+    def _may_change_lane(self, fog):
+        return fog < self.max_change_fog
+
+
+baselines = {"idm": IDMFollowPolicy, "mobil": MOBILOvertakePolicy, "fog_aware": FogAwarePolicy}
@@ -0,0 +1,372 @@
+import json
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import warnings
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+
+class ProfileCallback(BaseCallback):
+    """Logs FoggyDriving step-phase timings (envs built with profile=True) after every rollout.
+
+    Profiles of all training envs are summed and the difference to the previous
+    rollout is written as profile/<phase>_us (mean microseconds per env step) and
+    profile/<phase>_share (fraction of step time) to the TensorBoard logger.
+    """
+
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self._prev = None
+
+    def _on_step(self):
+        return True
+
+    def _totals(self):
+        profiles = [p for p in self.training_env.env_method("get_profile") if p]
+        if not profiles:
+            return None
+        totals = {
+            "steps": sum(p["steps"] for p in profiles),
+            "step_time": sum(p["step_time"] for p in profiles),
+        }
+        for phase in profiles[0]["phases"]:
+            totals[phase] = sum(p["phases"][phase]["time"] for p in profiles)
+        return totals
+
+    def _on_rollout_end(self):
+        totals = self._totals()
+        if totals is None:
+            return
+        prev = self._prev or dict.fromkeys(totals, 0)
+        self._prev = totals
+
+        steps = totals["steps"] - prev["steps"]
+        step_time = totals["step_time"] - prev["step_time"]
+        if steps <= 0 or step_time <= 0:
+            return
+
+        self.logger.record("profile/step_us", 1e6 * step_time / steps)
+        for phase in totals:
+            if phase in ("steps", "step_time"):
+                continue
+            dt = totals[phase] - prev[phase]
+            self.logger.record(f"profile/{phase}_us", 1e6 * dt / steps)
+            self.logger.record(f"profile/{phase}_share", dt / step_time)
+
+
+class DashboardCallback(BaseCallback):
+    """Keeps a live training-curve snapshot (PNG + JSON) up to date while training runs.
+
+    Episode returns are taken from info["episode"] (Monitor / VecMonitor) as they
+    arrive. Memory stays O(window + max_points) however many episodes are run: a
+    ring of the last `window` returns gives the moving average, and a reservoir
+    sample of `max_points` (timestep, return, moving average) points stands in for
+    the full curve. Every `write_freq` timesteps and at the end of training the
+    snapshot is rewritten atomically to `<path>.png` / `<path>.json`. With an
+    EvalCallback passed in, its evaluation results are plotted as well.
+    """
+
+    def __init__(self, path, window=100, max_points=1000, write_freq=10_000, eval_callback=None, seed=None,
+                 verbose=0):
+        super().__init__(verbose)
+        self.path = path
+        self.window = window
+        self.max_points = max_points
+        self.write_freq = write_freq
+        self.eval_callback = eval_callback
+        self._rng = np.random.default_rng(seed)
+
+        self._recent = np.zeros(window)
+        self._recent_sum = 0.0
+        self._points = np.zeros((max_points, 3))
+        self.episodes = 0
+        self.best = None
+        self._last_write = 0
+
+    def moving_average(self):
+        n = min(self.episodes, self.window)
+        return self._recent_sum / n if n else float("nan")
+
+    def _record(self, episode_return):
+        slot = self.episodes % self.window
+        self._recent_sum += episode_return - self._recent[slot]
+        self._recent[slot] = episode_return
+        self.episodes += 1
+        if self.best is None or episode_return > self.best[1]:
+            self.best = (self.num_timesteps, episode_return)
+
+        #reservoir sampling (algorithm R): every episode is kept with equal probability
+        point = (self.num_timesteps, episode_return, self.moving_average())
+        if self.episodes <= self.max_points:
+            self._points[self.episodes - 1] = point
+        else:
+            j = self._rng.integers(0, self.episodes)
+            if j < self.max_points:
+                self._points[j] = point
+
+    def _on_step(self):
+        for info in self.locals.get("infos", ()):
+            episode = info.get("episode")
+            if episode is not None:
+                self._record(float(episode["r"]))
+        if self.num_timesteps - self._last_write >= self.write_freq:
+            self.write()
+        return True
+
+    def _on_training_end(self):
+        self.write()
+
+    def snapshot(self):
+        """The dashboard state as a JSON-serializable dict, curve points sorted by timestep."""
+        points = self._points[:min(self.episodes, self.max_points)]
+        points = points[np.argsort(points[:, 0], kind="stable")]
+        data = {
+            "timesteps": int(self.num_timesteps),
+            "episodes": self.episodes,
+            "window": self.window,
+            "moving_average": self.moving_average(),
+            "best": None if self.best is None else {"timestep": int(self.best[0]), "return": self.best[1]},
+            "points": {"timestep": points[:, 0].tolist(), "return": points[:, 1].tolist(),
+                       "moving_average": points[:, 2].tolist()},
+        }
+        ev = self.eval_callback
+        if ev is not None and getattr(ev, "evaluations_timesteps", None):
+            results = np.asarray(ev.evaluations_results)
+            data["eval"] = {
+                "timestep": [int(t) for t in ev.evaluations_timesteps],
+                "mean": results.mean(axis=1).tolist(),
+                "std": results.std(axis=1).tolist(),
+            }
+        return data
+
+    def write(self):
+        self._last_write = self.num_timesteps
+        data = self.snapshot()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        #tmp file + rename so a watcher never reads a half-written snapshot
+        with open(self.path + ".json.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+
+        fig = self._plot(data)
+        with open(self.path + ".png.tmp", "wb") as f:
+            fig.savefig(f, format="png", dpi=100)
+        os.replace(self.path + ".png.tmp", self.path + ".png")
+
+    def _plot(self, data):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        evals = data.get("eval")
+        fig = Figure(figsize=(8, 7 if evals else 4))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(2 if evals else 1, 1, 1)
+
+        points = data["points"]
+        ax.plot(points["timestep"], points["return"], alpha=0.2, linewidth=0.8, label="Episode return (sampled)")
+        ax.plot(points["timestep"], points["moving_average"], linewidth=2.0,
+                label=f"Moving avg (window={data['window']})")
+        if data["best"] is not None:
+            ax.scatter(data["best"]["timestep"], data["best"]["return"], color="red", s=40, zorder=5,
+                       label=f"Best: {data['best']['return']:.1f}")
+        ax.set_xlabel("Timesteps")
+        ax.set_ylabel("Episode return")
+        ax.set_title(f"Training return, {data['episodes']} episodes, {data['timesteps']} timesteps")
+        ax.grid(True, alpha=0.3)
+        ax.legend(loc="best")
+
+        if evals:
+            ax = fig.add_subplot(2, 1, 2)
+            mean = np.array(evals["mean"])
+            std = np.array(evals["std"])
+            ax.plot(evals["timestep"], mean, label="Evaluation mean return")
+            ax.fill_between(evals["timestep"], mean - std, mean + std, alpha=0.2)
+            ax.set_xlabel("Timesteps")
+            ax.set_ylabel("Return")
+            ax.grid(True, alpha=0.3)
+            ax.legend(loc="best")
+
+        fig.tight_layout()
+        return fig
+
+
+def _async_eval_worker(tasks, results, algorithm, n_eval_episodes, n_envs, seed, deterministic):
+    #evaluation process: load each snapshot and evaluate it on a batched env, until None
+    import torch
+    from .evaluation import evaluate_batched
+    from .trainer import FoggyDrivingTrainer
+
+    torch.set_num_threads(1)
+    model_class = FoggyDrivingTrainer.algorithms[algorithm]
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        timestep, path = task
+        try:
+            model = model_class.load(path, device="cpu")
+            result = evaluate_batched(
+                model, episodes=n_eval_episodes, n_envs=n_envs, seed=seed, deterministic=deterministic,
+            )
+            results.put((timestep, path, result["return"].tolist(), result["length"].tolist(), None))
+        except Exception as exc:
+            results.put((timestep, path, None, None, repr(exc)))
+
+
+class AsyncEvalCallback(BaseCallback):
+    """EvalCallback replacement that evaluates in a separate process while training goes on.
+
+    Every `eval_freq` calls the current model is saved as a snapshot and handed to
+    an evaluation process, which plays `n_eval_episodes` on a FoggyDrivingVecEnv
+    (n_envs worlds, batched predict). Results are collected without blocking on
+    later steps and written like EvalCallback does: `evaluations.npz` (timesteps,
+    results, ep_lengths) in `log_path`, the best snapshot copied to
+    `best_model_save_path/best_model.zip`, eval/mean_reward and eval/mean_ep_length
+    logged at the evaluated timestep. A snapshot is skipped while the previous one
+    is still being evaluated. With a fixed `seed`, every evaluation plays the same
+    episodes. Training end waits for the last evaluation; if the evaluation process
+    dies, its pending snapshots are dropped with a warning.
+    """
+
+    #seconds between liveness checks of the evaluation process while waiting on it
+    poll_seconds = 1.0
+
+    def __init__(self, algorithm, eval_freq=10_000, n_eval_episodes=10, n_envs=None, log_path=None,
+                 best_model_save_path=None, deterministic=True, seed=None, start_method=None, verbose=1):
+        super().__init__(verbose)
+        self.algorithm = algorithm
+        self.eval_freq = eval_freq
+        self.n_eval_episodes = n_eval_episodes
+        self.n_envs = n_envs or n_eval_episodes
+        self.log_path = log_path
+        self.best_model_save_path = best_model_save_path
+        self.deterministic = deterministic
+        self.seed = seed
+        self.start_method = start_method
+
+        self.evaluations_timesteps = []
+        self.evaluations_results = []
+        self.evaluations_length = []
+        self.best_mean_reward = -np.inf
+        self.last_mean_reward = -np.inf
+        self._pending = 0
+        self._process = None
+
+    def _init_callback(self):
+        if self.log_path is not None:
+            os.makedirs(self.log_path, exist_ok=True)
+        if self.best_model_save_path is not None:
+            os.makedirs(self.best_model_save_path, exist_ok=True)
+        self._snapshot_dir = os.path.join(self.log_path or ".", "async_eval")
+        os.makedirs(self._snapshot_dir, exist_ok=True)
+
+        start_method = self.start_method
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._process = ctx.Process(
+            target=_async_eval_worker,
+            args=(self._tasks, self._results, self.algorithm, self.n_eval_episodes, self.n_envs, self.seed,
+                  self.deterministic),
+            daemon=True,
+        )
+        self._process.start()
+
+    def _on_step(self):
+        self._collect()
+        if self.eval_freq > 0 and self.n_calls % self.eval_freq == 0:
+            if self._pending:
+                if self.verbose >= 1:
+                    print(f"Async eval still running, skipping the snapshot at {self.num_timesteps}")
+            else:
+                path = os.path.join(self._snapshot_dir, f"snapshot_{self.num_timesteps}.zip")
+                self.model.save(path)
+                self._tasks.put((self.num_timesteps, path))
+                self._pending += 1
+        return True
+
+    def _collect(self, block=False):
+        while self._pending:
+            try:
+                #polled, so a worker killed mid-evaluation (OOM, segfault) cannot hang training
+                item = self._results.get(timeout=self.poll_seconds) if block else self._results.get(block=False)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    self._drop_pending()
+                    return
+                if block:
+                    continue
+                return
+            self._pending -= 1
+            self._record(*item)
+
+    def _drop_pending(self):
+        warnings.warn(
+            f"Async eval process exited with code {self._process.exitcode}, "
+            f"dropping {self._pending} pending snapshot(s)"
+        )
+        self._pending = 0
+        for name in os.listdir(self._snapshot_dir):
+            if name.startswith("snapshot_"):
+                os.remove(os.path.join(self._snapshot_dir, name))
+
+    def _record(self, timestep, path, returns, lengths, error):
+        if error is not None:
+            print(f"Async eval of the snapshot at {timestep} failed: {error}")
+            os.remove(path)
+            return
+
+        self.evaluations_timesteps.append(timestep)
+        self.evaluations_results.append(returns)
+        self.evaluations_length.append(lengths)
+        if self.log_path is not None:
+            np.savez(
+                os.path.join(self.log_path, "evaluations"),
+                timesteps=self.evaluations_timesteps,
+                results=self.evaluations_results,
+                ep_lengths=self.evaluations_length,
+            )
+
+        mean_reward, std_reward = float(np.mean(returns)), float(np.std(returns))
+        mean_ep_length = float(np.mean(lengths))
+        self.last_mean_reward = mean_reward
+        if self.verbose >= 1:
+            print(f"Eval num_timesteps={timestep}, episode_reward={mean_reward:.2f} +/- {std_reward:.2f}")
+            print(f"Episode length: {mean_ep_length:.2f} +/- {np.std(lengths):.2f}")
+        self.logger.record("eval/mean_reward", mean_reward)
+        self.logger.record("eval/mean_ep_length", mean_ep_length)
+        self.logger.dump(timestep)
+
+        if mean_reward > self.best_mean_reward:
+            if self.verbose >= 1:
+                print("New best mean reward!")
+            self.best_mean_reward = mean_reward
+            if self.best_model_save_path is not None:
+                shutil.move(path, os.path.join(self.best_model_save_path, "best_model.zip"))
+                return
+        os.remove(path)
+
+    def _on_training_end(self):
+        #the last snapshot's evaluation still lands in evaluations.npz
+        self._collect(block=True)
+        self.close()
+
+    def close(self):
+        if self._process is not None:
+            if self._process.is_alive():
+                self._tasks.put(None)
+                self._process.join(timeout=self.poll_seconds * 10)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+            #nothing reads the task queue any more, do not wait for it to flush at exit
+            self._tasks.cancel_join_thread()
+            self._process = None
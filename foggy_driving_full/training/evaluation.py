@@ -0,0 +1,68 @@
+import numpy as np
+
+from env.vec_env import FoggyDrivingVecEnv
+
+
+#two-sided 95% normal quantile for the confidence intervals
+Z_95 = 1.959964
+
+
+def summarize(values):
+    """mean, std (ddof=1), 95% CI half-width and count of a 1-D sample."""
+    values = np.asarray(values, dtype=np.float64)
+    n = values.size
+    mean = float(values.mean()) if n else float("nan")
+    std = float(values.std(ddof=1)) if n > 1 else 0.0
+    return {"mean": mean, "std": std, "ci95": float(Z_95 * std / np.sqrt(n)) if n else float("nan"), "n": n}
+
+
+def evaluate_batched(model, episodes=50, n_envs=64, seed=None, deterministic=True, env=None):
+    """Runs `episodes` episodes of `model` on a FoggyDrivingVecEnv, one batched predict per step.
+
+    Every slot plays a fixed number of episodes (episodes split evenly over the
+    n_envs slots) so short episodes are not over-represented; slots that met their
+    quota keep stepping but are masked out. Returns per-episode arrays "return",
+    "length", "collision" and "distance", and their summarize() stats under "stats".
+    A passed-in `env` is left open for the caller.
+    """
+    n_envs = max(1, min(n_envs, episodes))
+    #a caller's env stays open, only the one built here is closed
+    owns_env = env is None
+    if owns_env:
+        env = FoggyDrivingVecEnv(num_envs=n_envs, seed=seed)
+    elif env.num_envs != n_envs:
+        raise ValueError(f"env has {env.num_envs} worlds, expected {n_envs}")
+    if hasattr(model, "bind_env"):
+        #rule-based policies (training/baselines.py) may read the true state of the worlds
+        model.bind_env(env)
+
+    quota = np.full(n_envs, episodes // n_envs)
+    quota[: episodes % n_envs] += 1
+    done_count = np.zeros(n_envs, dtype=np.int64)
+
+    returns = np.zeros(episodes)
+    lengths = np.zeros(episodes, dtype=np.int64)
+    collisions = np.zeros(episodes, dtype=bool)
+    distances = np.zeros(episodes)
+    #row of the next finished episode of each slot in the output arrays
+    offset = np.concatenate(([0], np.cumsum(quota)[:-1]))
+
+    obs = env.reset()
+    while np.any(done_count < quota):
+        actions, _ = model.predict(obs, deterministic=deterministic)
+        obs, _, dones, infos = env.step(actions)
+
+        for i in np.flatnonzero(dones & (done_count < quota)).tolist():
+            info = infos[i]
+            row = offset[i] + done_count[i]
+            returns[row] = info["episode"]["r"]
+            lengths[row] = info["episode"]["l"]
+            collisions[row] = info["collision"]
+            distances[row] = info["distance"]
+            done_count[i] += 1
+
+    if owns_env:
+        env.close()
+    result = {"return": returns, "length": lengths, "collision": collisions, "distance": distances}
+    result["stats"] = {key: summarize(values) for key, values in result.items()}
+    return result
@@ -0,0 +1,107 @@
+import io
+import os
+
+import numpy as np
+
+
+#Monitor columns kept by the loader: episode return, length and wall time
+COLUMNS = ("r", "l", "t")
+
+#parsed logs of this process, keyed by path -> ((size, mtime_ns), columns)
+_memo = {}
+
+
+def cache_path(path):
+    """Binary cache next to a monitor log; hidden and .npz, so monitor_*.monitor.csv globs skip it."""
+    head, name = os.path.split(path)
+    return os.path.join(head, f".{name}.cache.npz")
+
+
+def _empty():
+    return {"r": np.empty(0), "l": np.empty(0, dtype=np.int64), "t": np.empty(0)}
+
+
+def _parse(data, names):
+    #rows of complete lines only, numpy's C parser on the requested columns
+    if not data.strip():
+        return _empty()
+    usecols = [names.index(c) for c in COLUMNS]
+    table = np.loadtxt(io.BytesIO(data), delimiter=",", usecols=usecols, ndmin=2, dtype=np.float64)
+    return {"r": table[:, 0], "l": table[:, 1].astype(np.int64), "t": table[:, 2]}
+
+
+def _read_cache(path):
+    try:
+        with np.load(cache_path(path)) as cache:
+            return {key: cache[key] for key in cache.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_cache(path, columns, size, mtime, offset, header):
+    target = cache_path(path)
+    tmp = target + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(
+                f, size=size, mtime=mtime, offset=offset,
+                header=np.frombuffer(header, dtype=np.uint8), **columns,
+            )
+        os.replace(tmp, target)
+    except OSError:
+        #read-only log directories just go without a cache
+        pass
+
+
+def load_monitor(path, use_cache=True):
+    """Columns r, l, t of one SB3 monitor csv as numpy arrays.
+
+    The parsed columns are cached in cache_path(path) together with the file size,
+    mtime and the byte offset parsed so far. An unchanged file is served from the
+    cache; a file that only grew (training still running) has just its new rows
+    parsed and appended. A rewritten file (different header) is parsed again.
+    A trailing partially written line is left for the next call.
+    """
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    memo = _memo.get(path)
+    if use_cache and memo is not None and memo[0] == key:
+        return memo[1]
+
+    cache = _read_cache(path) if use_cache else None
+    if cache is not None and (int(cache["size"]), int(cache["mtime"])) == key:
+        columns = {c: cache[c] for c in COLUMNS}
+        _memo[path] = (key, columns)
+        return columns
+
+    with open(path, "rb") as f:
+        header = f.readline()
+        names = f.readline().decode().strip().split(",")
+        body = f.tell()
+        columns = _empty()
+        if (
+            cache is not None
+            and cache["header"].tobytes() == header
+            and body <= int(cache["offset"]) <= stat.st_size
+        ):
+            columns = {c: cache[c] for c in COLUMNS}
+            body = int(cache["offset"])
+        f.seek(body)
+        data = f.read(stat.st_size - body)
+
+    end = data.rfind(b"\n") + 1
+    new = _parse(data[:end], names)
+    columns = {c: np.concatenate([columns[c], new[c]]) for c in COLUMNS}
+
+    if use_cache:
+        _write_cache(path, columns, stat.st_size, stat.st_mtime_ns, body + end, header)
+        _memo[path] = (key, columns)
+    return columns
+
+
+def load_monitors(paths, use_cache=True):
+    """load_monitor over several files, columns concatenated in the given order."""
+    loaded = [load_monitor(p, use_cache) for p in paths]
+    if not loaded:
+        return _empty()
+    return {c: np.concatenate([columns[c] for columns in loaded]) for c in COLUMNS}
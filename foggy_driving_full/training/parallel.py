@@ -0,0 +1,285 @@
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+
+
+def _step_env(env, action):
+    obs, reward, terminated, truncated, info = env.step(action)
+    done = terminated or truncated
+    info["TimeLimit.truncated"] = truncated and not terminated
+    terminal_obs = None
+    reset_info = {}
+    if done:
+        #copy: with a bound obs buffer reset() overwrites obs in place
+        terminal_obs = np.array(obs)
+        obs, reset_info = env.reset()
+    return obs, reward, done, info, terminal_obs, reset_info
+
+
+def _attach(name, shape, dtype):
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _bind_obs(env, row):
+    try:
+        bind = env.get_wrapper_attr("bind_obs_buffer")
+    except AttributeError:
+        return False
+    bind(row)
+    return True
+
+
+def _worker(remote, parent_remote, env_fns_wrapper, start):
+    parent_remote.close()
+    envs = [fn() for fn in env_fns_wrapper.var]
+    n = len(envs)
+    local = slice(start, start + n)
+
+    #shared buffers, only set in shared-memory mode
+    handles = []
+    buffers = None
+    bound = [False] * n
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                actions = buffers["actions"][local] if buffers is not None else data
+                results = [_step_env(env, action) for env, action in zip(envs, actions)]
+                if buffers is None:
+                    remote.send(results)
+                    continue
+                infos = []
+                for k, (obs, reward, done, info, terminal_obs, reset_info) in enumerate(results):
+                    if not bound[k]:
+                        buffers["obs"][start + k] = obs
+                    buffers["rewards"][start + k] = reward
+                    buffers["dones"][start + k] = done
+                    if terminal_obs is not None:
+                        buffers["terminal_obs"][start + k] = terminal_obs
+                    infos.append((info, terminal_obs is not None, reset_info))
+                remote.send(infos)
+            elif cmd == "reset":
+                out = []
+                for k, (env, (seed, options)) in enumerate(zip(envs, data)):
+                    maybe_options = {"options": options} if options else {}
+                    obs, reset_info = env.reset(seed=seed, **maybe_options)
+                    if buffers is not None:
+                        if not bound[k]:
+                            buffers["obs"][start + k] = obs
+                        obs = None
+                    out.append((obs, reset_info))
+                remote.send(out)
+            elif cmd == "attach":
+                buffers = {}
+                for key, (name, shape, dtype) in data.items():
+                    shm, array = _attach(name, shape, dtype)
+                    handles.append(shm)
+                    buffers[key] = array
+                #envs that support it write observations straight into their shared row
+                bound = [_bind_obs(env, buffers["obs"][start + k]) for k, env in enumerate(envs)]
+                remote.send(True)
+            elif cmd == "get_spaces":
+                remote.send((envs[0].observation_space, envs[0].action_space))
+            elif cmd == "render":
+                remote.send([envs[k].render() for k in data])
+            elif cmd == "env_method":
+                k_list, name, args, kwargs = data
+                remote.send([envs[k].get_wrapper_attr(name)(*args, **kwargs) for k in k_list])
+            elif cmd == "get_attr":
+                k_list, name = data
+                remote.send([envs[k].get_wrapper_attr(name) for k in k_list])
+            elif cmd == "set_attr":
+                k_list, name, value = data
+                #on the unwrapped env, where the simulator reads its parameters
+                for k in k_list:
+                    setattr(envs[k].unwrapped, name, value)
+                remote.send(None)
+            elif cmd == "is_wrapped":
+                k_list, wrapper_class = data
+                remote.send([is_wrapped(envs[k], wrapper_class) for k in k_list])
+            elif cmd == "close":
+                for env in envs:
+                    env.close()
+                buffers = None
+                for shm in handles:
+                    shm.close()
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except (EOFError, KeyboardInterrupt):
+            break
+
+
+class MultiprocessVecEnv(VecEnv):
+    """Runs envs in worker processes, several envs per worker.
+
+    With shared_memory=True the workers write observations, rewards, dones and
+    terminal observations straight into shared numpy buffers and read actions from
+    one, so only the small info dicts go through the pipes. With shared_memory=False
+    results are pickled back like SB3's SubprocVecEnv.
+    """
+
+    def __init__(self, env_fns, envs_per_worker=1, shared_memory=True, start_method=None):
+        if len(env_fns) % envs_per_worker != 0:
+            raise ValueError(
+                f"{len(env_fns)} envs cannot be split evenly over workers of {envs_per_worker} envs"
+            )
+        self.waiting = False
+        self.closed = False
+        self.envs_per_worker = envs_per_worker
+        self.shared_memory = shared_memory
+        n_envs = len(env_fns)
+        n_workers = n_envs // envs_per_worker
+
+        if start_method is None:
+            #same default as SB3: fork is not thread safe
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_workers)])
+        self.processes = []
+        for w, (work_remote, remote) in enumerate(zip(self.work_remotes, self.remotes)):
+            start = w * envs_per_worker
+            fns = CloudpickleWrapper(env_fns[start:start + envs_per_worker])
+            process = ctx.Process(target=_worker, args=(work_remote, remote, fns, start), daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+
+        super().__init__(n_envs, observation_space, action_space)
+
+        self._shm = []
+        self._buffers = None
+        if shared_memory:
+            specs = {
+                "obs": ((n_envs,) + observation_space.shape, observation_space.dtype),
+                "terminal_obs": ((n_envs,) + observation_space.shape, observation_space.dtype),
+                "rewards": ((n_envs,), np.float32),
+                "dones": ((n_envs,), np.bool_),
+                "actions": ((n_envs,) + action_space.shape, action_space.dtype),
+            }
+            self._buffers = {}
+            names = {}
+            for key, (shape, dtype) in specs.items():
+                dtype = np.dtype(dtype)
+                size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+                shm = SharedMemory(create=True, size=size)
+                self._shm.append(shm)
+                self._buffers[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                names[key] = (shm.name, shape, dtype)
+            for remote in self.remotes:
+                remote.send(("attach", names))
+            for remote in self.remotes:
+                remote.recv()
+
+    def _local(self, indices):
+        #group env indices by worker: {worker: [local index, ...]}
+        per_worker = {}
+        for i in self._get_indices(indices):
+            per_worker.setdefault(i // self.envs_per_worker, []).append(i % self.envs_per_worker)
+        return per_worker
+
+    def step_async(self, actions):
+        if self._buffers is not None:
+            self._buffers["actions"][:] = np.asarray(actions).reshape(self._buffers["actions"].shape)
+            for remote in self.remotes:
+                remote.send(("step", None))
+        else:
+            k = self.envs_per_worker
+            for w, remote in enumerate(self.remotes):
+                remote.send(("step", actions[w * k:(w + 1) * k]))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [r for remote in self.remotes for r in remote.recv()]
+        self.waiting = False
+
+        if self._buffers is None:
+            obs, rews, dones, infos, terminal_obs, self.reset_infos = zip(*results)
+            infos = list(infos)
+            for info, term in zip(infos, terminal_obs):
+                if term is not None:
+                    info["terminal_observation"] = term
+            return np.stack(obs), np.array(rews, dtype=np.float32), np.array(dones), infos
+
+        infos = []
+        reset_infos = []
+        for i, (info, has_terminal, reset_info) in enumerate(results):
+            if has_terminal:
+                info["terminal_observation"] = self._buffers["terminal_obs"][i].copy()
+            infos.append(info)
+            reset_infos.append(reset_info)
+        self.reset_infos = reset_infos
+        b = self._buffers
+        return b["obs"].copy(), b["rewards"].copy(), b["dones"].copy(), infos
+
+    def reset(self):
+        k = self.envs_per_worker
+        for w, remote in enumerate(self.remotes):
+            args = [(self._seeds[i], self._options[i]) for i in range(w * k, (w + 1) * k)]
+            remote.send(("reset", args))
+        results = [r for remote in self.remotes for r in remote.recv()]
+        obs, self.reset_infos = zip(*results)
+        self.reset_infos = list(self.reset_infos)
+        self._reset_seeds()
+        self._reset_options()
+        if self._buffers is not None:
+            return self._buffers["obs"].copy()
+        return np.stack(obs)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self._buffers = None
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def get_images(self):
+        if self.render_mode != "rgb_array":
+            return [None for _ in range(self.num_envs)]
+        return self._call_workers("render", None, lambda ks: ks)
+
+    def _call_workers(self, cmd, indices, make_data):
+        indices = list(self._get_indices(indices))
+        per_worker = self._local(indices)
+        for w, k_list in per_worker.items():
+            self.remotes[w].send((cmd, make_data(k_list)))
+        #every worker answers for its envs in request order, merged back into the order of indices
+        answers = {w: iter(self.remotes[w].recv()) for w in per_worker}
+        return [next(answers[i // self.envs_per_worker]) for i in indices]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call_workers("get_attr", indices, lambda ks: (ks, attr_name))
+
+    def set_attr(self, attr_name, value, indices=None):
+        per_worker = self._local(indices)
+        for w, k_list in per_worker.items():
+            self.remotes[w].send(("set_attr", (k_list, attr_name, value)))
+        for w in per_worker:
+            self.remotes[w].recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call_workers(
+            "env_method", indices, lambda ks: (ks, method_name, method_args, method_kwargs)
+        )
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._call_workers("is_wrapped", indices, lambda ks: (ks, wrapper_class))
@@ -0,0 +1,215 @@
+"""Multi-algorithm, multi-seed hyperparameter sweeps.
+
+A sweep config is a JSON file:
+
+    {
+        "algorithms": ["PPO", "DQN"],
+        "seeds": [0, 1, 2],
+        "timesteps": 200000,
+        "grid": {"learning_rate": [0.0003, 0.001]},
+        "hyperparams": {"DQN": {"buffer_size": 50000}},
+        "trainer": {"vec_env": "batched", "n_workers": 4},
+        "eval_episodes": 200,
+        "eval_envs": 64,
+        "tensorboard": true
+    }
+
+Every algorithm x grid point x seed is one trial. "grid" values are crossed,
+"hyperparams" are fixed per-algorithm overrides, "trainer" is passed to
+FoggyDrivingTrainer. Each trial trains and evaluates in its own directory
+<out_dir>/<trial>/ (train_logs, eval_logs, best_model, tb, model.zip) and writes
+result.json when it finishes; rerunning the sweep skips finished trials and
+restarts unfinished ones. All results end up in <out_dir>/results.csv, one row
+per algorithm and grid point aggregated over seeds.
+"""
+
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from .trainer import FoggyDrivingTrainer
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    if not config.get("algorithms"):
+        raise ValueError(f"{path}: 'algorithms' must list at least one of PPO, A2C, DQN")
+    return config
+
+
+def _format_value(value):
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def expand_trials(config):
+    """One dict per algorithm x grid point x seed, with a unique directory-safe name."""
+    grid = config.get("grid", {})
+    keys = sorted(grid)
+    trials = []
+    for algorithm in config["algorithms"]:
+        for values in itertools.product(*(grid[k] for k in keys)):
+            point = dict(zip(keys, values))
+            for seed in config.get("seeds", [0]):
+                parts = [algorithm] + [f"{k}={_format_value(v)}" for k, v in point.items()] + [f"seed={seed}"]
+                trials.append({
+                    "name": "_".join(parts),
+                    "algorithm": algorithm,
+                    "seed": seed,
+                    "grid": point,
+                    "hyperparams": {**config.get("hyperparams", {}).get(algorithm, {}), **point},
+                })
+    return trials
+
+
+def _result_path(out_dir, trial):
+    return os.path.join(out_dir, trial["name"], "result.json")
+
+
+def _init_worker(cpu_sets, threads):
+    #pin this worker to its own CPUs and cap torch's intra-op threads
+    cpus = cpu_sets.get()
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+
+
+def run_trial(trial, config, out_dir):
+    """Trains and evaluates one trial in a fresh directory, writes and returns its result."""
+    trial_dir = os.path.join(out_dir, trial["name"])
+    #leftovers of an interrupted run are discarded, the trial restarts from scratch
+    shutil.rmtree(trial_dir, ignore_errors=True)
+    os.makedirs(trial_dir)
+    with open(os.path.join(trial_dir, "trial.json"), "w") as f:
+        json.dump(trial, f, indent=2)
+
+    trainer = FoggyDrivingTrainer(
+        model_type=trial["algorithm"],
+        train_logs=os.path.join(trial_dir, "train_logs"),
+        eval_logs=os.path.join(trial_dir, "eval_logs"),
+        best_model=os.path.join(trial_dir, "best_model"),
+        tb_log_dir=os.path.join(trial_dir, "tb") if config.get("tensorboard", True) else None,
+        model_path=os.path.join(trial_dir, "model"),
+        seed=trial["seed"],
+        hyperparams=trial["hyperparams"],
+        verbose=0,
+        **config.get("trainer", {}),
+    )
+
+    start = time.perf_counter()
+    trainer.train(total_timesteps=config.get("timesteps", 100_000))
+    train_time = time.perf_counter() - start
+    evaluation = trainer.evaluate(
+        episodes=config.get("eval_episodes", 100), n_envs=config.get("eval_envs", 64), seed=trial["seed"],
+    )
+
+    result = {**trial, "train_time": train_time, "stats": evaluation["stats"]}
+    #written last and atomically: its presence marks the trial as finished
+    path = _result_path(out_dir, trial)
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return result
+
+
+def _cpu_sets(workers):
+    #split the CPUs this process may use into one disjoint set per worker (shared if too few)
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if not cpus:
+        return [None] * workers
+    if len(cpus) < workers:
+        return [{cpus[i % len(cpus)]} for i in range(workers)]
+    return [set(chunk.tolist()) for chunk in np.array_split(np.array(cpus), workers)]
+
+
+def aggregate(results):
+    """results.csv rows: one per algorithm and grid point, metrics averaged over seeds."""
+    groups = {}
+    for result in results:
+        key = (result["algorithm"], json.dumps(result["grid"], sort_keys=True))
+        groups.setdefault(key, []).append(result)
+
+    rows = []
+    for (algorithm, grid), group in sorted(groups.items()):
+        returns = np.array([r["stats"]["return"]["mean"] for r in group])
+        rows.append({
+            "algorithm": algorithm,
+            "grid": grid,
+            "seeds": len(group),
+            "return_mean": returns.mean(),
+            "return_std_over_seeds": returns.std(ddof=1) if len(group) > 1 else 0.0,
+            "return_ci95_mean": np.mean([r["stats"]["return"]["ci95"] for r in group]),
+            "length_mean": np.mean([r["stats"]["length"]["mean"] for r in group]),
+            "collision_rate": np.mean([r["stats"]["collision"]["mean"] for r in group]),
+            "distance_mean": np.mean([r["stats"]["distance"]["mean"] for r in group]),
+            "train_time_mean": np.mean([r["train_time"] for r in group]),
+        })
+    return rows
+
+
+def write_table(rows, path):
+    if not rows:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: f"{v:.4f}" if isinstance(v, float) else v for k, v in row.items()})
+
+
+def run_sweep(config, out_dir, workers=None, threads=1, start_method=None):
+    """Runs every unfinished trial of `config` in a process pool and writes results.csv."""
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "sweep.json"), "w") as f:
+        json.dump(config, f, indent=2)
+
+    trials = expand_trials(config)
+    pending = [t for t in trials if not os.path.isfile(_result_path(out_dir, t))]
+    print(f"Sweep : {len(trials)} trials, {len(trials) - len(pending)} already finished")
+
+    if pending:
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+        cpu_sets = ctx.Queue()
+        for cpus in _cpu_sets(workers):
+            cpu_sets.put(cpus)
+
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(cpu_sets, threads)) as pool:
+            futures = {pool.submit(run_trial, t, config, out_dir): t for t in pending}
+            for future in futures:
+                trial = futures[future]
+                try:
+                    result = future.result()
+                    ret = result["stats"]["return"]
+                    print(f"  done   {trial['name']} : return {ret['mean']:.2f} +/- {ret['ci95']:.2f}")
+                except Exception as exc:
+                    #a failed trial stays unfinished and is retried by the next run
+                    print(f"  FAILED {trial['name']} : {exc!r}")
+
+    results = []
+    for trial in trials:
+        path = _result_path(out_dir, trial)
+        if os.path.isfile(path):
+            with open(path) as f:
+                results.append(json.load(f))
+
+    rows = aggregate(results)
+    table = os.path.join(out_dir, "results.csv")
+    write_table(rows, table)
+    print(f"\n{'algorithm':<6} {'grid':<40} {'seeds':>5} {'return':>10} {'+/- seeds':>10} {'collision':>9}")
+    for row in rows:
+        print(f"{row['algorithm']:<6} {row['grid']:<40} {row['seeds']:>5} {row['return_mean']:>10.2f} "
+              f"{row['return_std_over_seeds']:>10.2f} {row['collision_rate']:>9.2f}")
+    print(f"\nResults : {table} ({len(results)}/{len(trials)} trials finished)")
+    return rows
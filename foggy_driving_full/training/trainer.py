@@ -1,25 +1,76 @@
 
 
 
+from env.episode_log import EpisodeRecorder
 from env.foggy_env import FoggyDriving
+from env.vec_env import FoggyDrivingVecEnv
 
 import os
 import glob
+import warnings
 import numpy as np
-import matplotlib.pyplot as plt
-import torch
-import imageio
 
 from stable_baselines3 import PPO,A2C,DQN
 from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.vec_env import DummyVecEnv
+from stable_baselines3.common.vec_env import DummyVecEnv, VecMonitor
 from stable_baselines3.common.callbacks import EvalCallback
-from stable_baselines3.common.env_checker import check_env
+
+from .callbacks import AsyncEvalCallback, DashboardCallback, ProfileCallback
+from .evaluation import evaluate_batched
+from .monitor_logs import load_monitors
+from .offline_data import warm_start_replay_buffer
+from .parallel import MultiprocessVecEnv
 
 
 class FoggyDrivingTrainer:
+
+    #dummy = in-process loop, subproc = worker processes with pickled results,
+    #shm = worker processes writing into shared memory, batched = FoggyDrivingVecEnv
+    vec_env_backends = ("dummy", "subproc", "shm", "batched")
+
+    algorithms = {"PPO": PPO, "A2C": A2C, "DQN": DQN}
+
+    #per-algorithm hyperparameters, individual values can be overridden with hyperparams=
+    default_hyperparams = {
+        "PPO": dict(
+            learning_rate=3e-4,
+            n_steps=2048,
+            batch_size=512,
+            clip_range=0.1,
+            gae_lambda=0.92,
+            ent_coef=0.005,
+            n_epochs=10,
+            gamma=0.99,
+            vf_coef=0.5,
+        ),
+        "A2C": dict(
+            learning_rate=7e-4,
+            n_steps=128,
+            gamma=0.995,
+            ent_coef=0.01,
+            gae_lambda=0.95,
+            vf_coef=0.5,
+            max_grad_norm=0.5,
+        ),
+        "DQN": dict(
+            learning_rate=1e-3,
+            buffer_size=100_000,
+            learning_starts=1_000,
+            batch_size=64,
+            train_freq=4,
+            target_update_interval=500,
+            gamma=0.99,
+            exploration_fraction=0.1,
+            exploration_initial_eps=1.0,
+            exploration_final_eps=0.05,
+            max_grad_norm=10,
+        ),
+    }
+
     def __init__( self, model_type="PPO", train_logs= "./train_logs", eval_logs= "./eval_logs",
         best_model= "./best_model", tb_log_dir= "./tb_foggy_grid", model_path= "FoggyDrivingModel",
+        vec_env="dummy", n_workers=8, envs_per_worker=1, profile=False, seed=None, hyperparams=None, verbose=1,
+        dashboard=False, async_eval=False, episode_log=None, warm_start=None,
     ):
 
         if model_path is None:
@@ -31,6 +82,33 @@ class FoggyDrivingTrainer:
         self.tb_log_dir = tb_log_dir
         self.model_path = model_path
 
+        if vec_env not in self.vec_env_backends:
+            raise ValueError(f"Invalid vec_env '{vec_env}', expected one of {self.vec_env_backends}")
+        if n_workers < 1 or envs_per_worker < 1:
+            raise ValueError("n_workers and envs_per_worker must be >= 1")
+        self.vec_env = vec_env
+        self.n_workers = n_workers
+        self.envs_per_worker = envs_per_worker
+        #phase timings come from FoggyDriving's profiler, the batched env steps all worlds at once
+        if profile and vec_env == "batched":
+            raise ValueError("profile times FoggyDriving envs, it is not available with vec_env='batched'")
+        self.profile = profile
+
+        if model_type not in self.algorithms:
+            raise ValueError("Invalid model type.")
+        self.seed = seed
+        self.hyperparams = dict(hyperparams or {})
+        self.verbose = verbose
+        self.dashboard = dashboard
+        self.async_eval = async_eval
+        #every training / in-process eval episode is appended to episode logs under this directory
+        if episode_log is not None and vec_env == "batched":
+            raise ValueError("episode_log records FoggyDriving envs, it is not available with vec_env='batched'")
+        self.episode_log = episode_log
+        #offline dataset (training/offline_data.py) preloaded into the DQN replay buffer
+        if warm_start is not None and model_type != "DQN":
+            raise ValueError("warm_start fills a replay buffer, it is only available for DQN")
+        self.warm_start = warm_start
 
         os.makedirs(self.train_logs, exist_ok=True)
         os.makedirs(self.eval_logs, exist_ok=True)
@@ -40,98 +118,119 @@ class FoggyDrivingTrainer:
         os.makedirs(log_dir, exist_ok=True)
 
         def _make():
-            env = FoggyDriving()
+            env = FoggyDriving(profile=self.profile)
+            if self.episode_log is not None:
+                env = EpisodeRecorder(env, os.path.join(self.episode_log, "train", f"env_{rank}"))
             return Monitor(env, filename=os.path.join(log_dir, f"monitor_{rank}.monitor.csv"))
 
         return _make
 
-
-    def train(self, total_timesteps = 1_000_000):
-
-        env_fns = [self.make_env(i, log_dir=self.train_logs) for i in range(8)]
-        env = DummyVecEnv(env_fns)
-        eval_env = Monitor(FoggyDriving(),filename=os.path.join(self.eval_logs, "eval_monitor.monitor.csv"))
-
-        eval_callback = EvalCallback(
-            eval_env,
-            best_model_save_path=self.best_model,
-            log_path=self.eval_logs,
-            eval_freq=20_000,
-            n_eval_episodes=10,
-            deterministic=True,
-            render=False,
-            verbose=1,
+    def make_vec_env(self, log_dir: str = "./train_logs"):
+        #n_workers * envs_per_worker training envs on the configured backend
+        n_envs = self.n_workers * self.envs_per_worker
+
+        if self.vec_env == "batched":
+            env = FoggyDrivingVecEnv(num_envs=n_envs, seed=self.seed)
+            #the vec env already reports Monitor-style stats, VecMonitor only adds the csv log
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                return VecMonitor(env, filename=os.path.join(log_dir, "monitor_batched.monitor.csv"))
+
+        env_fns = [self.make_env(i, log_dir=log_dir) for i in range(n_envs)]
+        if self.vec_env == "dummy":
+            return DummyVecEnv(env_fns)
+        return MultiprocessVecEnv(
+            env_fns,
+            envs_per_worker=self.envs_per_worker,
+            shared_memory=self.vec_env == "shm",
         )
 
-        model = None
-        if self.model_type == "PPO":
-
-            model = PPO(
-                "MlpPolicy",
-                env,
-                learning_rate = 3e-4,
-                n_steps = 2048,
-                batch_size = 512,
-                clip_range = 0.1,
-                gae_lambda = 0.92,
-                ent_coef = 0.005,
-                n_epochs=10,
-                gamma=0.99,
-                vf_coef=0.5,
-                tensorboard_log=self.tb_log_dir,
-                verbose=1
-            )
 
-        elif self.model_type == "A2C":
-            model = A2C(
-                "MlpPolicy",
-                env,
-                learning_rate=7e-4,
-                n_steps=128,
-                gamma=0.995,
-                ent_coef=0.01,
-                gae_lambda=0.95,
-                vf_coef=0.5,
-                max_grad_norm=0.5,
-                tensorboard_log=self.tb_log_dir,
-                verbose=1
-            )
+    def train(self, total_timesteps = 1_000_000):
 
-        elif self.model_type == "DQN":
-            model = DQN(
-                "MlpPolicy",
-                env,
-                learning_rate=1e-3,
-                buffer_size=100_000,
-                learning_starts=1_000,
-                batch_size=64,
-                train_freq=4,
-                target_update_interval=500,
-                gamma=0.99,
-                exploration_fraction=0.1,
-                exploration_initial_eps=1.0,
-                exploration_final_eps=0.05,
-                max_grad_norm=10,
-                tensorboard_log=self.tb_log_dir,
-                verbose=1
+        env = self.make_vec_env(log_dir=self.train_logs)
+        if self.async_eval:
+            #snapshots evaluated in a separate process on a batched env, training keeps going
+            eval_callback = AsyncEvalCallback(
+                self.model_type,
+                eval_freq=20_000,
+                n_eval_episodes=10,
+                log_path=self.eval_logs,
+                best_model_save_path=self.best_model,
+                deterministic=True,
+                seed=self.seed,
+                verbose=self.verbose,
+            )
+        else:
+            eval_env = FoggyDriving()
+            if self.episode_log is not None:
+                eval_env = EpisodeRecorder(eval_env, os.path.join(self.episode_log, "eval"))
+            eval_env = Monitor(eval_env,filename=os.path.join(self.eval_logs, "eval_monitor.monitor.csv"))
+
+            eval_callback = EvalCallback(
+                eval_env,
+                best_model_save_path=self.best_model,
+                log_path=self.eval_logs,
+                eval_freq=20_000,
+                n_eval_episodes=10,
+                deterministic=True,
+                render=False,
+                verbose=self.verbose,
             )
 
+        params = {**self.default_hyperparams[self.model_type], **self.hyperparams}
+        if self.warm_start is not None and "learning_starts" not in self.hyperparams:
+            #the buffer is already full of experience, gradient steps start right away
+            params["learning_starts"] = 0
+        model = self.algorithms[self.model_type](
+            "MlpPolicy",
+            env,
+            tensorboard_log=self.tb_log_dir,
+            seed=self.seed,
+            verbose=self.verbose,
+            **params,
+        )
 
-        print(f"\nTraining {self.model_type} for {total_timesteps:} timesteps\n")
+        if self.warm_start is not None:
+            loaded = warm_start_replay_buffer(model, self.warm_start)
+            if self.verbose:
+                print(f"Replay buffer warm start : {loaded} transitions from {self.warm_start}")
+
+        callbacks = [eval_callback]
+        if self.profile:
+            #per-phase step timings under profile/ in tensorboard
+            callbacks.append(ProfileCallback())
+        if self.dashboard:
+            #live curve snapshots in train_logs while training runs
+            callbacks.append(DashboardCallback(
+                os.path.join(self.train_logs, f"dashboard_{self.model_type}"),
+                eval_callback=eval_callback,
+                seed=self.seed,
+            ))
+
+        if self.verbose:
+            print(f"\nTraining {self.model_type} for {total_timesteps:} timesteps\n")
         model.learn(
             total_timesteps=total_timesteps,
-            callback=eval_callback,
-            progress_bar=True,
+            callback=callbacks,
+            progress_bar=self.verbose > 0,
         )
 
-        print(f"\nModel saved : {self.model_path}\n")
+        if self.verbose:
+            print(f"\nModel saved : {self.model_path}\n")
         model.save(self.model_path)
         env.close()
+        if not self.async_eval:
+            eval_env.close()
 
-    def evaluate(self, episodes: int = 50):
+    def evaluate(self, episodes: int = 50, n_envs: int = 64, seed=None, model=None):
+        #episodes run n_envs at a time in a FoggyDrivingVecEnv with batched predict calls,
+        #model= evaluates a given policy (e.g. training/baselines.py) instead of the saved model
         env = FoggyDriving()
 
-        if self.model_type == "PPO":
+        if model is not None:
+            pass
+        elif self.model_type == "PPO":
             model = PPO.load(
                 self.model_path,
                 env=env
@@ -147,60 +246,37 @@ class FoggyDrivingTrainer:
             env=env
         )
 
-        total_reward = 0.0
-        total_len = 0
-        collisions = 0
-
-        for _ in range(episodes):
-            obs, info = env.reset()
-            done = False
-            trunc = False
-            ep_reward = 0.0
-            ep_len = 0
-
-            while not (done or trunc):
-                action, _ = model.predict(obs, deterministic=True)
-                obs, r, done, trunc, info = env.step(int(action))
-                ep_reward += r
-                ep_len += 1
-
-            total_reward += ep_reward
-            total_len += ep_len
-            collisions += int(info.get("collision", False))
-
+        result = evaluate_batched(model, episodes=episodes, n_envs=n_envs, seed=seed)
         env.close()
 
-        print(f"\nEvaluation : {episodes} episodes:")
-        print(f"  Avg return     : {total_reward / episodes}")
-        print(f"  Avg ep length  : {total_len / episodes} steps")
-        print(f"  Avg Collision  : {collisions / episodes}\n")
+        if self.verbose:
+            stats = result["stats"]
+            print(f"\nEvaluation : {episodes} episodes ({min(n_envs, episodes)} in parallel, 95% CI):")
+            for label, key in (
+                ("Avg return    ", "return"),
+                ("Avg ep length ", "length"),
+                ("Avg Collision ", "collision"),
+                ("Avg distance  ", "distance"),
+            ):
+                s = stats[key]
+                print(f"  {label} : {s['mean']:.3f} +/- {s['ci95']:.3f}  (std {s['std']:.3f})")
+            print()
+        return result
 
     def load_training_logs(self):
-
+        #parsed columns are cached next to each log and only appended rows are re-read
         files = sorted(glob.glob(os.path.join(self.train_logs, "monitor_*.monitor.csv")))
+        logs = load_monitors(files)
 
-        rewards = []
-        timesteps = []
-
-        for f in files:
-            data = np.genfromtxt(f, skip_header=2, delimiter=",")
-            if data.ndim == 1:
-                data = data.reshape(1, -1)
+        rewards = logs["r"]
+        timesteps = logs["t"]
 
-            rewards.append(data[:, 0])
-            timesteps.append(data[:, 2])
-
-        if not rewards:
-            return np.array([]), np.array([])
-
-        rewards = np.concatenate(rewards)
-        timesteps = np.concatenate(timesteps)
-
-        order = np.argsort(timesteps)
+        order = np.argsort(timesteps, kind="stable")
         return timesteps[order], rewards[order]
 
 
     def plot_training_curve(self, out_path=None):
+        import matplotlib.pyplot as plt
 
         SMOOTH_WINDOW = 100
         MAX_POINTS = 1000
@@ -210,20 +286,13 @@ class FoggyDrivingTrainer:
                 self.train_logs, f"training_curve_{self.model_type}.png"
             )
 
+        #already sorted by time
         timesteps, rewards = self.load_training_logs()
 
-
-        timesteps = np.asarray(timesteps)
-        rewards = np.asarray(rewards)
-
         if timesteps.size == 0:
             print("No training logs found, cannot plot training curve.")
             return
 
-        order = np.argsort(timesteps)
-        timesteps = timesteps[order]
-        rewards = rewards[order]
-
         window = max(1, min(SMOOTH_WINDOW, rewards.size))
         cumsum = np.cumsum(np.insert(rewards, 0, 0.0))
         ma = (cumsum[window:] - cumsum[:-window]) / window
@@ -274,6 +343,7 @@ class FoggyDrivingTrainer:
 
 
     def plot_eval_curve(self, out_path=None):
+        import matplotlib.pyplot as plt
 
         if out_path is None:
             out_path = f"eval_curve_{self.model_type}.png"
@@ -2,22 +2,23 @@
 import argparse
 import os
 
-from stable_baselines3 import PPO, A2C, DQN
-
-from env.foggy_env import FoggyDriving
-from env.renderer import FoggyDrivingRender
-from training.trainer import FoggyDrivingTrainer
 from .describe import describe
 
+#stable_baselines3 / torch, matplotlib and imageio are imported inside the modes that
+#use them, so e.g. --mode describe starts without loading any of them
+
+#FoggyDrivingTrainer.vec_env_backends, repeated here to keep the trainer import lazy
+VEC_ENV_BACKENDS = ("dummy", "subproc", "shm", "batched")
+
 def main():
     parser = argparse.ArgumentParser(description="FoggyDriving CLI")
 
     parser.add_argument(
         "--mode",
         type=str,
-        choices=["describe", "train", "view"],
+        choices=["describe", "train", "view", "eval", "sweep", "dataset"],
         required=True,
-        help="Operation mode: describe, train, or view",
+        help="Operation mode: describe, train, view, eval, sweep, or dataset",
     )
 
     parser.add_argument(
@@ -42,6 +43,168 @@ def main():
         help="Training timesteps (only for --mode train)",
     )
 
+    parser.add_argument(
+        "--vec-env",
+        type=str,
+        default="dummy",
+        choices=list(VEC_ENV_BACKENDS),
+        help="Rollout backend: dummy, subproc, shm (shared memory) or batched (default: dummy)",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of worker processes (--mode train, or rendering with --episodes in --mode view)",
+    )
+
+    parser.add_argument(
+        "--envs-per-worker",
+        type=int,
+        default=1,
+        help="Environments stepped by each worker (only for --mode train)",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log per-phase step timings to TensorBoard (only for --mode train)",
+    )
+
+    parser.add_argument(
+        "--dashboard",
+        action="store_true",
+        help="Keep a live training curve (PNG + JSON) in the train logs while training",
+    )
+
+    parser.add_argument(
+        "--async-eval",
+        action="store_true",
+        help="Evaluate checkpoints in a separate process instead of pausing training",
+    )
+
+    parser.add_argument(
+        "--episode-log",
+        type=str,
+        default=None,
+        help="Record every training and evaluation episode into this directory (only for --mode train)",
+    )
+
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default="offline_data",
+        help="Transition dataset directory written by --mode dataset (default: offline_data)",
+    )
+
+    parser.add_argument(
+        "--dataset-steps",
+        type=int,
+        default=200_000,
+        help="Transitions generated by --mode dataset (default: 200000)",
+    )
+
+    parser.add_argument(
+        "--epsilon",
+        type=float,
+        default=0.1,
+        help="Share of random actions mixed into the dataset policy (default: 0.1)",
+    )
+
+    parser.add_argument(
+        "--warm-start",
+        type=str,
+        default=None,
+        help="Dataset directory preloaded into the DQN replay buffer (only for --mode train --model DQN)",
+    )
+
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        choices=["idm", "mobil", "fog_aware"],
+        help="Use a rule-based driver instead of a trained model (--mode eval / view / dataset)",
+    )
+
+    parser.add_argument(
+        "--observe",
+        type=str,
+        default="state",
+        choices=["state", "lidar"],
+        help="What the --baseline driver sees: true traffic state or the lidar observation (default: state)",
+    )
+
+    parser.add_argument(
+        "--eval-episodes",
+        type=int,
+        default=50,
+        help="Evaluation episodes (--mode train / eval, default: 50)",
+    )
+
+    parser.add_argument(
+        "--eval-envs",
+        type=int,
+        default=64,
+        help="Worlds run in parallel with batched predict calls for evaluation / --mode dataset (default: 64)",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the evaluation / dataset environments (default: random)",
+    )
+
+    parser.add_argument(
+        "--episodes",
+        type=int,
+        default=1,
+        help="Episodes to record in --mode view; more than 1 renders them in parallel into --record-dir",
+    )
+
+    parser.add_argument(
+        "--record-dir",
+        type=str,
+        default="recordings",
+        help="Output directory for --episodes > 1 (default: recordings)",
+    )
+
+    parser.add_argument(
+        "--format",
+        type=str,
+        default="gif",
+        choices=["gif", "mp4"],
+        help="Recording format, mp4 needs imageio-ffmpeg (default: gif)",
+    )
+
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="Sweep config JSON (required for --mode sweep, see training/sweep.py)",
+    )
+
+    parser.add_argument(
+        "--sweep-dir",
+        type=str,
+        default="sweeps",
+        help="Output directory of the sweep, rerunning resumes it (default: sweeps)",
+    )
+
+    parser.add_argument(
+        "--sweep-workers",
+        type=int,
+        default=None,
+        help="Trials trained in parallel (default: number of CPUs)",
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="torch threads per sweep trial (default: 1)",
+    )
+
     args = parser.parse_args()
 
     mode = args.mode
@@ -53,10 +216,26 @@ def main():
         return
 
     if mode == "train":
+        from stable_baselines3 import PPO, A2C, DQN
+        from env.foggy_env import FoggyDriving
+        from env.renderer import FoggyDrivingRender
+        from training.trainer import FoggyDrivingTrainer
+
         print(f"\n--- Training {model_type} ---")
-        trainer = FoggyDrivingTrainer(model_type=model_type, model_path=model_path)
+        trainer = FoggyDrivingTrainer(
+            model_type=model_type,
+            model_path=model_path,
+            vec_env=args.vec_env,
+            n_workers=args.workers,
+            envs_per_worker=args.envs_per_worker,
+            profile=args.profile,
+            dashboard=args.dashboard,
+            async_eval=args.async_eval,
+            episode_log=args.episode_log,
+            warm_start=args.warm_start,
+        )
         trainer.train(total_timesteps=args.timesteps)
-        trainer.evaluate(episodes=50)
+        trainer.evaluate(episodes=args.eval_episodes, n_envs=args.eval_envs, seed=args.seed)
         trainer.plot_training_curve()
         trainer.plot_eval_curve()
 
@@ -72,31 +251,99 @@ def main():
         else:
             raise ValueError("Invalid model type.")
 
-        renderer.record_gif(model, f"FoggyDriving_{model_type}.gif")
+        renderer.record_gif(model, f"FoggyDriving_{model_type}.{args.format}")
+        return
+
+    if mode == "sweep":
+        if args.config is None:
+            parser.error("--mode sweep requires --config")
+        from training.sweep import load_config, run_sweep
+
+        config = load_config(args.config)
+        config.setdefault("timesteps", args.timesteps)
+        run_sweep(config, args.sweep_dir, workers=args.sweep_workers, threads=args.threads)
+        return
+
+    if mode == "dataset":
+        from training.offline_data import generate_dataset
+
+        model = None
+        if args.baseline is not None:
+            from training.baselines import baselines
+
+            model = baselines[args.baseline](observe=args.observe)
+            print(f"\n--- Generating {args.dataset_steps} transitions with the '{args.baseline}' baseline ---")
+        elif os.path.isfile(model_path) or os.path.isfile(model_path + ".zip"):
+            from training.trainer import FoggyDrivingTrainer
+
+            model = FoggyDrivingTrainer.algorithms[model_type].load(model_path)
+            print(f"\n--- Generating {args.dataset_steps} transitions with {model_type} model '{model_path}' ---")
+        else:
+            print(f"\n--- No model at '{model_path}', generating {args.dataset_steps} random transitions ---")
+        meta = generate_dataset(
+            model, args.dataset, steps=args.dataset_steps, n_envs=args.eval_envs, seed=args.seed,
+            epsilon=args.epsilon,
+        )
+        print(f"Dataset : {args.dataset} ({meta['transitions']} transitions, {meta['episodes']} episodes, "
+              f"{meta['seconds']:.1f}s)")
+        return
+
+    if mode == "eval":
+        from training.trainer import FoggyDrivingTrainer
+
+        trainer = FoggyDrivingTrainer(model_type=model_type, model_path=model_path)
+        if args.baseline is not None:
+            from training.baselines import baselines
+
+            print(f"\n--- Evaluating the '{args.baseline}' baseline ({args.observe}) ---")
+            policy = baselines[args.baseline](observe=args.observe)
+            trainer.evaluate(episodes=args.eval_episodes, n_envs=args.eval_envs, seed=args.seed, model=policy)
+            return
+
+        print(f"\n--- Evaluating {model_type} model '{model_path}' ---")
+        trainer.evaluate(episodes=args.eval_episodes, n_envs=args.eval_envs, seed=args.seed)
         return
 
     if mode == "view":
-        print(f"\n--- Generating GIF of episode from trained model '{model_path}' ---")
+        from stable_baselines3 import PPO, A2C, DQN
+        from env.foggy_env import FoggyDriving
+        from env.recording import record_episodes
+        from env.renderer import FoggyDrivingRender
 
         env = FoggyDriving()
         renderer = FoggyDrivingRender(env)
 
-        if os.path.isfile(model_path):
-            model = PPO.load(model_path)
-            print("Loaded existing model.")
+        if args.baseline is not None:
+            from training.baselines import baselines
+
+            print(f"\n--- Generating GIF of episode from the '{args.baseline}' baseline ---")
+            model = baselines[args.baseline](env, observe=args.observe)
+            model_type = args.baseline
         else:
-            print("No saved model found.")
-            return
+            print(f"\n--- Generating GIF of episode from trained model '{model_path}' ---")
 
+            if os.path.isfile(model_path):
+                model = PPO.load(model_path)
+                print("Loaded existing model.")
+            else:
+                print("No saved model found.")
+                return
 
-        if model_type == "PPO":
-            model = PPO.load(model_path, env=env)
-        elif model_type == "A2C":
-            model = A2C.load(model_path, env=env)
-        elif model_type == "DQN":
-            model = DQN.load(model_path, env=env)
-        else:
-            raise ValueError("Invalid model type.")
 
-        renderer.record_gif(model, f"FoggyDriving_{model_type}.gif")
+            if model_type == "PPO":
+                model = PPO.load(model_path, env=env)
+            elif model_type == "A2C":
+                model = A2C.load(model_path, env=env)
+            elif model_type == "DQN":
+                model = DQN.load(model_path, env=env)
+            else:
+                raise ValueError("Invalid model type.")
+
+        if args.episodes > 1:
+            record_episodes(
+                env, model, args.record_dir, episodes=args.episodes, workers=args.workers, fmt=args.format,
+            )
+            return
+
+        renderer.record_gif(model, f"FoggyDriving_{model_type}.{args.format}")
         return
@@ -17,7 +17,7 @@ Raw state variables maintained by the environment:
   • ego_lane ∈ {0,1}
   • ego_speed ∈ [min_speed, max_speed]
   • fog ∈ {0 … max_fog_levels}
-  • cars: list of dynamic objects, each with:
+  • traffic: columnar store of dynamic objects (one array per field):
         lane, dist, speed, desired_speed
   • step_count
   • distance travelled